@@ -12,6 +12,15 @@ python manage.py create_superuser
 
 python manage.py collectstatic --noinput
 
+if [ "$SERVER_MODE" = "asgi" ]; then
+    echo "Starting ASGI server (uvicorn)..."
+    exec python -m uvicorn project.asgi:application \
+        --host 0.0.0.0 \
+        --port 8000 \
+        --workers "${WEB_CONCURRENCY:-3}" \
+        --proxy-headers
+fi
+
 exec python -m gunicorn project.wsgi:application \
     --bind 0.0.0.0:8000 \
-    --workers 3
+    --workers "${WEB_CONCURRENCY:-3}"
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from music.models import Album, Artist, SharedSong, Song
+from music.models import Album, Artist, ProcessingJob, SharedSong, Song
 
 # Register your models here.
 
@@ -22,7 +22,7 @@ class SongAdmin(admin.ModelAdmin):
     list_display = ("title", "artist", "album", "duration", "song_uuid", "uploaded_by")
     search_fields = ("title", "artist__name", "album__title")
     list_filter = ("artist", "album", "uploaded_by", "mime_type")
-    readonly_fields = ("song_uuid", "size", "mime_type", "uploaded_by")
+    readonly_fields = ("song_uuid", "size", "mime_type", "uploaded_by", "content_hash")
 
 
 class SharedSongAdmin(admin.ModelAdmin):
@@ -37,7 +37,21 @@ class SharedSongAdmin(admin.ModelAdmin):
     readonly_fields = ("shared_uuid", "shared_by", "shared_at")
 
 
+class ProcessingJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "original_name",
+        "status",
+        "attempts",
+        "created_by",
+        "job_uuid",
+        "created_at",
+    )
+    list_filter = ("status", "created_at")
+    readonly_fields = ("job_uuid", "song", "created_at", "updated_at")
+
+
 admin.site.register(Artist, ArtistAdmin)
 admin.site.register(Album, AlbumAdmin)
 admin.site.register(Song, SongAdmin)
 admin.site.register(SharedSong, SharedSongAdmin)
+admin.site.register(ProcessingJob, ProcessingJobAdmin)
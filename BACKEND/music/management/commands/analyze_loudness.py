@@ -0,0 +1,125 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from music.models import Song
+from music.services.loudness_service import (
+    LOUDNESS_FIELDS,
+    analyze_loudness,
+    apply_loudness,
+)
+from music.services.storage_service import ffmpeg_source
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Measure EBU R128 loudness and ReplayGain of stored songs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Only analyze songs uploaded by this email",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of ffmpeg analyses running at the same time",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Re-analyze songs that already have loudness values",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of songs updated per query",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.LOUDNESS_ANALYSIS_ENABLED:
+            raise CommandError("LOUDNESS_ANALYSIS_ENABLED is off")
+
+        songs = Song.objects.filter(is_upload_complete=True).only(
+            "id", "file", "content_hash", *LOUDNESS_FIELDS
+        )
+        if not options["force"]:
+            songs = songs.filter(loudness_integrated__isnull=True)
+
+        if options["user"]:
+            user = User.objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+            songs = songs.filter(uploaded_by=user)
+
+        # Identical audio is stored once, analyze it once
+        groups = {}
+        for song in songs.order_by("id").iterator(chunk_size=2000):
+            groups.setdefault(song.content_hash or song.file.name, []).append(song)
+
+        workers = max(options["workers"], 1)
+        batch_size = max(options["batch_size"], 1)
+        self.stdout.write(
+            f"{sum(map(len, groups.values()))} song(s), {len(groups)} distinct"
+            f" audio file(s) to analyze with {workers} worker(s)"
+        )
+
+        analyzed = failed = 0
+        changed = []
+        started = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            running = {}
+            queue = iter(groups.values())
+
+            while True:
+                # Bounded in-flight window, never queue the whole library
+                for group in queue:
+                    future = executor.submit(
+                        analyze_loudness, ffmpeg_source(group[0].file.name)
+                    )
+                    running[future] = group
+                    if len(running) >= workers * 2:
+                        break
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group = running.pop(future)
+                    loudness = future.result()
+                    if loudness is None:
+                        failed += 1
+                        self.stderr.write(f"{group[0].file.name}: analysis failed")
+                        continue
+
+                    analyzed += 1
+                    for song in group:
+                        apply_loudness(song, loudness)
+                    changed += group
+
+                if len(changed) >= batch_size:
+                    Song.objects.bulk_update(changed, LOUDNESS_FIELDS)
+                    changed = []
+                    self.stdout.write(
+                        f"[{analyzed + failed}/{len(groups)}]"
+                        f" {(analyzed + failed) / (time.monotonic() - started):.2f}"
+                        " files/s"
+                    )
+
+        Song.objects.bulk_update(changed, LOUDNESS_FIELDS)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Analyzed {analyzed} audio file(s), {failed} failed"
+                f" in {time.monotonic() - started:.1f}s"
+            )
+        )
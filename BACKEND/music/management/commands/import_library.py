@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from music.services.blob_service import blob_path
+from music.services.catalog_service import ArtistAlbumResolver
+from music.services.thumbnail_service import (
+    existing_thumbnail,
+    render_thumbnail,
+    save_thumbnail,
+    thumbnail_key,
+)
+from music.services.upload_service import prepare_audio, save_local_file, store_song
+from music.services.waveform_service import render_waveform, waveform_exists
+
+User = get_user_model()
+
+AUDIO_EXTENSIONS = {
+    ".mp3",
+    ".flac",
+    ".m4a",
+    ".mp4",
+    ".aac",
+    ".ogg",
+    ".opus",
+    ".wav",
+    ".aiff",
+    ".wma",
+}
+
+# One manifest per library in the working directory, see --manifest
+MANIFEST_NAME = ".sound_node_import_{key}.json"
+
+
+def prepare_file(source_path, work_dir):
+    """
+    Worker process: copy the file (the library is never modified), probe,
+    strip and hash it, and render the thumbnail and waveform peaks unless
+    they are already stored.
+
+    Returns:
+        (local_path, AudioInfo, content_hash, thumbnail key or None,
+         rendered thumbnail variants or None, waveform bytes or None)
+    """
+    ext = os.path.splitext(source_path)[1]
+    fd, local_path = tempfile.mkstemp(suffix=ext, dir=work_dir)
+    os.close(fd)
+
+    try:
+        shutil.copyfile(source_path, local_path)
+        audio, content_hash = prepare_audio(local_path)
+
+        key = thumbnail = None
+        if audio.album_art:
+            key = thumbnail_key(audio.album_art)
+            if not existing_thumbnail(key):
+                thumbnail = render_thumbnail(audio.album_art)
+
+        waveform = None
+        if settings.WAVEFORM_ENABLED and not waveform_exists(
+            blob_path(content_hash, ext)
+        ):
+            waveform = render_waveform(local_path)
+    except Exception:
+        os.unlink(local_path)
+        raise
+
+    # The raw art is not needed past this point, don't ship it back
+    audio.album_art = None
+
+    return local_path, audio, content_hash, key, thumbnail, waveform
+
+
+class Command(BaseCommand):
+    help = "Import every audio file under a directory for a user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Library root to walk")
+        parser.add_argument(
+            "--user",
+            required=True,
+            help="Email of the user the songs are imported for",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Worker processes for probing, stripping and thumbnails",
+        )
+        parser.add_argument(
+            "--manifest",
+            help=(
+                "Manifest file used to resume (default:"
+                f" ./{MANIFEST_NAME.format(key='<hash of directory>')})"
+            ),
+        )
+        parser.add_argument(
+            "--progress-every",
+            type=int,
+            default=50,
+            help="Print progress every N files",
+        )
+
+    def handle(self, *args, **options):
+        root = os.path.abspath(options["directory"])
+        if not os.path.isdir(root):
+            raise CommandError(f"{root} is not a directory")
+
+        user = User.objects.filter(email=options["user"]).first()
+        if user is None:
+            raise CommandError(f"No user with email {options['user']}")
+
+        # Kept outside the library, which is never written to (and may be
+        # mounted read-only)
+        self.manifest_path = options["manifest"] or os.path.abspath(
+            MANIFEST_NAME.format(key=hashlib.sha256(root.encode()).hexdigest()[:16])
+        )
+        self.manifest = self.load_manifest()
+
+        pending = []
+        skipped = 0
+        for rel_path, size, mtime in self.walk(root):
+            entry = self.manifest.get(rel_path)
+            if (
+                entry
+                and entry.get("status") == "done"
+                and entry.get("size") == size
+                and entry.get("mtime") == mtime
+            ):
+                skipped += 1
+                continue
+            pending.append((rel_path, size, mtime))
+
+        workers = max(options["workers"], 1)
+        self.stdout.write(
+            f"{len(pending)} file(s) to import, {skipped} already imported,"
+            f" {workers} worker(s)"
+        )
+        if not pending:
+            return
+
+        self.progress_every = max(options["progress_every"], 1)
+        self.resolver = ArtistAlbumResolver(user)
+        # Thumbnail key -> stored path, for art shared by many tracks
+        self.thumbnails = {}
+        self.imported = self.failed = self.bytes_done = 0
+        self.started = time.monotonic()
+
+        # Workers must not share the parent's database sockets
+        connections.close_all()
+
+        with tempfile.TemporaryDirectory(prefix="sound_node_import_") as work_dir:
+            with ProcessPoolExecutor(
+                max_workers=workers, initializer=django.setup
+            ) as executor:
+                running = {}
+                queue = iter(pending)
+
+                while True:
+                    # Bounded in-flight window keeps temp copies on disk small
+                    for rel_path, size, mtime in queue:
+                        future = executor.submit(
+                            prepare_file, os.path.join(root, rel_path), work_dir
+                        )
+                        running[future] = (rel_path, size, mtime)
+                        if len(running) >= workers * 2:
+                            break
+
+                    if not running:
+                        break
+
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    self.prefetch(done)
+                    for future in done:
+                        self.finish(user, future, *running.pop(future), len(pending))
+
+        self.save_manifest()
+
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {self.imported}, failed {self.failed}, skipped {skipped}"
+                f" in {elapsed:.1f}s"
+                f" ({(self.imported + self.failed) / elapsed:.2f} files/s,"
+                f" {self.bytes_done / elapsed / (1024 * 1024):.2f} MB/s)"
+            )
+        )
+
+    def finish(self, user, future, rel_path, size, mtime, total):
+        """Store a prepared file and create its Song (main process only)."""
+        key = None
+        try:
+            local_path, audio, content_hash, key, thumbnail, waveform = future.result()
+            try:
+                thumbnail_path = self.store_thumbnail(key, thumbnail)
+                song = store_song(
+                    user,
+                    os.path.basename(rel_path),
+                    audio,
+                    content_hash,
+                    local_path,
+                    save_local_file(local_path),
+                    resolver=self.resolver,
+                    waveform=waveform,
+                    thumbnail_path=thumbnail_path,
+                    thumbnail_variants=thumbnail,
+                )
+            finally:
+                os.unlink(local_path)
+
+            if song.thumbnail.name != thumbnail_path:
+                # Released meanwhile and not restored, look it up again
+                self.thumbnails.pop(key, None)
+        except Exception as e:
+            # The thumbnail was released unless another song uses it, look it
+            # up again
+            self.thumbnails.pop(key, None)
+
+            self.failed += 1
+            self.manifest[rel_path] = {"status": "failed", "error": str(e)}
+            self.stderr.write(f"{rel_path}: {e}")
+        else:
+            self.imported += 1
+            self.bytes_done += size
+            self.manifest[rel_path] = {
+                "status": "done",
+                "size": size,
+                "mtime": mtime,
+                "song_uuid": str(song.song_uuid),
+            }
+
+        processed = self.imported + self.failed
+        if processed % self.progress_every == 0 or processed == total:
+            self.save_manifest()
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            self.stdout.write(
+                f"[{processed}/{total}] {processed / elapsed:.2f} files/s,"
+                f" {self.bytes_done / elapsed / (1024 * 1024):.2f} MB/s"
+            )
+
+    def store_thumbnail(self, key, thumbnail):
+        """Stored path of the art `key`, saving the rendered variants once."""
+        if key is None:
+            return None
+
+        if key not in self.thumbnails:
+            if thumbnail:
+                self.thumbnails[key] = save_thumbnail(thumbnail, key)
+            else:
+                self.thumbnails[key] = existing_thumbnail(key)
+
+        return self.thumbnails[key]
+
+    def prefetch(self, futures):
+        """Resolve the artists and albums of finished files in one go."""
+        pairs = []
+        for future in futures:
+            if future.exception() is None:
+                audio = future.result()[1]
+                pairs.append((audio.artist or "Unknown Artist", audio.album))
+
+        if pairs:
+            self.resolver.prefetch(pairs)
+
+    def walk(self, root):
+        """Yield `(relative_path, size, mtime)` of audio files, sorted."""
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                if os.path.splitext(file_name)[1].lower() not in AUDIO_EXTENSIONS:
+                    continue
+
+                path = os.path.join(dir_path, file_name)
+                stat = os.stat(path)
+                yield os.path.relpath(path, root), stat.st_size, int(stat.st_mtime)
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+
+        with open(self.manifest_path) as file:
+            return json.load(file).get("files", {})
+
+    def save_manifest(self):
+        # Write then rename, so an interrupted run never leaves a torn manifest
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"files": self.manifest}, file)
+        os.replace(temp_path, self.manifest_path)
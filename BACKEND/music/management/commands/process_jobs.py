@@ -0,0 +1,71 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from music.services.processing_service import claim_jobs, requeue_stale_jobs, run_job
+from music.services.resumable_upload_service import expire_sessions
+
+
+class Command(BaseCommand):
+    help = "Process queued song uploads (UPLOAD_PROCESSING_MODE=queue) and transcodes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=2,
+            help="Number of jobs processed at the same time",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to wait before polling again when the queue is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no job is due instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = max(options["concurrency"], 1)
+        poll_interval = options["poll_interval"]
+
+        self.stdout.write(f"Processing jobs with concurrency {concurrency}")
+
+        running = set()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                running = {future for future in running if not future.done()}
+
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+                expired = expire_sessions()
+                if expired:
+                    self.stdout.write(f"Deleted {expired} expired upload session(s)")
+
+                jobs = claim_jobs(concurrency - len(running))
+                for job in jobs:
+                    running.add(executor.submit(self.run, job))
+
+                if not jobs:
+                    if options["once"] and not running:
+                        break
+                    time.sleep(poll_interval)
+
+    def run(self, job):
+        try:
+            job = run_job(job)
+            self.stdout.write(
+                f"Job {job.job_uuid} ({job.original_name or job.variant}): {job.status}"
+                f" [attempt {job.attempts}/{job.max_attempts}]"
+            )
+        finally:
+            # Worker threads own their DB connections
+            close_old_connections()
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from music.models import Song
+from music.services.metadata_service import extract_metadata
+from music.services.storage_service import open_for_metadata
+
+User = get_user_model()
+
+UNKNOWN_MIME_TYPE = "application/octet-stream"
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-read duration and MIME type of stored songs from their headers "
+        "(ranged reads on S3, no full downloads)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            help="Only rescan songs uploaded by this email",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of songs updated per query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report changes without saving them",
+        )
+
+    def handle(self, *args, **options):
+        songs = Song.objects.filter(is_upload_complete=True).only(
+            "id", "song_uuid", "file", "duration", "mime_type"
+        )
+
+        if options["user"]:
+            user = User.objects.filter(email=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user with email {options['user']}")
+            songs = songs.filter(uploaded_by=user)
+
+        batch_size = max(options["batch_size"], 1)
+        scanned = failed = bytes_fetched = 0
+        changed = []
+
+        for song in songs.order_by("id").iterator(chunk_size=batch_size):
+            scanned += 1
+
+            try:
+                with open_for_metadata(song.file.name) as file:
+                    metadata = extract_metadata(file)
+                    bytes_fetched += getattr(file, "bytes_fetched", 0)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"{song.song_uuid}: {e}")
+                continue
+
+            # extract_metadata returns defaults for unreadable files
+            if not metadata["duration"]:
+                failed += 1
+                continue
+
+            updated = False
+            if metadata["duration"] != song.duration:
+                song.duration = metadata["duration"]
+                updated = True
+            if song.mime_type == UNKNOWN_MIME_TYPE and (
+                metadata["mime_type"] != UNKNOWN_MIME_TYPE
+            ):
+                song.mime_type = metadata["mime_type"]
+                updated = True
+
+            if updated:
+                changed.append(song)
+
+            if len(changed) >= batch_size:
+                self.save(changed, options["dry_run"])
+                changed = []
+
+        self.save(changed, options["dry_run"])
+
+        summary = f"Scanned {scanned} song(s), {failed} unreadable"
+        if settings.STORAGE_BACKEND == "s3":
+            summary += f", {bytes_fetched / 1024:.1f} KiB fetched from S3"
+        self.stdout.write(summary)
+
+    def save(self, songs, dry_run):
+        if not songs:
+            return
+
+        if dry_run:
+            for song in songs:
+                self.stdout.write(
+                    f"{song.song_uuid}: duration={song.duration}"
+                    f" mime_type={song.mime_type}"
+                )
+            return
+
+        Song.objects.bulk_update(songs, ["duration", "mime_type"])
+        self.stdout.write(f"Updated {len(songs)} song(s)")
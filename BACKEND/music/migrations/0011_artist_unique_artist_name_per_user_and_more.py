@@ -0,0 +1,66 @@
+# Generated by Django 5.2.7 on 2026-10-17 18:40
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def merge_duplicates(apps, schema_editor):
+    """
+    Fold case-insensitive duplicate artists and albums of a user into the
+    oldest row so the unique constraints can be created.
+    """
+    Artist = apps.get_model("music", "Artist")
+    Album = apps.get_model("music", "Album")
+    Song = apps.get_model("music", "Song")
+
+    keep = {}
+    for artist in Artist.objects.order_by("id"):
+        key = (artist.created_by_id, artist.name.lower())
+        if key not in keep:
+            keep[key] = artist.id
+            continue
+
+        Album.objects.filter(artist_id=artist.id).update(artist_id=keep[key])
+        Song.objects.filter(artist_id=artist.id).update(artist_id=keep[key])
+        artist.delete()
+
+    keep = {}
+    for album in Album.objects.order_by("id"):
+        key = (album.created_by_id, album.artist_id, album.title.lower())
+        if key not in keep:
+            keep[key] = album
+            continue
+
+        Song.objects.filter(album_id=album.id).update(album_id=keep[key].id)
+        if album.cover_image and not keep[key].cover_image:
+            keep[key].cover_image = album.cover_image
+            keep[key].save(update_fields=["cover_image"])
+        album.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0010_audioblob"),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="artist",
+            constraint=models.UniqueConstraint(
+                models.F("created_by"),
+                django.db.models.functions.text.Lower("name"),
+                name="unique_artist_name_per_user",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="album",
+            constraint=models.UniqueConstraint(
+                models.F("created_by"),
+                models.F("artist"),
+                django.db.models.functions.text.Lower("title"),
+                name="unique_album_title_per_artist",
+            ),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-17 19:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0011_artist_unique_artist_name_per_user_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="album",
+            index=models.Index(
+                fields=["cover_image"], name="music_album_cover_i_8a0570_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="song",
+            index=models.Index(
+                fields=["thumbnail"], name="music_song_thumbna_6f2ae5_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0012_album_music_album_cover_i_8a0570_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="song",
+            name="loudness_integrated",
+            field=models.FloatField(
+                blank=True, help_text="Integrated loudness in LUFS", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="song",
+            name="loudness_range",
+            field=models.FloatField(
+                blank=True, help_text="Loudness range in LU", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="song",
+            name="loudness_true_peak",
+            field=models.FloatField(
+                blank=True, help_text="True peak in dBTP", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="song",
+            name="replaygain_track_gain",
+            field=models.FloatField(
+                blank=True, help_text="ReplayGain 2.0 track gain in dB", null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="song",
+            name="replaygain_track_peak",
+            field=models.FloatField(
+                blank=True,
+                help_text="Track true peak, linear (1.0 = full scale)",
+                null=True,
+            ),
+        ),
+    ]
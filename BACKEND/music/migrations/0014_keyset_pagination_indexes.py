@@ -0,0 +1,50 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0013_song_loudness"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="album",
+            index=models.Index(
+                fields=["created_by", "created_at", "id"],
+                name="music_album_created_65f290_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="artist",
+            index=models.Index(
+                fields=["created_by", "name", "id"],
+                name="music_artis_created_ed90ca_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="playlistsong",
+            index=models.Index(
+                fields=["playlist", "added_at", "id"],
+                name="music_playl_playlis_ca701e_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sharedsong",
+            index=models.Index(
+                fields=["shared_by", "shared_at", "id"],
+                name="music_share_shared__dfb4c4_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="song",
+            index=models.Index(
+                fields=["uploaded_by", "title", "id"],
+                name="music_song_uploade_af2088_idx",
+            ),
+        ),
+    ]
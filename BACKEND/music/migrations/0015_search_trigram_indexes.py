@@ -0,0 +1,45 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:40
+
+from django.db import migrations
+
+# (index, table, column) searched by search_service, also used by the
+# `icontains` filters of the list views (UPPER(<column>) LIKE UPPER(...))
+TRIGRAM_INDEXES = [
+    ("music_song_title_trgm", "music_song", "title"),
+    ("music_artist_name_trgm", "music_artist", "name"),
+    ("music_album_title_trgm", "music_album", "title"),
+    ("music_playlist_name_trgm", "music_playlist", "name"),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # GIN/pg_trgm only exist on PostgreSQL, SQLite searches by scanning
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON {table}"
+            f" USING gin (UPPER({column}) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    # pg_trgm is kept, other database objects may use it
+    if schema_editor.connection.vendor != "postgresql":
+        return
+
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0014_keyset_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
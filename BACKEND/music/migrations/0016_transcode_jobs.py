@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0015_search_trigram_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="processingjob",
+            name="kind",
+            field=models.CharField(
+                choices=[("upload", "Upload"), ("rendition", "Rendition")],
+                default="upload",
+                max_length=20,
+            ),
+        ),
+        migrations.AddField(
+            model_name="processingjob",
+            name="variant",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AlterField(
+            model_name="processingjob",
+            name="original_name",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name="processingjob",
+            name="temp_path",
+            field=models.CharField(blank=True, max_length=512),
+        ),
+    ]
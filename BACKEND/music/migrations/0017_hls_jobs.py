@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-17 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("music", "0016_transcode_jobs"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="processingjob",
+            name="kind",
+            field=models.CharField(
+                choices=[
+                    ("upload", "Upload"),
+                    ("rendition", "Rendition"),
+                    ("hls", "HLS package"),
+                ],
+                default="upload",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -2,6 +2,7 @@ import uuid
 
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 # Create your models here.
@@ -22,6 +23,13 @@ class Artist(models.Model):
         indexes = [
             models.Index(fields=["name"]),
             models.Index(fields=["created_by"]),
+            # Keyset pagination of a user's artists
+            models.Index(fields=["created_by", "name", "id"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                "created_by", Lower("name"), name="unique_artist_name_per_user"
+            )
         ]
 
 
@@ -44,6 +52,17 @@ class Album(models.Model):
             models.Index(fields=["artist"]),
             models.Index(fields=["title"]),
             models.Index(fields=["created_by"]),
+            models.Index(fields=["cover_image"]),
+            # Keyset pagination of a user's albums
+            models.Index(fields=["created_by", "created_at", "id"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                "created_by",
+                "artist",
+                Lower("title"),
+                name="unique_album_title_per_artist",
+            )
         ]
 
 
@@ -74,6 +93,26 @@ class Song(models.Model):
 
     thumbnail = models.ImageField(upload_to="thumbnails/", null=True, blank=True)
 
+    # SHA-256 of the stored (metadata-stripped) audio, see AudioBlob
+    content_hash = models.CharField(max_length=64, blank=True, default="")
+
+    # EBU R128 loudness, null until analyzed (see loudness_service)
+    loudness_integrated = models.FloatField(
+        null=True, blank=True, help_text="Integrated loudness in LUFS"
+    )
+    loudness_true_peak = models.FloatField(
+        null=True, blank=True, help_text="True peak in dBTP"
+    )
+    loudness_range = models.FloatField(
+        null=True, blank=True, help_text="Loudness range in LU"
+    )
+    replaygain_track_gain = models.FloatField(
+        null=True, blank=True, help_text="ReplayGain 2.0 track gain in dB"
+    )
+    replaygain_track_peak = models.FloatField(
+        null=True, blank=True, help_text="Track true peak, linear (1.0 = full scale)"
+    )
+
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -81,10 +120,32 @@ class Song(models.Model):
         indexes = [
             models.Index(fields=["artist"]),
             models.Index(fields=["album"]),
-            models.Index(fields=["uploaded_by", "is_uploaded_to_cloud", "is_upload_complete"]),
+            models.Index(
+                fields=["uploaded_by", "is_uploaded_to_cloud", "is_upload_complete"]
+            ),
+            models.Index(fields=["content_hash"]),
+            models.Index(fields=["thumbnail"]),
+            # Keyset pagination of a user's library
+            models.Index(fields=["uploaded_by", "title", "id"]),
         ]
 
 
+class AudioBlob(models.Model):
+    """
+    Content-addressed audio file shared by every Song with the same
+    `content_hash`. The file is deleted when the last reference goes away.
+    """
+
+    content_hash = models.CharField(max_length=64, unique=True)
+
+    file = models.FileField(upload_to="songs/")
+    size = models.PositiveBigIntegerField()
+
+    ref_count = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
 class Playlist(models.Model):
     playlist_uuid = models.UUIDField(default=uuid.uuid4, unique=True)
 
@@ -118,6 +179,8 @@ class PlaylistSong(models.Model):
         indexes = [
             models.Index(fields=["playlist", "order"]),
             models.Index(fields=["song"]),
+            # Keyset pagination of a playlist
+            models.Index(fields=["playlist", "added_at", "id"]),
         ]
 
 
@@ -147,6 +210,8 @@ class SharedSong(BaseShared):
         ordering = ["-shared_at"]
         indexes = [
             models.Index(fields=["song", "shared_by"]),
+            # Keyset pagination of a user's shared songs
+            models.Index(fields=["shared_by", "shared_at", "id"]),
         ]
         constraints = [
             models.UniqueConstraint(fields=["song"], name="unique_shared_song")
@@ -166,3 +231,78 @@ class SharedPlaylist(BaseShared):
         constraints = [
             models.UniqueConstraint(fields=["playlist"], name="unique_shared_playlist")
         ]
+
+
+class ProcessingJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        COMPLETED = "completed", "Completed"
+        FAILED = "failed", "Failed"
+
+    class Kind(models.TextChoices):
+        UPLOAD = "upload", "Upload"
+        RENDITION = "rendition", "Rendition"
+        HLS = "hls", "HLS package"
+
+    job_uuid = models.UUIDField(default=uuid.uuid4, unique=True)
+
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    kind = models.CharField(max_length=20, choices=Kind.choices, default=Kind.UPLOAD)
+
+    # Upload jobs: uploaded file waiting in storage under `tmp/`
+    temp_path = models.CharField(max_length=512, blank=True)
+    original_name = models.CharField(max_length=255, blank=True)
+
+    # Rendition and HLS jobs: rendition of `song` to produce or package
+    # (e.g. "aac-128k", "original" for an HLS package of the original)
+    variant = models.CharField(max_length=32, blank=True)
+
+    song = models.ForeignKey(Song, null=True, blank=True, on_delete=models.SET_NULL)
+
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    error = models.TextField(blank=True, default="")
+
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["created_at"]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["created_by"]),
+        ]
+
+
+class UploadSession(models.Model):
+    session_uuid = models.UUIDField(default=uuid.uuid4, unique=True)
+
+    created_by = models.ForeignKey(User, on_delete=models.CASCADE)
+
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+
+    # Bytes received so far, the next chunk must start here
+    offset = models.PositiveBigIntegerField(default=0)
+
+    # SHA-256 (hex) of the whole file, verified after the last chunk
+    checksum = models.CharField(max_length=64)
+
+    is_complete = models.BooleanField(default=False)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_by"]),
+        ]
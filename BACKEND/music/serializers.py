@@ -1,11 +1,79 @@
 from django.conf import settings
 from rest_framework import serializers
 
-from music.models import Album, Artist, Playlist, PlaylistSong, SharedSong, Song
+from music.models import (
+    Album,
+    Artist,
+    Playlist,
+    PlaylistSong,
+    ProcessingJob,
+    SharedSong,
+    Song,
+)
+from music.services.loudness_service import LOUDNESS_FIELDS
+from music.services.thumbnail_service import thumbnail_srcsets
+
+
+def memoized(context, key, compute):
+    """
+    Cache a computed value in the serializer context. Nested and list
+    serializers share the root's context, so a page computes each distinct
+    image URL once, not once per row (songs of an album share a thumbnail).
+    """
+    cache = context.setdefault("memo", {})
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+
+def absolute_url(context, file):
+    request = context.get("request")
+    return memoized(
+        context, ("url", file.name), lambda: request.build_absolute_uri(file.url)
+    )
+
+
+def srcset_map(context, image):
+    """`{format: srcset}` of an image's variants, URLs absolute with a request."""
+    if not image:
+        return {}
+
+    request = context.get("request")
+    return memoized(
+        context,
+        ("srcset", image.name),
+        lambda: thumbnail_srcsets(
+            image, request.build_absolute_uri if request else None
+        ),
+    )
+
+
+class MemoizedImageField(serializers.ImageField):
+    """Absolute image URL, computed once per distinct image (see `memoized`)."""
+
+    def to_representation(self, value):
+        if value and self.context.get("request"):
+            return absolute_url(self.context, value)
+        return super().to_representation(value)
+
+
+class StoredNameFileField(serializers.FileField):
+    """
+    Storage name of the file for API clients, which play songs through the
+    stream endpoints. Skips building a URL per row (presigned on S3).
+    """
+
+    def to_representation(self, value):
+        if value and self.context.get("request"):
+            return value.name
+        return super().to_representation(value)
 
 
 class SongModelSerializer(serializers.ModelSerializer):
+    file = StoredNameFileField()
+    thumbnail = MemoizedImageField(required=False, allow_null=True)
     artist_name = serializers.CharField(source="artist.name")
+    thumbnail_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Song
@@ -20,25 +88,47 @@ class SongModelSerializer(serializers.ModelSerializer):
             "mime_type",
             "uploaded_by",
             "thumbnail",
+            "thumbnail_srcset",
+            "loudness_integrated",
+            "loudness_true_peak",
+            "loudness_range",
+            "replaygain_track_gain",
+            "replaygain_track_peak",
         ]
         read_only_fields = ["song_uuid", "is_uploaded_to_cloud"]
 
+    # Columns read when serializing, see `prepare_queryset`
+    queryset_fields = [
+        "song_uuid",
+        "title",
+        "file",
+        "artist__name",
+        "album",
+        "duration",
+        "size",
+        "mime_type",
+        "uploaded_by",
+        "thumbnail",
+        *LOUDNESS_FIELDS,
+    ]
+
+    @classmethod
+    def prepare_queryset(cls, queryset, prefix="", fields=()):
+        """
+        Join the artist and load only the columns the serializer reads, so a
+        list costs one query whatever its length. `prefix` is the path from
+        the queryset's model to the song (e.g. "song__") and `fields` are
+        that model's own columns to load.
+        """
+        return queryset.select_related(f"{prefix}artist").only(
+            *fields, *(prefix + name for name in cls.queryset_fields)
+        )
+
     def create(self, validated_data):
         return super().create(validated_data)
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        request = self.context.get("request")
-
-        if request:
-            if instance.thumbnail:
-                representation["thumbnail"] = request.build_absolute_uri(
-                    instance.thumbnail.url
-                )
-            if instance.file:
-                representation["file"] = instance.file.name
-
-        return representation
+    def get_thumbnail_srcset(self, obj):
+        return srcset_map(self.context, obj.thumbnail)
 
 
 class PlaylistSongModelSerializer(serializers.ModelSerializer):
@@ -54,6 +144,12 @@ class PlaylistSongModelSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["playlist_song_uuid", "added_at"]
 
+    @classmethod
+    def prepare_queryset(cls, queryset):
+        return SongModelSerializer.prepare_queryset(
+            queryset, "song__", ["playlist_song_uuid", "playlist", "song", "added_at"]
+        )
+
     def create(self, validated_data):
         return super().create(validated_data)
 
@@ -119,10 +215,12 @@ class ArtistSongModelSerializer(serializers.ModelSerializer):
 
     def get_songs(self, obj):
         return SongModelSerializer(
-            Song.objects.filter(
-                artist=obj,
-                is_uploaded_to_cloud=settings.STORAGE_BACKEND == "s3",
-                is_upload_complete=True,
+            SongModelSerializer.prepare_queryset(
+                Song.objects.filter(
+                    artist=obj,
+                    is_uploaded_to_cloud=settings.STORAGE_BACKEND == "s3",
+                    is_upload_complete=True,
+                )
             ),
             many=True,
             context=self.context,
@@ -130,6 +228,9 @@ class ArtistSongModelSerializer(serializers.ModelSerializer):
 
 
 class AlbumModelSerializer(serializers.ModelSerializer):
+    cover_image = MemoizedImageField(read_only=True)
+    cover_image_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = Album
         fields = [
@@ -137,6 +238,7 @@ class AlbumModelSerializer(serializers.ModelSerializer):
             "artist",
             "title",
             "cover_image",
+            "cover_image_srcset",
             "release_year",
             "created_by",
             "created_at",
@@ -154,19 +256,13 @@ class AlbumModelSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return super().create(validated_data)
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        request = self.context.get("request")
-
-        if request and instance.cover_image:
-            representation["cover_image"] = request.build_absolute_uri(
-                instance.cover_image.url
-            )
-
-        return representation
+    def get_cover_image_srcset(self, obj):
+        return srcset_map(self.context, obj.cover_image)
 
 
 class AlbumSongModelSerializer(serializers.ModelSerializer):
+    cover_image = MemoizedImageField(read_only=True)
+    cover_image_srcset = serializers.SerializerMethodField()
     songs = serializers.SerializerMethodField()
 
     class Meta:
@@ -176,6 +272,7 @@ class AlbumSongModelSerializer(serializers.ModelSerializer):
             "artist",
             "title",
             "cover_image",
+            "cover_image_srcset",
             "release_year",
             "created_by",
             "created_at",
@@ -194,23 +291,17 @@ class AlbumSongModelSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         return super().create(validated_data)
 
-    def to_representation(self, instance):
-        representation = super().to_representation(instance)
-        request = self.context.get("request")
-
-        if request and instance.cover_image:
-            representation["cover_image"] = request.build_absolute_uri(
-                instance.cover_image.url
-            )
-
-        return representation
+    def get_cover_image_srcset(self, obj):
+        return srcset_map(self.context, obj.cover_image)
 
     def get_songs(self, obj):
         return SongModelSerializer(
-            Song.objects.filter(
-                album=obj,
-                is_uploaded_to_cloud=settings.STORAGE_BACKEND == "s3",
-                is_upload_complete=True,
+            SongModelSerializer.prepare_queryset(
+                Song.objects.filter(
+                    album=obj,
+                    is_uploaded_to_cloud=settings.STORAGE_BACKEND == "s3",
+                    is_upload_complete=True,
+                )
             ),
             many=True,
             context=self.context,
@@ -230,3 +321,29 @@ class SharedSongModelSerializer(serializers.ModelSerializer):
             "expire_at",
         ]
         read_only_fields = ["shared_uuid", "shared_by", "shared_at", "expire_at"]
+
+    @classmethod
+    def prepare_queryset(cls, queryset):
+        return SongModelSerializer.prepare_queryset(
+            queryset,
+            "song__",
+            ["shared_uuid", "song", "shared_by", "shared_at", "expire_at"],
+        )
+
+
+class ProcessingJobModelSerializer(serializers.ModelSerializer):
+    song = SongModelSerializer(read_only=True)
+
+    class Meta:
+        model = ProcessingJob
+        fields = [
+            "job_uuid",
+            "original_name",
+            "status",
+            "attempts",
+            "max_attempts",
+            "song",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = fields
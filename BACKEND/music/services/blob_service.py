@@ -0,0 +1,126 @@
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from music.models import AudioBlob
+from music.services.hls_service import delete_hls
+from music.services.rendition_service import delete_renditions
+from music.services.storage_service import delete_file
+from music.services.waveform_service import delete_waveform
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_local_file(file_path):
+    """Streaming SHA-256 (hex) of a local file."""
+    hasher = hashlib.sha256()
+
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+def blob_path(content_hash, ext):
+    return f"songs/{content_hash}{ext}"
+
+
+def acquire_blob(content_hash, size, ext, store):
+    """
+    Take a reference on the blob for `content_hash`.
+
+    If the audio is already stored, nothing is written. Otherwise `store(path)`
+    is called to write the bytes and must return the stored path.
+
+    Returns:
+        (blob, created)
+    """
+    if _increment(content_hash):
+        return AudioBlob.objects.get(content_hash=content_hash), False
+
+    with transaction.atomic():
+        # Held until commit: a concurrent release_blob of the same audio has
+        # deleted its files before this stores them again
+        lock_blob(content_hash)
+
+        if _increment(content_hash):
+            # Stored by an identical upload while waiting for the lock
+            return AudioBlob.objects.get(content_hash=content_hash), False
+
+        stored_path = store(blob_path(content_hash, ext))
+
+        try:
+            with transaction.atomic():
+                blob = AudioBlob.objects.create(
+                    content_hash=content_hash,
+                    file=stored_path,
+                    size=size,
+                    ref_count=1,
+                )
+            return blob, True
+        except IntegrityError:
+            pass
+
+    # Lost a race against an identical upload (no lock on SQLite), share its
+    # blob instead
+    _increment(content_hash)
+    blob = AudioBlob.objects.get(content_hash=content_hash)
+    if blob.file.name != stored_path:
+        delete_file(stored_path)
+
+    return blob, False
+
+
+def release_blob(content_hash):
+    """
+    Drop a reference on the blob for `content_hash` and delete the stored
+    audio once nothing references it anymore.
+    """
+    with transaction.atomic():
+        lock_blob(content_hash)
+
+        blob = (
+            AudioBlob.objects.select_for_update()
+            .filter(content_hash=content_hash)
+            .first()
+        )
+        if blob is None:
+            return
+
+        if blob.ref_count > 1:
+            blob.ref_count = F("ref_count") - 1
+            blob.save(update_fields=["ref_count"])
+            return
+
+        blob.delete()
+
+        # Deleted under the lock, an upload of the same audio stores it again
+        # only after this commits
+        delete_file(blob.file)
+        delete_waveform(blob.file.name)
+        delete_renditions(blob.content_hash)
+        delete_hls(blob.content_hash)
+
+
+def lock_blob(content_hash):
+    """
+    Transaction-scoped lock serializing `release_blob` with a new store of
+    the same audio. PostgreSQL only: SQLite (development and tests) runs one
+    writer at a time.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(%s))", [f"blob:{content_hash}"]
+        )
+
+
+def _increment(content_hash):
+    return AudioBlob.objects.filter(content_hash=content_hash).update(
+        ref_count=F("ref_count") + 1
+    )
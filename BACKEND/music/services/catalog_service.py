@@ -0,0 +1,125 @@
+from django.db.models.functions import Lower
+
+from music.models import Album, Artist
+
+
+class ArtistAlbumResolver:
+    """
+    Case-insensitive get-or-create of a user's Artists and Albums.
+
+    Lookups go through the `Lower()` unique indexes, missing rows are bulk
+    inserted with `ignore_conflicts` (a concurrent upload creating the same
+    row is not an error) and every resolved row is cached on the instance.
+    Keep one resolver for a whole batch so each name hits the DB once.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.artists = {}
+        self.albums = {}
+
+    def resolve(self, artist_name, album_title=None):
+        """
+        Returns:
+            (artist, album or None)
+        """
+        self.prefetch([(artist_name, album_title)])
+
+        artist = self.artists[artist_name.lower()]
+        if not album_title:
+            return artist, None
+
+        return artist, self.albums[(artist.pk, album_title.lower())]
+
+    def prefetch(self, pairs):
+        """
+        Resolve many `(artist_name, album_title)` pairs at once: one SELECT
+        (plus one INSERT and SELECT for new rows) for the artists, and the
+        same for the albums.
+        """
+        artist_names = {}
+        for artist_name, _ in pairs:
+            artist_names.setdefault(artist_name.lower(), artist_name)
+
+        self._resolve_artists(artist_names)
+
+        album_titles = {}
+        for artist_name, album_title in pairs:
+            if album_title:
+                artist = self.artists[artist_name.lower()]
+                album_titles.setdefault((artist.pk, album_title.lower()), album_title)
+
+        self._resolve_albums(album_titles)
+
+    def _resolve_artists(self, names):
+        missing = {key: name for key, name in names.items() if key not in self.artists}
+        if not missing:
+            return
+
+        self._cache_artists(missing)
+
+        new = {key: name for key, name in missing.items() if key not in self.artists}
+        if not new:
+            return
+
+        Artist.objects.bulk_create(
+            [Artist(name=name, created_by=self.user) for name in new.values()],
+            ignore_conflicts=True,
+        )
+        self._cache_artists(new)
+
+        for key, name in new.items():
+            if key not in self.artists:
+                # Python and the database disagree on lowercasing this name
+                self.artists[key], _ = Artist.objects.get_or_create(
+                    name__iexact=name,
+                    created_by=self.user,
+                    defaults={"name": name},
+                )
+
+    def _resolve_albums(self, titles):
+        missing = {
+            key: title for key, title in titles.items() if key not in self.albums
+        }
+        if not missing:
+            return
+
+        self._cache_albums(missing)
+
+        new = {key: title for key, title in missing.items() if key not in self.albums}
+        if not new:
+            return
+
+        Album.objects.bulk_create(
+            [
+                Album(artist_id=artist_id, title=title, created_by=self.user)
+                for (artist_id, _), title in new.items()
+            ],
+            ignore_conflicts=True,
+        )
+        self._cache_albums(new)
+
+        for (artist_id, title_key), title in new.items():
+            if (artist_id, title_key) not in self.albums:
+                self.albums[(artist_id, title_key)], _ = Album.objects.get_or_create(
+                    artist_id=artist_id,
+                    title__iexact=title,
+                    created_by=self.user,
+                    defaults={"title": title, "artist_id": artist_id},
+                )
+
+    def _cache_artists(self, names):
+        artists = Artist.objects.annotate(name_lower=Lower("name")).filter(
+            created_by=self.user, name_lower__in=list(names)
+        )
+        for artist in artists:
+            self.artists[artist.name.lower()] = artist
+
+    def _cache_albums(self, titles):
+        albums = Album.objects.annotate(title_lower=Lower("title")).filter(
+            created_by=self.user,
+            artist_id__in={artist_id for artist_id, _ in titles},
+            title_lower__in={title_key for _, title_key in titles},
+        )
+        for album in albums:
+            self.albums[(album.artist_id, album.title.lower())] = album
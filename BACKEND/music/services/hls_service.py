@@ -0,0 +1,140 @@
+import os
+import posixpath
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from music.services.metadata_service import FFMPEG_TIMEOUT
+from music.services.rendition_service import (
+    get_rendition,
+    rendition_key,
+    single_flight,
+    source_bitrate,
+)
+from music.services.storage_service import delete_file, ffmpeg_source
+
+HLS_MIME_TYPE = "application/vnd.apple.mpegurl"
+PLAYLIST_NAME = "index.m3u8"
+
+
+def hls_directory(key, variant):
+    return posixpath.join("hls", key, variant)
+
+
+def hls_variant(rendition=None):
+    return rendition.name if rendition else "original"
+
+
+def hls_playlist_path(song, rendition=None):
+    directory = hls_directory(rendition_key(song), hls_variant(rendition))
+    return posixpath.join(directory, PLAYLIST_NAME)
+
+
+def stored_hls_playlist(song, rendition=None):
+    """Stored path of the HLS playlist, or None if it was not packaged yet."""
+    playlist = hls_playlist_path(song, rendition)
+    return playlist if default_storage.exists(playlist) else None
+
+
+def get_hls_playlist(song, rendition=None):
+    """
+    Stored path of the HLS playlist of `song` (or of one of its AAC
+    renditions), packaging it on first use (can take up to FFMPEG_TIMEOUT,
+    requests use `stored_hls_playlist` and `submit_hls`). Segment URIs in
+    the playlist are relative, so the playlist and its fMP4 segments are
+    served straight from storage under stable, content-addressed URLs.
+
+    Returns None if packaging fails.
+    """
+    variant = hls_variant(rendition)
+    playlist = hls_playlist_path(song, rendition)
+    directory = posixpath.dirname(playlist)
+    if default_storage.exists(playlist):
+        return playlist
+
+    try:
+        with single_flight(playlist):
+            # Another request may have packaged it while we waited
+            if not default_storage.exists(playlist):
+                package_hls(song, rendition, directory)
+    except Exception as e:
+        print(f"Error packaging {variant} HLS: {e}")
+        return None
+
+    return playlist
+
+
+def package_hls(song, rendition, directory):
+    """
+    Segment the audio into fMP4 (AAC) segments plus a VOD playlist and store
+    them under `directory`. An AAC rendition is segmented as-is, the original
+    is encoded to AAC at its own bitrate (capped to the top of the ladder).
+    """
+    source_path = get_rendition(song, rendition) if rendition else None
+    if source_path:
+        codec_args = ["-c:a", "copy"]
+    else:
+        source_path = song.file.name
+        bitrate = min(
+            source_bitrate(song.size, song.duration) or 128,
+            max(settings.RENDITION_BITRATES),
+        )
+        codec_args = ["-c:a", "aac", "-b:a", f"{bitrate}k"]
+
+    with tempfile.TemporaryDirectory(prefix="sound_node_hls_") as temp_dir:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-v",
+                "error",
+                "-i",
+                ffmpeg_source(source_path),
+                "-map",
+                "0:a:0",
+                "-map_metadata",
+                "-1",
+                *codec_args,
+                "-f",
+                "hls",
+                "-hls_time",
+                str(settings.HLS_SEGMENT_SECONDS),
+                "-hls_playlist_type",
+                "vod",
+                "-hls_segment_type",
+                "fmp4",
+                "-hls_fmp4_init_filename",
+                "init.mp4",
+                "-hls_segment_filename",
+                os.path.join(temp_dir, "seg_%05d.m4s"),
+                os.path.join(temp_dir, PLAYLIST_NAME),
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=FFMPEG_TIMEOUT,
+        )
+
+        # Playlist last: once it exists, every segment it lists does too
+        names = sorted(name for name in os.listdir(temp_dir) if name != PLAYLIST_NAME)
+        for name in [*names, PLAYLIST_NAME]:
+            with open(os.path.join(temp_dir, name), "rb") as file:
+                default_storage.save(posixpath.join(directory, name), file)
+
+
+def delete_hls(key):
+    """Delete every HLS package stored under `hls/<key>/`."""
+    root = posixpath.join("hls", key)
+    try:
+        variants, _ = default_storage.listdir(root)
+    except FileNotFoundError:
+        return
+
+    for variant in variants:
+        directory = posixpath.join(root, variant)
+        _, files = default_storage.listdir(directory)
+        # Playlist first, a half-deleted package is never considered complete
+        files.sort(key=lambda name: name != PLAYLIST_NAME)
+        for name in files:
+            delete_file(posixpath.join(directory, name))
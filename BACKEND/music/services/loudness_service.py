@@ -0,0 +1,97 @@
+import re
+import subprocess
+
+from django.conf import settings
+
+from music.services.metadata_service import FFMPEG_TIMEOUT, Loudness
+
+# Song fields written by `apply_loudness`
+LOUDNESS_FIELDS = [
+    "loudness_integrated",
+    "loudness_true_peak",
+    "loudness_range",
+    "replaygain_track_gain",
+    "replaygain_track_peak",
+]
+
+# Values of the ebur128 filter summary printed when ffmpeg exits
+SUMMARY_RE = {
+    "integrated": re.compile(r"\bI:\s*(-?[\d.]+|-inf)\s*LUFS"),
+    "range": re.compile(r"\bLRA:\s*(-?[\d.]+)\s*LU\b"),
+    "true_peak": re.compile(r"\bPeak:\s*(-?[\d.]+|-inf)\s*dBFS"),
+}
+
+
+def analyze_loudness(source):
+    """
+    Measure integrated loudness, true peak and loudness range with ffmpeg's
+    ebur128 filter in one decode pass. `source` is a local path or a URL
+    ffmpeg can read (e.g. a presigned S3 URL).
+
+    Returns a `Loudness`, or None when analysis is disabled or fails.
+    """
+    if not settings.LOUDNESS_ANALYSIS_ENABLED:
+        return None
+
+    try:
+        result = subprocess.run(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-nostats",
+                "-i",
+                source,
+                "-map",
+                "0:a:0",
+                "-af",
+                "ebur128=peak=true:framelog=quiet",
+                "-f",
+                "null",
+                "-",
+            ],
+            capture_output=True,
+            check=True,
+            timeout=FFMPEG_TIMEOUT,
+        )
+        return parse_ebur128_summary(result.stderr.decode(errors="replace"))
+    except Exception as e:
+        print(f"Error analyzing loudness: {e}")
+        return None
+
+
+def parse_ebur128_summary(output):
+    # Only the final summary, not per-frame values
+    _, _, summary = output.rpartition("Summary:")
+
+    values = {}
+    for name, pattern in SUMMARY_RE.items():
+        match = pattern.search(summary)
+        if not match:
+            raise ValueError(f"No {name} in ebur128 summary")
+        values[name] = float(match.group(1))
+
+    # Digital silence measures -inf / -70 LUFS, there is nothing to normalize
+    if values["integrated"] <= -70.0:
+        raise ValueError("Silent audio")
+
+    return Loudness(**values)
+
+
+def apply_loudness(song, loudness):
+    """Copy a `Loudness` (or None, to clear) onto the Song fields."""
+    song.loudness_integrated = loudness.integrated if loudness else None
+    song.loudness_true_peak = loudness.true_peak if loudness else None
+    song.loudness_range = loudness.range if loudness else None
+    song.replaygain_track_gain = loudness.replaygain_track_gain if loudness else None
+    song.replaygain_track_peak = loudness.replaygain_track_peak if loudness else None
+
+
+def replaygain(song):
+    """ReplayGain values of a song for stream responses (None if unanalyzed)."""
+    if song.replaygain_track_gain is None:
+        return None
+
+    return {
+        "track_gain": song.replaygain_track_gain,
+        "track_peak": song.replaygain_track_peak,
+    }
@@ -1,7 +1,9 @@
+import json
 import os
 import shutil
 import subprocess
 import tempfile
+from dataclasses import dataclass
 
 from mutagen import File as MutagenFile
 from mutagen.flac import FLAC
@@ -11,74 +13,256 @@ from mutagen.mp4 import MP4
 from mutagen.oggopus import OggOpus
 from mutagen.oggvorbis import OggVorbis
 
+FFMPEG_TIMEOUT = 300
 
-def strip_metadata(file_path: str):
+# ReplayGain 2.0 reference level
+REPLAYGAIN_REFERENCE_LUFS = -18.0
+
+# ffprobe `format_name` → MIME type
+FORMAT_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "flac": "audio/flac",
+    "ogg": "audio/ogg",
+    "wav": "audio/wav",
+    "aiff": "audio/aiff",
+    "mov,mp4,m4a,3gp,3g2,mj2": "audio/mp4",
+    "matroska,webm": "audio/webm",
+    "aac": "audio/aac",
+}
+
+
+@dataclass
+class Loudness:
+    """EBU R128 loudness of a song."""
+
+    integrated: float  # LUFS
+    true_peak: float  # dBTP
+    range: float  # LU
+
+    @property
+    def replaygain_track_gain(self):
+        """dB to apply to reach the ReplayGain 2.0 reference level."""
+        return round(REPLAYGAIN_REFERENCE_LUFS - self.integrated, 2)
+
+    @property
+    def replaygain_track_peak(self):
+        """True peak as a linear sample value (1.0 = full scale)."""
+        return round(10 ** (self.true_peak / 20), 6)
+
+
+@dataclass
+class AudioInfo:
+    """Everything the upload pipeline needs to know about an audio file."""
+
+    duration: int = 0
+    mime_type: str = "application/octet-stream"
+    codec: str | None = None
+    bit_rate: int | None = None
+    sample_rate: int | None = None
+    channels: int | None = None
+    size: int = 0
+
+    title: str | None = None
+    artist: str | None = None
+    album: str | None = None
+    album_art: bytes | None = None
+
+    loudness: Loudness | None = None
+
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def probe_audio(file_path: str):
+    """
+    Read format, first audio stream, tags and the attached picture stream
+    from a single ffprobe JSON pass.
+
+    Returns:
+        (AudioInfo, cover_stream_index or None)
+    """
+    result = subprocess.run(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-print_format",
+            "json",
+            "-show_format",
+            "-show_streams",
+            file_path,
+        ],
+        capture_output=True,
+        check=True,
+        timeout=FFMPEG_TIMEOUT,
+    )
+    probe = json.loads(result.stdout)
+
+    fmt = probe.get("format", {})
+    streams = probe.get("streams", [])
+    audio = next((st for st in streams if st.get("codec_type") == "audio"), None)
+    if audio is None:
+        raise ValueError("No audio stream")
+
+    cover = next(
+        (
+            st
+            for st in streams
+            if st.get("codec_type") == "video"
+            and st.get("disposition", {}).get("attached_pic")
+        ),
+        None,
+    )
+
+    # Container tags win, stream tags fill the gaps (Ogg keeps them per stream)
+    tags = {k.lower(): v for k, v in audio.get("tags", {}).items()}
+    tags.update({k.lower(): v for k, v in fmt.get("tags", {}).items()})
+
+    info = AudioInfo(
+        duration=_to_int(fmt.get("duration") or audio.get("duration")) or 0,
+        mime_type=FORMAT_MIME_TYPES.get(
+            fmt.get("format_name"), "application/octet-stream"
+        ),
+        codec=audio.get("codec_name"),
+        bit_rate=_to_int(audio.get("bit_rate") or fmt.get("bit_rate")),
+        sample_rate=_to_int(audio.get("sample_rate")),
+        channels=audio.get("channels"),
+        title=tags.get("title") or None,
+        artist=tags.get("artist") or tags.get("album_artist") or None,
+        album=tags.get("album") or None,
+    )
+
+    return info, cover["index"] if cover else None
+
+
+def _ffmpeg_strip(file_path: str, cover_index=None):
     """
-    Remove ALL metadata from an audio file using ffmpeg.
-    Copies audio stream without re-encoding to preserve quality.
-    Supports: MP3, MP4, FLAC, OGG Vorbis, OGG Opus, WAV, etc.
+    Rewrite `file_path` in place with every tag and non-audio stream removed
+    (audio is copied, not re-encoded). When `cover_index` is given the same
+    ffmpeg run also copies that picture stream out to stdout.
+
+    Returns the cover image bytes (or None).
     """
+    _, ext = os.path.splitext(file_path)
+    with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp_file:
+        temp_output = tmp_file.name
+
+    # -map 0:a:0 -vn: keep only the first audio stream
+    # -c:a copy: no re-encode, no quality loss
+    # -map_metadata -1: remove all metadata
+    command = [
+        "ffmpeg",
+        "-v",
+        "error",
+        "-i",
+        file_path,
+        "-map",
+        "0:a:0",
+        "-vn",
+        "-c:a",
+        "copy",
+        "-map_metadata",
+        "-1",
+        "-y",
+        temp_output,
+    ]
+    if cover_index is not None:
+        # Second output: the embedded picture, as-is
+        command += [
+            "-map",
+            f"0:{cover_index}",
+            "-c",
+            "copy",
+            "-frames:v",
+            "1",
+            "-f",
+            "image2pipe",
+            "pipe:1",
+        ]
+
     try:
-        # Create a temporary file with same extension
-        _, ext = os.path.splitext(file_path)
-        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp_file:
-            temp_output = tmp_file.name
+        result = subprocess.run(
+            command,
+            stdout=subprocess.PIPE if cover_index is not None else subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=FFMPEG_TIMEOUT,
+        )
+        # Replace original file with metadata-stripped version
+        shutil.move(temp_output, file_path)
+    except subprocess.TimeoutExpired:
+        raise Exception("ffmpeg timeout: file too large or corrupted")
+    finally:
+        if os.path.exists(temp_output):
+            os.unlink(temp_output)
 
-        try:
-            # Use ffmpeg to strip all metadata while preserving audio quality
-            # -c:a copy: copy audio codec without re-encoding (preserves quality)
-            # -map_metadata -1: remove all metadata
-            # -y: overwrite output file
-            # -loglevel error: suppress ffmpeg output
-            subprocess.run(
-                [
-                    "ffmpeg",
-                    "-i",
-                    file_path,
-                    "-map",
-                    "0:a:0",  # keep only audio stream
-                    "-vn",  # drop video/cover streams
-                    "-c:a",
-                    "copy",  # no re-encode, no quality loss
-                    "-map_metadata",
-                    "-1",
-                    "-y",
-                    temp_output,
-                ],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL,
-                timeout=300,
-            )
+    return result.stdout or None
 
-            # Replace original file with metadata-stripped version
-            shutil.move(temp_output, file_path)
-
-        except subprocess.TimeoutExpired:
-            # Cleanup temp file if timeout
-            if os.path.exists(temp_output):
-                os.unlink(temp_output)
-            raise Exception("ffmpeg timeout: file too large or corrupted")
-        except FileNotFoundError:
-            # ffmpeg not installed, fallback to mutagen-based stripping
-            if os.path.exists(temp_output):
-                os.unlink(temp_output)
-            _strip_metadata_fallback(file_path)
-        except Exception:
-            # Cleanup temp file on any error
-            if os.path.exists(temp_output):
-                os.unlink(temp_output)
-            # Fallback to mutagen if ffmpeg fails
-            _strip_metadata_fallback(file_path)
 
+def process_audio(file_path: str) -> AudioInfo:
+    """
+    Probe and strip an audio file in place: one ffprobe pass for technical
+    info, tags and cover art, one ffmpeg pass that writes the stripped audio
+    and extracts the cover. Falls back to mutagen when ffmpeg is missing or
+    cannot handle the file.
+    """
+    try:
+        info, cover_index = probe_audio(file_path)
+    except subprocess.TimeoutExpired:
+        raise Exception("ffprobe timeout: file too large or corrupted")
     except Exception:
-        # If everything fails, at least try the basic stripping
+        # ffprobe missing or file unreadable by it
+        info = _mutagen_audio_info(file_path)
         _strip_metadata_fallback(file_path)
+        info.size = os.path.getsize(file_path)
+        return info
+
+    try:
+        info.album_art = _ffmpeg_strip(file_path, cover_index)
+    except FileNotFoundError:
+        # ffmpeg not installed (but ffprobe is)
+        info.album_art = extract_metadata(file_path)["album_art"]
+        _strip_metadata_fallback(file_path)
+    except subprocess.CalledProcessError:
+        # ffmpeg could not remux it, clear what mutagen can
+        info.album_art = extract_metadata(file_path)["album_art"]
+        _strip_metadata_fallback(file_path)
+
+    info.size = os.path.getsize(file_path)
+    return info
+
+
+def _mutagen_audio_info(file_path: str) -> AudioInfo:
+    metadata = extract_metadata(file_path)
+    info = AudioInfo(
+        duration=metadata["duration"],
+        mime_type=metadata["mime_type"],
+        title=metadata["title"],
+        artist=metadata["artist"],
+        album=metadata["album"],
+        album_art=metadata["album_art"],
+    )
+
+    try:
+        stream_info = MutagenFile(file_path).info
+        info.codec = type(stream_info).__module__.rsplit(".", 1)[-1]
+        info.bit_rate = getattr(stream_info, "bitrate", None) or None
+        info.sample_rate = getattr(stream_info, "sample_rate", None)
+        info.channels = getattr(stream_info, "channels", None)
+    except Exception:
+        pass
+
+    return info
 
 
 def _strip_metadata_fallback(file_path: str):
     """
     Fallback metadata removal using mutagen only (less effective than ffmpeg).
-    Used if ffmpeg is not available.
+    Used by `process_audio` when ffmpeg is not available or fails.
     """
     try:
         audio = MutagenFile(file_path)
@@ -136,6 +320,12 @@ def _strip_metadata_fallback(file_path: str):
 
 
 def extract_metadata(file_path):
+    """
+    Read tags, duration and MIME type with mutagen.
+
+    `file_path` may also be a seekable file object (e.g. `S3RangeReader`),
+    in which case only the parts mutagen seeks to are read.
+    """
     try:
         audio = MutagenFile(file_path)
 
@@ -0,0 +1,207 @@
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from music.models import ProcessingJob
+from music.services.hls_service import get_hls_playlist, hls_variant
+from music.services.rendition_service import (
+    get_rendition,
+    parse_rendition,
+    rendition_key,
+)
+from music.services.storage_service import delete_file
+from music.services.upload_service import process_uploaded_file
+
+_deriving = set()  # (kind, rendition key, variant) being produced
+_deriving_lock = threading.Lock()
+
+
+def submit_upload(temp_path, original_name, user):
+    """
+    Process an uploaded temp file according to `UPLOAD_PROCESSING_MODE`.
+
+    Returns:
+        (song, None) when processed inline ("sync"),
+        (None, job) when queued for the `process_jobs` worker ("queue")
+    """
+    if settings.UPLOAD_PROCESSING_MODE == "queue":
+        return None, enqueue_upload(temp_path, original_name, user)
+
+    return process_uploaded_file(temp_path, original_name, user), None
+
+
+def enqueue_upload(temp_path, original_name, user):
+    return ProcessingJob.objects.create(
+        created_by=user,
+        temp_path=temp_path,
+        original_name=original_name,
+        max_attempts=settings.PROCESSING_JOB_MAX_ATTEMPTS,
+    )
+
+
+def submit_rendition(song, rendition):
+    """
+    Transcode a missing rendition outside the request. Requests serve the
+    original until it is stored.
+    """
+    submit_derivative(song, ProcessingJob.Kind.RENDITION, rendition.name)
+
+
+def submit_hls(song, rendition=None):
+    """
+    Package a missing HLS playlist outside the request. Requests serve the
+    plain file until it is stored.
+    """
+    submit_derivative(song, ProcessingJob.Kind.HLS, hls_variant(rendition))
+
+
+def submit_derivative(song, kind, variant):
+    """
+    Produce a rendition or HLS package of `song`: as a job for the
+    `process_jobs` worker in "queue" mode, else in a background thread of
+    this process (one per derivative at a time).
+    """
+    if settings.UPLOAD_PROCESSING_MODE == "queue":
+        queued = ProcessingJob.objects.filter(
+            kind=kind,
+            song=song,
+            variant=variant,
+            status__in=[ProcessingJob.Status.PENDING, ProcessingJob.Status.RUNNING],
+        )
+        if not queued.exists():
+            ProcessingJob.objects.create(
+                created_by_id=song.uploaded_by_id,
+                kind=kind,
+                song=song,
+                variant=variant,
+                max_attempts=settings.PROCESSING_JOB_MAX_ATTEMPTS,
+            )
+        return
+
+    key = (kind, rendition_key(song), variant)
+    with _deriving_lock:
+        if key in _deriving:
+            return
+        _deriving.add(key)
+
+    threading.Thread(
+        target=_derive_in_background, args=(song, kind, variant, key), daemon=True
+    ).start()
+
+
+def _derive_in_background(song, kind, variant, key):
+    try:
+        produce_derivative(song, kind, variant)
+    finally:
+        with _deriving_lock:
+            _deriving.discard(key)
+
+
+def produce_derivative(song, kind, variant):
+    """
+    Stored path of the rendition or HLS playlist, produced now if missing.
+    Returns None if that fails.
+    """
+    if kind == ProcessingJob.Kind.HLS:
+        rendition = None if variant == "original" else parse_rendition(variant)
+        return get_hls_playlist(song, rendition)
+
+    return get_rendition(song, parse_rendition(variant))
+
+
+def requeue_stale_jobs():
+    """
+    Put jobs back in the queue whose worker died while running them.
+
+    Returns:
+        Number of requeued jobs
+    """
+    stale_before = timezone.now() - timedelta(
+        seconds=settings.PROCESSING_JOB_LOCK_TIMEOUT
+    )
+
+    return ProcessingJob.objects.filter(
+        status=ProcessingJob.Status.RUNNING, locked_at__lt=stale_before
+    ).update(status=ProcessingJob.Status.PENDING, locked_at=None)
+
+
+def claim_jobs(limit):
+    """
+    Atomically mark up to `limit` due jobs as running and return them.
+    `skip_locked` lets several workers poll the same table without
+    claiming the same job twice.
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+
+    with transaction.atomic():
+        jobs = list(
+            ProcessingJob.objects.select_for_update(skip_locked=True)
+            .filter(status=ProcessingJob.Status.PENDING, run_after__lte=now)
+            .order_by("run_after", "created_at")[:limit]
+        )
+
+        for job in jobs:
+            job.status = ProcessingJob.Status.RUNNING
+            job.locked_at = now
+            job.attempts += 1
+            job.save(update_fields=["status", "locked_at", "attempts", "updated_at"])
+
+    return jobs
+
+
+def run_job(job):
+    """
+    Run the upload pipeline (or the transcode / packaging) for a claimed job. Failed
+    attempts are retried with exponential backoff until `max_attempts`, then
+    the job is failed and its temp file removed.
+    """
+    try:
+        if job.kind != ProcessingJob.Kind.UPLOAD:
+            song = run_derivative(job)
+        else:
+            song = process_uploaded_file(
+                job.temp_path,
+                job.original_name,
+                job.created_by,
+                delete_temp_on_error=False,
+            )
+    except Exception:
+        job.error = traceback.format_exc()
+        job.locked_at = None
+
+        if job.attempts < job.max_attempts:
+            job.status = ProcessingJob.Status.PENDING
+            job.run_after = timezone.now() + timedelta(
+                seconds=settings.PROCESSING_JOB_RETRY_DELAY * 2 ** (job.attempts - 1)
+            )
+        else:
+            job.status = ProcessingJob.Status.FAILED
+            delete_file(job.temp_path)
+
+        job.save(
+            update_fields=["status", "error", "locked_at", "run_after", "updated_at"]
+        )
+        return job
+
+    job.song = song
+    job.status = ProcessingJob.Status.COMPLETED
+    job.error = ""
+    job.locked_at = None
+    job.save(update_fields=["song", "status", "error", "locked_at", "updated_at"])
+
+    return job
+
+
+def run_derivative(job):
+    # Nothing to do once the song was deleted
+    if job.song is not None and not produce_derivative(job.song, job.kind, job.variant):
+        raise Exception(f"Producing {job.kind} {job.variant} failed")
+
+    return job.song
@@ -0,0 +1,231 @@
+import fcntl
+import hashlib
+import os
+import posixpath
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from music.services.metadata_service import FFMPEG_TIMEOUT
+from music.services.storage_service import delete_file, ffmpeg_source
+
+# ffmpeg encoder arguments, container and MIME type per rendition codec
+CODECS = {
+    "opus": {
+        "args": ["-c:a", "libopus", "-vbr", "on", "-f", "ogg"],
+        "extension": "opus",
+        "mime_type": "audio/ogg",
+    },
+    "aac": {
+        "args": ["-c:a", "aac", "-movflags", "+faststart", "-f", "mp4"],
+        "extension": "m4a",
+        "mime_type": "audio/mp4",
+    },
+}
+
+# Effective connection type (ECT client hint) -> highest bitrate (kbps)
+ECT_BITRATES = {"slow-2g": 0, "2g": 0, "3g": 128}
+
+
+@dataclass
+class Rendition:
+    codec: str
+    bitrate: int  # kbps
+
+    @property
+    def mime_type(self):
+        return CODECS[self.codec]["mime_type"]
+
+    @property
+    def name(self):
+        return f"{self.codec}-{self.bitrate}k"
+
+
+def rendition_key(song):
+    """Renditions follow the stored audio, identical uploads share them."""
+    return song.content_hash or song.song_uuid.hex
+
+
+def rendition_path(key, rendition):
+    return posixpath.join(
+        "renditions",
+        key,
+        f"{rendition.bitrate}k.{CODECS[rendition.codec]['extension']}",
+    )
+
+
+def source_bitrate(size, duration):
+    """Average bitrate of the original audio in kbps (0 if unknown)."""
+    if not duration:
+        return 0
+    return size * 8 // duration // 1000
+
+
+def select_rendition(song, bitrate=None, codec=None, headers=None):
+    """
+    Pick the ladder rung to serve: an explicit `bitrate` (highest rung not
+    above it), else the Save-Data / ECT / Downlink client hints. Returns None
+    when the original should be served: no preference, renditions disabled,
+    or the original is within the limit or not larger than the rung.
+    """
+    if settings.RENDITION_MODE == "off":
+        return None
+
+    ladder = sorted(settings.RENDITION_BITRATES)
+    limit = bitrate or _bitrate_from_hints(headers or {}, ladder)
+    if not limit:
+        return None
+
+    # The original already fits, or no rung would be smaller than it
+    original = source_bitrate(song.size, song.duration)
+    candidates = [rung for rung in ladder if rung <= limit] or ladder[:1]
+    if limit >= original or candidates[-1] >= original:
+        return None
+
+    return Rendition(codec or settings.RENDITION_DEFAULT_CODEC, candidates[-1])
+
+
+def _bitrate_from_hints(headers, ladder):
+    if headers.get("Save-Data", "").lower() == "on":
+        return ladder[0]
+
+    ect = headers.get("ECT", "").lower()
+    if ect in ECT_BITRATES:
+        return ECT_BITRATES[ect] or ladder[0]
+
+    try:
+        # Downlink is in Mbps, leave headroom for everything else on the link
+        downlink = float(headers.get("Downlink", ""))
+    except ValueError:
+        return None
+    return max(int(downlink * 1000 / 4), ladder[0])
+
+
+def parse_rendition(name):
+    """Inverse of `Rendition.name`: "aac-128k" -> Rendition("aac", 128)."""
+    codec, bitrate = name.rsplit("-", 1)
+    return Rendition(codec, int(bitrate.rstrip("k")))
+
+
+def stored_rendition(song, rendition):
+    """Stored path of `rendition`, or None if it was not produced yet."""
+    path = rendition_path(rendition_key(song), rendition)
+    return path if default_storage.exists(path) else None
+
+
+def get_rendition(song, rendition):
+    """
+    Stored path of `rendition`, transcoding it on first use (can take up to
+    FFMPEG_TIMEOUT, requests use `stored_rendition` and `submit_rendition`).
+    Concurrent calls for the same missing rendition are single-flighted
+    through a lock file: one transcodes, the others wait for its result.
+
+    Returns None if transcoding fails, the original should be served then.
+    """
+    path = rendition_path(rendition_key(song), rendition)
+    if default_storage.exists(path):
+        return path
+
+    try:
+        with single_flight(path):
+            # Another request may have produced it while we waited
+            if not default_storage.exists(path):
+                transcode(ffmpeg_source(song.file.name), rendition, path)
+    except Exception as e:
+        print(f"Error creating {rendition.name} rendition: {e}")
+        return None
+
+    return path
+
+
+@contextmanager
+def single_flight(name):
+    """
+    Exclusive lock per `name` across threads and processes of this host,
+    held while a missing derived file is produced.
+    """
+    lock_name = hashlib.sha256(name.encode()).hexdigest()
+    os.makedirs(settings.RENDITION_LOCK_DIR, exist_ok=True)
+
+    with open(os.path.join(settings.RENDITION_LOCK_DIR, lock_name), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def generate_renditions(local_path, content_hash, audio):
+    """
+    Eager mode: transcode the whole ladder from the local copy of newly
+    stored audio. Failures are reported, never raised, a missing rendition
+    is produced lazily on request.
+    """
+    if settings.RENDITION_MODE != "eager":
+        return
+
+    for bitrate in settings.RENDITION_BITRATES:
+        rendition = Rendition(settings.RENDITION_DEFAULT_CODEC, bitrate)
+        if bitrate >= source_bitrate(audio.size, audio.duration):
+            continue
+
+        path = rendition_path(content_hash, rendition)
+        if default_storage.exists(path):
+            continue
+
+        try:
+            transcode(local_path, rendition, path)
+        except Exception as e:
+            print(f"Error creating {rendition.name} rendition: {e}")
+
+
+def transcode(source, rendition, path):
+    """Encode `source` into a local temp file, then store it at `path`."""
+    codec = CODECS[rendition.codec]
+    fd, temp_path = tempfile.mkstemp(suffix=f".{codec['extension']}")
+    os.close(fd)
+
+    try:
+        subprocess.run(
+            [
+                "ffmpeg",
+                "-v",
+                "error",
+                "-i",
+                source,
+                "-map",
+                "0:a:0",
+                "-map_metadata",
+                "-1",
+                "-b:a",
+                f"{rendition.bitrate}k",
+                *codec["args"],
+                "-y",
+                temp_path,
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+            timeout=FFMPEG_TIMEOUT,
+        )
+
+        with open(temp_path, "rb") as file:
+            return default_storage.save(path, file)
+    finally:
+        os.unlink(temp_path)
+
+
+def delete_renditions(key):
+    """Delete every rendition stored under `renditions/<key>/`."""
+    directory = posixpath.join("renditions", key)
+    try:
+        _, files = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+
+    for name in files:
+        delete_file(posixpath.join(directory, name))
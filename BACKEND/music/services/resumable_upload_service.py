@@ -0,0 +1,212 @@
+import hashlib
+import io
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from music.models import UploadSession
+from music.services.storage_service import delete_file
+
+
+class ChunkConflict(Exception):
+    """The chunk does not start at the session's current offset."""
+
+
+class ChecksumMismatch(Exception):
+    """The assembled file does not match the checksum given by the client."""
+
+
+def session_prefix(session):
+    return f"tmp/resumable/{session.session_uuid}/"
+
+
+def read_chunk(stream, max_size):
+    """
+    Read a request body of at most `max_size` bytes.
+
+    Returns:
+        The bytes, or None if the body is larger than `max_size`
+    """
+    if stream is None:
+        return b""
+
+    chunks = []
+    received = 0
+
+    while True:
+        data = stream.read(min(1024 * 1024, max_size + 1 - received))
+        if not data:
+            break
+        chunks.append(data)
+        received += len(data)
+        if received > max_size:
+            return None
+
+    return b"".join(chunks)
+
+
+def write_chunk(session, offset, data):
+    """
+    Store `data` as the part starting at `offset` and advance the session.
+
+    Raises:
+        ChunkConflict: if `offset` is not the current offset (another request
+            advanced it, or the client is out of sync)
+        ValueError: if the chunk would go past the announced size
+    """
+    if offset != session.offset:
+        raise ChunkConflict()
+
+    if offset + len(data) > session.size:
+        raise ValueError("Chunk exceeds the upload size")
+
+    # Nothing to store (a retry of the hand-over sends an empty body)
+    if not data:
+        return session
+
+    # Zero-padded offsets keep parts ordered when listed, the random suffix
+    # keeps a concurrent request for the same offset from touching this part
+    part_path = default_storage.save(
+        f"{session_prefix(session)}{offset:020d}.{uuid.uuid4().hex}.part",
+        ContentFile(data),
+    )
+
+    updated = UploadSession.objects.filter(pk=session.pk, offset=offset).update(
+        offset=F("offset") + len(data)
+    )
+    if not updated:
+        delete_file(part_path)
+        raise ChunkConflict()
+
+    session.offset = offset + len(data)
+    return session
+
+
+class _PartsReader(io.RawIOBase):
+    """Raw stream over the stored parts, hashing bytes as they are read."""
+
+    def __init__(self, part_paths):
+        super().__init__()
+        self.part_paths = iter(part_paths)
+        self.current = None
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                part_path = next(self.part_paths, None)
+                if part_path is None:
+                    return 0
+                self.current = default_storage.open(part_path, "rb")
+
+            data = self.current.read(len(buffer))
+            if data:
+                buffer[: len(data)] = data
+                self.hasher.update(data)
+                self.size += len(data)
+                return len(data)
+
+            self.current.close()
+            self.current = None
+
+    def close(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+        super().close()
+
+
+def assemble_upload(session):
+    """
+    Concatenate the stored parts into a single `tmp/` file and verify it
+    against the session's size and checksum. Parts are kept until the caller
+    removes them (`delete_session_parts`) once the file is handed over, so
+    a failed save or hand-over can be retried.
+
+    Returns:
+        Storage path of the assembled file
+
+    Raises:
+        ChecksumMismatch: if the assembled bytes don't match (file is removed)
+    """
+    prefix = session_prefix(session)
+    _, part_names = default_storage.listdir(prefix)
+    part_paths = [f"{prefix}{name}" for name in sorted(part_names)]
+
+    ext = os.path.splitext(session.filename)[1]
+    temp_path = f"tmp/{session.session_uuid}{ext}"
+
+    # Buffered stream, as storage backends expect of a file (S3 checks
+    # `closed`/`seekable` before uploading it)
+    reader = _PartsReader(part_paths)
+    with io.BufferedReader(reader, settings.CHUNK_SIZE * 128) as stream:
+        temp_path = default_storage.save(temp_path, File(stream, name=session.filename))
+
+    if reader.size != session.size or reader.hasher.hexdigest() != session.checksum:
+        delete_file(temp_path)
+        delete_session_parts(session)
+        raise ChecksumMismatch()
+
+    return temp_path
+
+
+def delete_session_parts(session):
+    prefix = session_prefix(session)
+
+    try:
+        _, part_names = default_storage.listdir(prefix)
+    except FileNotFoundError:
+        # No chunk received yet (local storage)
+        return
+
+    for name in part_names:
+        delete_file(f"{prefix}{name}")
+
+    if settings.STORAGE_BACKEND == "local":
+        os.rmdir(default_storage.path(prefix))
+
+
+def claim_session(session):
+    """
+    Mark the session complete for the one request handing its file over.
+
+    Returns:
+        False if another request already claimed it
+    """
+    claimed = UploadSession.objects.filter(pk=session.pk, is_complete=False).update(
+        is_complete=True, updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    session.is_complete = True
+    return True
+
+
+def expire_sessions():
+    """
+    Delete upload sessions (and their parts) not updated for
+    `UPLOAD_SESSION_MAX_AGE` seconds: abandoned uploads, and completed ones
+    whose file was handed over.
+
+    Returns:
+        Number of deleted sessions
+    """
+    expired_before = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_MAX_AGE)
+    sessions = list(UploadSession.objects.filter(updated_at__lt=expired_before))
+
+    for session in sessions:
+        delete_session_parts(session)
+        session.delete()
+
+    return len(sessions)
@@ -1,5 +1,28 @@
-import boto3
+import hashlib
+import io
+from collections import OrderedDict
+
 from django.conf import settings
+from django.core.cache import cache
+
+from utils.storage import get_s3_client
+
+# complete_multipart_upload errors caused by the parts the client reported
+# (as opposed to S3 being unavailable)
+INVALID_MULTIPART_ERRORS = {
+    "EntityTooSmall",
+    "InvalidPart",
+    "InvalidPartOrder",
+    "NoSuchUpload",
+}
+
+# Of those, the ones completing again cannot fix (a part can be re-uploaded
+# after InvalidPart, NoSuchUpload has nothing left to abort)
+UNRECOVERABLE_MULTIPART_ERRORS = {"EntityTooSmall", "InvalidPartOrder"}
+
+# Upper bound of S3_PRESIGNED_URL_REUSE_FRACTION: a cached URL must still have
+# some validity left when it is handed out
+MAX_PRESIGNED_URL_REUSE_FRACTION = 0.9
 
 
 def generate_presigned_url(object_path, expires=settings.S3_PRESIGNED_URL_EXPIRATION):
@@ -15,17 +38,7 @@ def generate_presigned_url(object_path, expires=settings.S3_PRESIGNED_URL_EXPIRA
         Presigned URL string (with public endpoint)
     """
     # Use public endpoint for browser access, fall back to internal if not set
-    endpoint_for_generation = (
-        settings.AWS_S3_PUBLIC_ENDPOINT_URL or settings.AWS_S3_ENDPOINT_URL
-    )
-
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=endpoint_for_generation,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
-    )
+    s3 = get_s3_client(public=True)
 
     url = s3.generate_presigned_url(
         "get_object",
@@ -54,15 +67,7 @@ def generate_internal_presigned_url(
         Presigned URL string (with internal endpoint)
     """
     # Use internal endpoint for backend communication
-    endpoint_for_generation = settings.AWS_S3_ENDPOINT_URL
-
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=endpoint_for_generation,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
-    )
+    s3 = get_s3_client()
 
     url = s3.generate_presigned_url(
         "get_object",
@@ -74,3 +79,233 @@ def generate_internal_presigned_url(
     )
 
     return url
+
+
+def get_presigned_url(object_path, public=True):
+    """
+    Return a presigned URL for an S3 object, reusing a cached one until
+    `S3_PRESIGNED_URL_REUSE_FRACTION` of its lifetime has elapsed.
+
+    A stable URL lets browsers (and the `/music-storage/` nginx location)
+    cache the object instead of seeing a new query string on every play.
+
+    Args:
+        object_path: The S3 object key/path
+        public: Sign for the public endpoint (browsers) or the internal one
+
+    Returns:
+        Presigned URL string with at least
+        `(1 - S3_PRESIGNED_URL_REUSE_FRACTION) * S3_PRESIGNED_URL_EXPIRATION`
+        seconds of validity left (the fraction is capped at
+        `MAX_PRESIGNED_URL_REUSE_FRACTION`)
+    """
+    expires = settings.S3_PRESIGNED_URL_EXPIRATION
+    generate = generate_presigned_url if public else generate_internal_presigned_url
+
+    fraction = min(
+        settings.S3_PRESIGNED_URL_REUSE_FRACTION, MAX_PRESIGNED_URL_REUSE_FRACTION
+    )
+    reuse_for = int(expires * fraction)
+    if reuse_for <= 0:
+        return generate(object_path, expires)
+
+    endpoint = (
+        settings.AWS_S3_PUBLIC_ENDPOINT_URL or settings.AWS_S3_ENDPOINT_URL
+        if public
+        else settings.AWS_S3_ENDPOINT_URL
+    )
+    cache_key = (
+        "presigned-url:"
+        + hashlib.sha256(f"{endpoint}|{object_path}".encode()).hexdigest()
+    )
+
+    url = cache.get(cache_key)
+    if url is None:
+        url = generate(object_path, expires)
+        cache.set(cache_key, url, timeout=reuse_for)
+
+    return url
+
+
+def create_multipart_upload(object_path, content_type=None):
+    """
+    Start a multipart upload so the browser can upload parts directly to S3.
+
+    Returns:
+        The S3 UploadId
+    """
+    params = {"Bucket": settings.AWS_STORAGE_BUCKET_NAME, "Key": object_path}
+    if content_type:
+        params["ContentType"] = content_type
+
+    response = get_s3_client().create_multipart_upload(**params)
+    return response["UploadId"]
+
+
+def generate_presigned_part_urls(
+    object_path, upload_id, part_count, expires=settings.S3_PRESIGNED_URL_EXPIRATION
+):
+    """
+    Presign one `upload_part` URL per part (numbered from 1) on the PUBLIC
+    endpoint, so browsers PUT the bytes without going through Django.
+    """
+    s3 = get_s3_client(public=True)
+
+    return [
+        s3.generate_presigned_url(
+            "upload_part",
+            Params={
+                "Bucket": settings.AWS_STORAGE_BUCKET_NAME,
+                "Key": object_path,
+                "UploadId": upload_id,
+                "PartNumber": part_number,
+            },
+            ExpiresIn=expires,
+        )
+        for part_number in range(1, part_count + 1)
+    ]
+
+
+def complete_multipart_upload(object_path, upload_id, parts):
+    """
+    Assemble the uploaded parts into the final object.
+
+    Args:
+        parts: list of {"part_number": int, "etag": str} as reported by S3
+            in the ETag header of each part upload
+    """
+    get_s3_client().complete_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=object_path,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": [
+                {"PartNumber": part["part_number"], "ETag": part["etag"]}
+                for part in sorted(parts, key=lambda part: part["part_number"])
+            ]
+        },
+    )
+
+
+def abort_multipart_upload(object_path, upload_id):
+    """Discard a multipart upload and any parts already uploaded."""
+    get_s3_client().abort_multipart_upload(
+        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+        Key=object_path,
+        UploadId=upload_id,
+    )
+
+
+class S3RangeReader:
+    """
+    Read-only, seekable file object over an S3 object that fetches only the
+    blocks actually read, via ranged GETs, and keeps the most recent ones.
+
+    Lets mutagen read headers (ID3, MP4 `moov`, FLAC metadata blocks) of a
+    stored song for a few kilobytes instead of downloading the whole object.
+    """
+
+    def __init__(self, object_path, block_size=32 * 1024, max_blocks=64):
+        self.name = object_path
+        self.block_size = block_size
+        self.max_blocks = max_blocks
+
+        self.client = get_s3_client()
+        self.size = self.client.head_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=object_path
+        )["ContentLength"]
+
+        self.position = 0
+        self.blocks = OrderedDict()
+        self.bytes_fetched = 0
+        self.closed = False
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def writable(self):
+        return False
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        if offset < 0:
+            raise ValueError("negative seek position")
+
+        self.position = offset
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.position
+        end = min(self.position + size, self.size)
+        if end <= self.position:
+            return b""
+
+        first_block = self.position // self.block_size
+        last_block = (end - 1) // self.block_size
+        self._ensure_blocks(first_block, last_block)
+
+        data = b"".join(
+            self.blocks[index] for index in range(first_block, last_block + 1)
+        )
+        offset = self.position - first_block * self.block_size
+        data = data[offset : offset + end - self.position]
+
+        self.position = end
+        return data
+
+    def _ensure_blocks(self, first_block, last_block):
+        # Fetch each run of missing blocks with a single ranged GET
+        index = first_block
+        while index <= last_block:
+            if index in self.blocks:
+                self.blocks.move_to_end(index)
+                index += 1
+                continue
+
+            run_end = index
+            while run_end + 1 <= last_block and run_end + 1 not in self.blocks:
+                run_end += 1
+
+            self._fetch(index, run_end)
+            index = run_end + 1
+
+        # Evict least recently used blocks, never the ones just requested
+        while len(self.blocks) > max(self.max_blocks, last_block - first_block + 1):
+            self.blocks.popitem(last=False)
+
+    def _fetch(self, first_block, last_block):
+        start = first_block * self.block_size
+        end = min((last_block + 1) * self.block_size, self.size) - 1
+
+        response = self.client.get_object(
+            Bucket=settings.AWS_STORAGE_BUCKET_NAME,
+            Key=self.name,
+            Range=f"bytes={start}-{end}",
+        )
+        data = response["Body"].read()
+        self.bytes_fetched += len(data)
+
+        for index in range(first_block, last_block + 1):
+            offset = (index - first_block) * self.block_size
+            self.blocks[index] = data[offset : offset + self.block_size]
+
+    def close(self):
+        self.blocks.clear()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,416 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from music.models import Album, Artist, Song
+
+# Rough memory cost of a document in the index structures (CPython, 64-bit),
+# used to keep all loaded indexes under SEARCH_INDEX_MAX_MEMORY_MB
+APPROX_DOC_BYTES = 600
+APPROX_BYTES_PER_CHAR = 60
+
+# Share of the query's trigrams a name must contain to match fuzzily (the
+# pg_trgm default), queries shorter than MIN_FUZZY_TRIGRAMS only match prefixes
+MIN_SIMILARITY = 0.6
+MIN_FUZZY_TRIGRAMS = 3
+
+NON_WORD_RE = re.compile(r"[\W_]+")
+MAX_CHAR = chr(0x10FFFF)
+EMPTY = frozenset()
+
+_indexes = OrderedDict()  # user id -> UserSearchIndex, least recently used first
+_building = {}  # user id -> True once a change arrived during the build
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """Casefolded words without accents or punctuation: "Beyoncé!" -> "beyonce"."""
+    text = text or ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in text if not unicodedata.combining(char))
+    return NON_WORD_RE.sub(" ", text.casefold()).strip()
+
+
+def trigrams(text, prefix=False):
+    """
+    Trigrams of every word padded like pg_trgm ("  w", " wo", "wor", "rd ").
+    With `prefix`, the last word is one still being typed and gets no end
+    padding, so "hel" matches "hello".
+    """
+    words = text.split()
+    grams = set()
+    for position, word in enumerate(words):
+        padded = f"  {word}"
+        if not (prefix and position == len(words) - 1):
+            padded += " "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class UserSearchIndex:
+    """
+    In-memory index of one user's song titles and artist and album names.
+    Documents are keyed by ("song" | "artist" | "album", pk) and stored
+    under small int ids, which is what the lookup structures hold:
+
+        names       sorted (name, id): names starting with a prefix
+        vocabulary  sorted words, with `words` (word -> ids): word prefixes
+        postings    trigram -> ids: fuzzy matches
+    """
+
+    def __init__(self, documents=()):
+        self.built_at = time.monotonic()
+        self.ids = {}  # key -> doc id
+        self.docs = {}  # doc id -> (normalized name, result entry)
+        self.names = []
+        self.words = defaultdict(set)
+        self.vocabulary = []
+        self.postings = defaultdict(set)
+        self.next_id = 0
+        self.size = 0  # approximate bytes
+        self.lock = threading.Lock()
+
+        # Bulk load, sorted once
+        for key, name, entry in documents:
+            doc = self._insert(key, name, entry)
+            self.names.append((self.docs[doc][0], doc))
+        self.names.sort()
+        self.vocabulary = sorted(self.words)
+
+    def add(self, key, name, entry):
+        with self.lock:
+            self._remove(key)
+            doc = self._insert(key, name, entry)
+
+            text = self.docs[doc][0]
+            bisect.insort(self.names, (text, doc))
+            for word in set(text.split()):
+                if len(self.words[word]) == 1:
+                    bisect.insort(self.vocabulary, word)
+
+    def remove(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _insert(self, key, name, entry):
+        doc = self.next_id
+        self.next_id += 1
+
+        text = normalize(name)
+        self.ids[key] = doc
+        self.docs[doc] = (text, entry)
+        for word in text.split():
+            self.words[word].add(doc)
+        for gram in trigrams(text):
+            self.postings[gram].add(doc)
+
+        self.size += self._cost(text)
+        return doc
+
+    def _remove(self, key):
+        doc = self.ids.pop(key, None)
+        if doc is None:
+            return
+
+        text, _ = self.docs.pop(doc)
+        del self.names[bisect.bisect_left(self.names, (text, doc))]
+        for word in set(text.split()):
+            if _discard(self.words, word, doc):
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, word)]
+        for gram in trigrams(text):
+            _discard(self.postings, gram, doc)
+
+        self.size -= self._cost(text)
+
+    @staticmethod
+    def _cost(text):
+        return APPROX_DOC_BYTES + len(text) * APPROX_BYTES_PER_CHAR
+
+    def search(self, query, limit):
+        """
+        Best matches of `query` in three tiers, a tier is only consulted
+        while fewer than `limit` matches were found (so broad prefixes never
+        reach the fuzzy scan):
+
+            1. names starting with the query, shortest first
+            2. names with a word starting with each query word, shortest first
+            3. names sharing enough trigrams with the query (typos), most
+               similar first
+        """
+        text = normalize(query)
+        if not text:
+            return []
+
+        with self.lock:
+            found = self._name_prefix_matches(text, limit)
+            if len(found) < limit:
+                found += self._word_prefix_matches(text, limit - len(found), found)
+            if len(found) < limit:
+                found += self._fuzzy_matches(text, limit - len(found), found)
+
+            return [dict(self.docs[doc][1]) for doc in found]
+
+    def _name_prefix_matches(self, text, limit):
+        start = bisect.bisect_left(self.names, (text,))
+        end = bisect.bisect_left(self.names, (text + MAX_CHAR,), start)
+        matches = heapq.nsmallest(
+            limit, self.names[start:end], key=lambda name: len(name[0])
+        )
+        return [doc for _, doc in matches]
+
+    def _word_prefix_matches(self, text, limit, exclude):
+        docs = None
+        for word in text.split():
+            start = bisect.bisect_left(self.vocabulary, word)
+            end = bisect.bisect_left(self.vocabulary, word + MAX_CHAR, start)
+            matching = set().union(
+                *(self.words[match] for match in self.vocabulary[start:end])
+            )
+            docs = matching if docs is None else docs & matching
+            if not docs:
+                return []
+
+        docs.difference_update(exclude)
+        return heapq.nsmallest(limit, docs, key=lambda doc: len(self.docs[doc][0]))
+
+    def _fuzzy_matches(self, text, limit, exclude):
+        postings = [self.postings.get(gram, EMPTY) for gram in trigrams(text, True)]
+        if len(postings) < MIN_FUZZY_TRIGRAMS:
+            return []
+
+        # A match holds `needed` of the query's trigrams, so it holds at least
+        # one of the `len - needed + 1` rarest: only those are scanned, the
+        # others are intersected with the candidates
+        postings.sort(key=len)
+        needed = math.ceil(MIN_SIMILARITY * len(postings))
+        candidates = set().union(*postings[: len(postings) - needed + 1])
+        candidates.difference_update(exclude)
+
+        counts = Counter()
+        for docs in postings:
+            counts.update(candidates & docs)
+
+        matches = heapq.nlargest(
+            limit,
+            (doc for doc, count in counts.items() if count >= needed),
+            key=lambda doc: (counts[doc], -len(self.docs[doc][0])),
+        )
+        return matches
+
+    def artist_name(self, artist_id):
+        doc = self.ids.get(("artist", artist_id))
+        return self.docs[doc][1]["name"] if doc is not None else None
+
+
+def _discard(index, value, doc):
+    """Remove `doc` from `index[value]`, True if that was its last doc."""
+    docs = index[value]
+    docs.discard(doc)
+    if docs:
+        return False
+
+    del index[value]
+    return True
+
+
+def suggest(user_id, query, limit=10):
+    """
+    Songs, artists and albums of the user whose names match `query`
+    (prefix or fuzzy), best first, answered from memory:
+
+        [{"type": "song", "uuid": ..., "name": ..., "artist_name": ...}, ...]
+
+    The user's index is built from the database on first use and then kept
+    current by the model signals. Changes saved by other processes (other
+    workers, `process_jobs`, `import_library`) show up once the index is
+    older than SEARCH_INDEX_MAX_AGE seconds and rebuilt in the background.
+    """
+    index = get_index(user_id)
+    results = index.search(query, limit)
+
+    for result in results:
+        if "artist_id" in result:
+            result["artist_name"] = index.artist_name(result.pop("artist_id"))
+
+    return results
+
+
+def get_index(user_id):
+    """
+    The user's loaded index, built now on first use. An index older than
+    SEARCH_INDEX_MAX_AGE is still served while a background thread rebuilds
+    it (one build per user at a time), so searches never wait on a rebuild.
+    """
+    with _lock:
+        index = _indexes.get(user_id)
+        if index:
+            _indexes.move_to_end(user_id)
+            expired = time.monotonic() - index.built_at >= settings.SEARCH_INDEX_MAX_AGE
+            if expired and user_id not in _building:
+                _building[user_id] = False
+                threading.Thread(
+                    target=_rebuild_in_background, args=(user_id,), daemon=True
+                ).start()
+            return index
+        _building.setdefault(user_id, False)
+
+    return refresh_index(user_id)
+
+
+def _rebuild_in_background(user_id):
+    try:
+        refresh_index(user_id)
+    finally:
+        connection.close()
+
+
+def refresh_index(user_id):
+    """Build the user's index from the database and load it in its place."""
+    # Built outside the lock, other users' searches are not blocked
+    try:
+        index = build_index(user_id)
+    finally:
+        with _lock:
+            stale = _building.pop(user_id, True)
+
+    with _lock:
+        # A change saved during the build may be missing from it: serve it
+        # once, the next search builds again
+        if not stale:
+            _indexes[user_id] = index
+            _indexes.move_to_end(user_id)
+            _evict()
+
+    return index
+
+
+def build_index(user_id):
+    return UserSearchIndex(user_documents(user_id))
+
+
+def user_documents(user_id):
+    """(key, name, entry) of every searchable row of the user."""
+    artists = Artist.objects.filter(created_by_id=user_id)
+    for pk, artist_uuid, name in artists.values_list("id", "artist_uuid", "name"):
+        yield ("artist", pk), name, artist_entry(artist_uuid, name)
+
+    albums = Album.objects.filter(created_by_id=user_id)
+    for pk, album_uuid, title, artist_id in albums.values_list(
+        "id", "album_uuid", "title", "artist_id"
+    ):
+        yield ("album", pk), title, album_entry(album_uuid, title, artist_id)
+
+    songs = indexed_songs().filter(uploaded_by_id=user_id)
+    for pk, song_uuid, title, artist_id in songs.values_list(
+        "id", "song_uuid", "title", "artist_id"
+    ).iterator(chunk_size=5000):
+        yield ("song", pk), title, song_entry(song_uuid, title, artist_id)
+
+
+def indexed_songs():
+    """Songs listed by the API (same filter as the song list)."""
+    return Song.objects.filter(
+        is_uploaded_to_cloud=settings.STORAGE_BACKEND == "s3",
+        is_upload_complete=True,
+    )
+
+
+def _evict():
+    """Drop least recently used indexes over the memory cap (never the last)."""
+    max_bytes = settings.SEARCH_INDEX_MAX_MEMORY_MB * 1024 * 1024
+    total = sum(index.size for index in _indexes.values())
+
+    while total > max_bytes and len(_indexes) > 1:
+        _, index = _indexes.popitem(last=False)
+        total -= index.size
+
+
+def artist_entry(artist_uuid, name):
+    return {"type": "artist", "uuid": str(artist_uuid), "name": name}
+
+
+def album_entry(album_uuid, title, artist_id):
+    return {
+        "type": "album",
+        "uuid": str(album_uuid),
+        "name": title,
+        "artist_id": artist_id,
+    }
+
+
+def song_entry(song_uuid, title, artist_id):
+    return {
+        "type": "song",
+        "uuid": str(song_uuid),
+        "name": title,
+        "artist_id": artist_id,
+    }
+
+
+def update_index(user_id, key, name=None, entry=None):
+    """
+    Apply a saved (`name`, `entry`) or deleted (no entry) document to the
+    user's index if this process has it loaded. Indexes not loaded are
+    built fresh on their next search.
+    """
+    if not settings.SEARCH_INDEX_ENABLED:
+        return
+
+    with _lock:
+        if user_id in _building:
+            _building[user_id] = True
+        index = _indexes.get(user_id)
+
+    if index is None:
+        return
+    if entry is None:
+        index.remove(key)
+    else:
+        index.add(key, name, entry)
+
+
+def index_song(song):
+    # Artists and albums of new uploads are bulk created without signals
+    if Song.artist.is_cached(song):
+        index_artist(song.artist)
+    if Song.album.is_cached(song) and song.album:
+        index_album(song.album)
+
+    if song.is_upload_complete and song.is_uploaded_to_cloud == (
+        settings.STORAGE_BACKEND == "s3"
+    ):
+        update_index(
+            song.uploaded_by_id,
+            ("song", song.pk),
+            song.title,
+            song_entry(song.song_uuid, song.title, song.artist_id),
+        )
+    else:
+        update_index(song.uploaded_by_id, ("song", song.pk))
+
+
+def index_artist(artist):
+    update_index(
+        artist.created_by_id,
+        ("artist", artist.pk),
+        artist.name,
+        artist_entry(artist.artist_uuid, artist.name),
+    )
+
+
+def index_album(album):
+    update_index(
+        album.created_by_id,
+        ("album", album.pk),
+        album.title,
+        album_entry(album.album_uuid, album.title, album.artist_id),
+    )
@@ -0,0 +1,75 @@
+from django.conf import settings
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Upper
+
+from music.models import Album, Artist, Playlist, Song
+
+# Searched column of each entity, see migration 0015 for its trigram index
+SEARCH_FIELDS = {
+    Song: "title",
+    Artist: "name",
+    Album: "title",
+    Playlist: "name",
+}
+
+
+def search_library(user, query, limit=10):
+    """
+    Best matches of `query` among the user's songs, artists, albums and
+    playlists, each list ranked by relevance.
+
+    Returns:
+        {"songs": [...], "artists": [...], "albums": [...], "playlists": [...]}
+    """
+    songs = Song.objects.filter(
+        uploaded_by=user,
+        is_uploaded_to_cloud=settings.STORAGE_BACKEND == "s3",
+        is_upload_complete=True,
+    ).select_related("artist")
+
+    return {
+        "songs": ranked(songs, query, limit),
+        "artists": ranked(Artist.objects.filter(created_by=user), query, limit),
+        "albums": ranked(
+            Album.objects.filter(created_by=user).select_related("artist"),
+            query,
+            limit,
+        ),
+        "playlists": ranked(Playlist.objects.filter(owner=user), query, limit),
+    }
+
+
+def ranked(queryset, query, limit):
+    """
+    Rows of `queryset` matching `query`, best first.
+
+    On PostgreSQL the match is a substring or a fuzzy (typo-tolerant) word
+    match, both answered by the `gin_trgm_ops` index on `UPPER(<field>)`,
+    ranked by trigram word similarity. Other databases (SQLite in
+    development and tests) fall back to a case-insensitive substring match
+    ranked exact > prefix > substring.
+    """
+    field = SEARCH_FIELDS[queryset.model]
+
+    if connections[queryset.db].vendor == "postgresql":
+        # Same expression as the index, so both conditions can use it
+        queryset = queryset.annotate(
+            search_key=Upper(field),
+            rank=TrigramWordSimilarity(Value(query), field),
+        ).filter(
+            Q(search_key__contains=query.upper())
+            | Q(search_key__trigram_word_similar=query.upper())
+        )
+    else:
+        queryset = queryset.filter(**{f"{field}__icontains": query}).annotate(
+            rank=Case(
+                When(**{f"{field}__iexact": query}, then=Value(2)),
+                When(**{f"{field}__istartswith": query}, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+
+    return list(queryset.order_by("-rank", field, "id")[:limit])
@@ -0,0 +1,84 @@
+import random
+import secrets
+from collections import defaultdict
+
+# Seeds stay 32-bit, JSON numbers above 2**53 lose precision in JavaScript
+MAX_SEED = 2**32 - 1
+
+# Largest page of queue uuids a client can request at once
+QUEUE_PAGE_MAX_SIZE = 500
+
+# How far ahead the smart shuffle looks for a song of another artist to
+# break up a back-to-back pair, so a library dominated by one artist
+# does not make the fix-up pass scan to the end for every pair
+SMART_SHUFFLE_LOOKAHEAD = 32
+
+# Random shift of each song of an artist around its evenly spread position,
+# as a fraction of the spacing between them
+SMART_SHUFFLE_JITTER = 0.3
+
+
+def new_seed():
+    return secrets.randbelow(MAX_SEED + 1)
+
+
+def shuffle_queue(songs, seed, smart=False, first=None):
+    """
+    Shuffle `songs`, a list of (song_uuid, artist_id) in a stable order,
+    with a seeded RNG: the same songs and seed always give the same queue,
+    so clients can reproduce it and fetch it page by page.
+
+    `smart` spreads each artist's songs over the queue and avoids the same
+    artist back-to-back where the library allows it. `first` (a song uuid)
+    is moved to the front.
+
+    Returns:
+        list of song uuids
+    """
+    rng = random.Random(seed)
+    songs = list(songs)
+    rng.shuffle(songs)
+
+    if smart:
+        songs = spread_artists(songs, rng)
+
+    queue = [song_uuid for song_uuid, _ in songs]
+    if first is not None and first in queue:
+        queue.remove(first)
+        queue.insert(0, first)
+
+    return queue
+
+
+def spread_artists(songs, rng):
+    """
+    Place every artist's songs at evenly spaced, jittered positions over the
+    queue (in their shuffled order), then break up any remaining pair of
+    the same artist by pulling forward the next song of another artist.
+    """
+    by_artist = defaultdict(list)
+    for song in songs:
+        by_artist[song[1]].append(song)
+
+    positioned = []
+    for artist_songs in by_artist.values():
+        spacing = len(songs) / len(artist_songs)
+        offset = rng.random() * spacing
+        for i, song in enumerate(artist_songs):
+            jitter = rng.uniform(-SMART_SHUFFLE_JITTER, SMART_SHUFFLE_JITTER)
+            positioned.append((offset + (i + jitter) * spacing, song))
+
+    positioned.sort(key=lambda item: item[0])
+    queue = [song for _, song in positioned]
+
+    for i in range(1, len(queue)):
+        if queue[i][1] != queue[i - 1][1]:
+            continue
+
+        window = range(i + 1, min(i + 1 + SMART_SHUFFLE_LOOKAHEAD, len(queue)))
+        for j in window:
+            if queue[j][1] != queue[i - 1][1]:
+                queue.insert(i, queue.pop(j))
+                break
+
+    return queue
@@ -1,23 +1,56 @@
+import uuid
+
+from django.conf import settings
 from django.core.files.storage import default_storage
 
 
 def save_temp_file(uploaded_file):
-    temp_path = f"tmp/{uploaded_file.name}"
+    # Unique per upload: queued uploads wait in tmp/ for a worker, two users
+    # uploading "track01.mp3" must not overwrite each other's file
+    temp_path = f"tmp/{uuid.uuid4().hex}_{uploaded_file.name}"
+
+    return default_storage.save(temp_path, uploaded_file)
+
+
+def direct_upload_prefix(user):
+    """Per-user temp prefix for files uploaded by the browser straight to S3."""
+    return f"tmp/direct/{user.user_uuid}/"
+
+
+def open_for_metadata(path):
+    """
+    Seekable read-only handle for reading headers of a stored file.
+    On S3 only the byte ranges actually read are downloaded.
+    """
+    if settings.STORAGE_BACKEND == "s3":
+        from music.services.s3_service import S3RangeReader
+
+        return S3RangeReader(path)
+
+    return default_storage.open(path, "rb")
+
+
+def ffmpeg_source(path):
+    """
+    What ffmpeg reads a stored file from: the local path, or an internal
+    presigned URL on S3 (ffmpeg fetches it over HTTP, no full download first).
+    """
+    if settings.STORAGE_BACKEND == "s3":
+        from music.services.s3_service import generate_internal_presigned_url
 
-    with default_storage.open(temp_path, "wb+") as destination:
-        for chunk in uploaded_file.chunks():
-            destination.write(chunk)
+        return generate_internal_presigned_url(path)
 
-    return temp_path
+    return default_storage.path(path)
 
 
 def move_to_final(temp_path, final_path):
+    # The name actually saved, which differs from `final_path` if it is taken
     with default_storage.open(temp_path, "rb") as src:
-        default_storage.save(final_path, src)
+        stored_path = default_storage.save(final_path, src)
 
     default_storage.delete(temp_path)
 
-    return final_path
+    return stored_path
 
 
 def delete_file(file_obj):
@@ -1,85 +1,396 @@
+import asyncio
 import re
+import secrets
 
 from django.conf import settings
 from django.core.files.storage import default_storage
-from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    FileResponse,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
+from django.urls import reverse
 from rest_framework import status
 
-RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)", re.I)
+RANGE_SPEC_RE = re.compile(r"^\s*(\d*)\s*-\s*(\d*)\s*$")
 CHUNK_SIZE = settings.CHUNK_SIZE
 
+# More ranges than this (after coalescing) are ignored and the full file is sent
+MAX_RANGES = 16
+
 
 def file_iterator(file, start, length, chunk_size=CHUNK_SIZE):
     """Iterator for streaming file chunks"""
+    return segments_iterator(file, [(start, length)], chunk_size)
+
+
+def segments_iterator(file, segments, chunk_size=CHUNK_SIZE):
+    """
+    Iterator over a sequence of segments, each either literal bytes
+    (multipart headers) or a `(start, length)` slice of the file.
+    """
     try:
-        file.seek(start)
-        remaining = length
-
-        while remaining > 0:
-            read_size = min(chunk_size, remaining)
-            data = file.read(read_size)
-            if not data:
-                break
-            remaining -= len(data)
-            yield data
+        for segment in segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+
+            start, length = segment
+            file.seek(start)
+            remaining = length
+
+            while remaining > 0:
+                data = file.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
     finally:
         file.close()
 
 
-def stream_file(request, file_path, content_type):
+async def async_segments_iterator(file, segments, chunk_size=CHUNK_SIZE):
+    """
+    Async counterpart of `segments_iterator` for ASGI servers.
+    Blocking reads are offloaded to a thread so the event loop keeps serving
+    other listeners while this one waits on disk.
+    """
+    try:
+        for segment in segments:
+            if isinstance(segment, bytes):
+                yield segment
+                continue
+
+            start, length = segment
+            await asyncio.to_thread(file.seek, start)
+            remaining = length
+
+            while remaining > 0:
+                data = await asyncio.to_thread(file.read, min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+    finally:
+        await asyncio.to_thread(file.close)
+
+
+def is_async_request(request):
+    """True when the request is being served by the ASGI handler."""
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+def body_iterator(request, file_path, segments):
+    """
+    Open `file_path` and return the iterator matching the server interface:
+    an async iterator under ASGI, a plain generator under WSGI.
+    """
+    file = default_storage.open(file_path, "rb")
+
+    if is_async_request(request):
+        return async_segments_iterator(file, segments)
+
+    return segments_iterator(file, segments)
+
+
+class RangeFile:
+    """
+    Read-bounded view over an open file starting at its current position.
+    Keeps `fileno()` so WSGI servers can still use os.sendfile for the range.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.name = getattr(file, "name", None)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def song_etag(song):
+    """Strong ETag for a song's stored audio, derived from its UUID and size."""
+    return f'"{song.song_uuid.hex}-{song.size}"'
+
+
+def get_stream_url(request, song, rendition=None):
+    """
+    URL the client should play `song` (or one of its renditions) from: a
+    (cached) presigned URL for S3, otherwise the direct streaming endpoint of
+    this backend.
+    """
+    if settings.STORAGE_BACKEND == "s3":
+        from music.services.rendition_service import stored_rendition
+        from music.services.s3_service import get_presigned_url
+
+        path = stored_rendition(song, rendition) if rendition else None
+        return get_presigned_url(path or song.file.name)
+
+    stream_path = reverse("song-stream", kwargs={"song_uuid": song.song_uuid})
+    query = "direct=1"
+    if rendition:
+        query += f"&bitrate={rendition.bitrate}&codec={rendition.codec}"
+    return request.build_absolute_uri(f"{stream_path}?{query}")
+
+
+def etag_matches(header_value, etag, weak=True):
+    """
+    Compare an If-None-Match / If-Range header value against `etag`.
+    Weak comparison ignores the `W/` prefix, strong comparison never matches it.
+    """
+    if not header_value or not etag:
+        return False
+
+    if header_value.strip() == "*":
+        return True
+
+    for candidate in header_value.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+
+    return False
+
+
+def parse_range_header(range_header, file_size):
+    """
+    Parse an RFC 7233 `Range` header into a sorted list of `(start, end)`
+    byte ranges, clamped to the file and with overlapping ranges merged.
+
+    Returns:
+        None if the header is malformed (it must then be ignored),
+        an empty list if no range is satisfiable (416),
+        otherwise the list of ranges.
+    """
+    unit, _, specs = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs.strip():
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        match = RANGE_SPEC_RE.match(spec)
+        if not match:
+            return None
+
+        first, last = match.groups()
+
+        if not first:
+            # Suffix range: `bytes=-N` → last N bytes
+            if not last:
+                return None
+            suffix_length = int(last)
+            if suffix_length == 0 or file_size == 0:
+                continue
+            ranges.append((max(file_size - suffix_length, 0), file_size - 1))
+            continue
+
+        start = int(first)
+        end = int(last) if last else file_size - 1
+
+        if last and end < start:
+            return None
+        if start >= file_size:
+            continue
+
+        ranges.append((start, min(end, file_size - 1)))
+
+    # Coalesce overlapping / adjacent ranges
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+
+    return merged
+
+
+def multipart_segments(ranges, file_size, content_type):
+    """
+    Build the `multipart/byteranges` body as segments for `segments_iterator`.
+
+    Returns:
+        (boundary, segments, content_length)
+    """
+    boundary = secrets.token_hex(16)
+    segments = []
+    content_length = 0
+
+    for start, end in ranges:
+        part_header = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{file_size}\r\n"
+            "\r\n"
+        ).encode()
+        length = end - start + 1
+
+        segments += [part_header, (start, length), b"\r\n"]
+        content_length += len(part_header) + length + 2
+
+    closing = f"--{boundary}--\r\n".encode()
+    segments.append(closing)
+    content_length += len(closing)
+
+    return boundary, segments, content_length
+
+
+def accel_redirect_response(file_path, content_type):
+    """
+    Authorize-only response: nginx serves the bytes from its `internal`
+    location (including Range handling) via X-Accel-Redirect.
+    """
+    response = HttpResponse(content_type=content_type)
+    response["X-Accel-Redirect"] = f"{settings.X_ACCEL_REDIRECT_PREFIX}{file_path}"
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+def sendfile_response(file_path, content_type, start, length, status_code):
+    """
+    FileResponse positioned at `start`, so the WSGI server's file_wrapper
+    can hand the transfer to os.sendfile instead of a Python loop.
+    """
+    file = default_storage.open(file_path, "rb")
+    file.seek(start)
+
+    response = FileResponse(
+        RangeFile(file, length), status=status_code, content_type=content_type
+    )
+    response["Content-Length"] = str(length)
+    return response
+
+
+def _set_cache_headers(response, etag):
+    response["Accept-Ranges"] = "bytes"
+    if etag:
+        # Revalidate on every use so If-None-Match / If-Range can kick in
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+    else:
+        response["Cache-Control"] = "no-store"
+    return response
+
+
+def stream_file(request, file_path, content_type, etag=None):
     if not default_storage.exists(file_path):
         return HttpResponse("File doesn't exist!", status=status.HTTP_404_NOT_FOUND)
 
     # S3 → return presigned URL as JSON (works better with Range requests)
     if settings.STORAGE_BACKEND == "s3":
-        from music.services.s3_service import generate_presigned_url
+        from music.services.s3_service import get_presigned_url
 
-        presigned_url = generate_presigned_url(file_path)
+        presigned_url = get_presigned_url(file_path)
         # Return presigned URL as JSON so frontend can set it directly as audio src
         # This allows the audio element to properly handle Range requests for seeking
         return JsonResponse({"url": presigned_url, "type": content_type})
 
+    delivery_mode = settings.STREAMING_DELIVERY_MODE
+
+    # os.sendfile needs the WSGI file_wrapper, ASGI uses the async iterator
+    if delivery_mode == "sendfile" and is_async_request(request):
+        delivery_mode = "python"
+
+    # nginx handles Range, conditionals and Content-Length itself
+    if delivery_mode == "x-accel":
+        return accel_redirect_response(file_path, content_type)
+
+    # Client already has this exact file
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        return _set_cache_headers(response, etag)
+
     file_size = default_storage.size(file_path)
     range_header = request.headers.get("Range")
 
+    # If-Range: only honour the Range if the client's copy is still current
+    if_range = request.headers.get("If-Range")
+    if range_header and if_range and not etag_matches(if_range, etag, weak=False):
+        range_header = None
+
+    ranges = parse_range_header(range_header, file_size) if range_header else None
+
+    if ranges == []:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response["Content-Range"] = f"bytes */{file_size}"
+        return _set_cache_headers(response, etag)
+
+    # Malformed, absent or abusive Range → full file
+    if not ranges or len(ranges) > MAX_RANGES:
+        ranges = None
+
     # HTTP Range support for efficient streaming and seeking
-    if not range_header:
+    if ranges is None:
         # No Range header → stream from start
-        file = default_storage.open(file_path, "rb")
-        response = StreamingHttpResponse(
-            file_iterator(file, 0, file_size),
-            content_type=content_type,
-        )
-        response["Accept-Ranges"] = "bytes"
+        if delivery_mode == "sendfile":
+            response = sendfile_response(
+                file_path, content_type, 0, file_size, status.HTTP_200_OK
+            )
+        else:
+            response = StreamingHttpResponse(
+                body_iterator(request, file_path, [(0, file_size)]),
+                content_type=content_type,
+            )
         response["Content-Length"] = str(file_size)
-        response["Cache-Control"] = "no-store"
-        return response
+        return _set_cache_headers(response, etag)
 
-    # Parse range header
-    match = RANGE_RE.match(range_header)
-    if not match:
-        return HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        length = end - start + 1
 
-    start = int(match.group(1))
-    end = match.group(2)
-    end = int(end) if end else file_size - 1
+        # Partial content response
+        if delivery_mode == "sendfile":
+            response = sendfile_response(
+                file_path,
+                content_type,
+                start,
+                length,
+                status.HTTP_206_PARTIAL_CONTENT,
+            )
+        else:
+            response = StreamingHttpResponse(
+                body_iterator(request, file_path, [(start, length)]),
+                status=status.HTTP_206_PARTIAL_CONTENT,
+                content_type=content_type,
+            )
 
-    if start >= file_size or start < 0:
-        return HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        response["Content-Length"] = str(length)
+        return _set_cache_headers(response, etag)
 
-    length = end - start + 1
-    file = default_storage.open(file_path, "rb")
-
-    # Partial content response
+    # Multiple ranges → multipart/byteranges
+    boundary, segments, content_length = multipart_segments(
+        ranges, file_size, content_type
+    )
     response = StreamingHttpResponse(
-        file_iterator(file, start, length),
+        body_iterator(request, file_path, segments),
         status=status.HTTP_206_PARTIAL_CONTENT,
-        content_type=content_type,
+        content_type=f"multipart/byteranges; boundary={boundary}",
     )
+    response["Content-Length"] = str(content_length)
 
-    response["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-    response["Accept-Ranges"] = "bytes"
-    response["Content-Length"] = str(length)
-    response["Cache-Control"] = "no-store"
-
-    return response
+    return _set_cache_headers(response, etag)
@@ -1,16 +1,65 @@
+import hashlib
 import io
-import uuid
+import posixpath
+import re
 
 from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.files.storage import default_storage
-from PIL import Image
+from django.db import transaction
+from PIL import Image, features
 
+from music.models import Album, Song
+from music.services.storage_service import delete_file
 
-def create_thumbnail(image_bytes, size=None):
+# Variants are stored as `thumbnails/<key>/<width>.<extension>`
+VARIANT_NAME_RE = re.compile(
+    r"^thumbnails/(?P<key>[^/]+)/(?P<width>\d+)\.(?P<ext>\w+)$"
+)
+
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp", "AVIF": "avif", "PNG": "png"}
+
+
+def create_thumbnail(image_bytes):
     """
-    Creates a thumbnail from raw image bytes and saves it to storage.
-    Returns the relative path to the saved thumbnail.
+    Creates a thumbnail and its size/format variants from raw image bytes
+    and saves them to storage. Thumbnails are addressed by the hash of the
+    source image, art already stored (e.g. by another track of the album)
+    is neither decoded nor encoded again.
+    Returns the relative path to the saved primary thumbnail.
+    """
+    if not image_bytes:
+        return None
+
+    key = thumbnail_key(image_bytes)
+    path = existing_thumbnail(key)
+    if path:
+        return path
+
+    variants = render_thumbnail(image_bytes)
+    if not variants:
+        return None
+
+    return save_thumbnail(variants, key)
+
+
+def thumbnail_key(image_bytes):
+    """SHA-256 (hex) of the source image, names its thumbnail directory."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def existing_thumbnail(key):
+    """Path of the primary thumbnail stored for `key`, or None."""
+    path = variant_path(key, *primary_variant())
+
+    return path if default_storage.exists(path) else None
+
+
+def render_thumbnail(image_bytes):
+    """
+    Resize and encode raw image bytes into every variant (CPU only, no
+    storage access).
+    Returns `{(width, extension): data}` or None if the image cannot be read.
     """
     if not image_bytes:
         return None
@@ -19,48 +68,226 @@ def create_thumbnail(image_bytes, size=None):
         # Load image from bytes
         img = Image.open(io.BytesIO(image_bytes))
 
+        thumbnail_settings = getattr(settings, "THUMBNAIL_SETTINGS", {})
+        primary = primary_variant()
+        formats = _variant_formats()
+        widths = sorted(
+            set(thumbnail_settings.get("VARIANT_SIZES", ())) | {primary[0]},
+            reverse=True,
+        )
+
+        # JPEG sources can be decoded directly at a reduced scale
+        img.draft("RGB", (widths[0], widths[0]))
+
         # Convert to RGB if necessary (e.g., for PNG with transparency)
-        if img.mode in ("RGBA", "P"):
+        if img.mode not in ("RGB", "L"):
             img = img.convert("RGB")
 
-        # Get settings
-        thumbnail_settings = getattr(settings, "THUMBNAIL_SETTINGS", {})
-        thumbnail_size = size or thumbnail_settings.get("SIZE", (200, 200))
-        thumbnail_format = thumbnail_settings.get("FORMAT", "JPEG")
-        thumbnail_quality = thumbnail_settings.get("QUALITY", 95)
-        thumbnail_optimize = thumbnail_settings.get("OPTIMIZE", True)
+        variants = {}
+        for width in widths:
+            # Largest first, each size is resized from the previous one
+            img.thumbnail((width, width))
+
+            for thumbnail_format in formats:
+                variants[(width, extension_for(thumbnail_format))] = _encode(
+                    img,
+                    thumbnail_format,
+                    thumbnail_settings.get("VARIANT_QUALITY", 80),
+                )
+
+            if width == primary[0]:
+                # Encoded last, with the primary quality, so it wins on overlap
+                variants[primary] = _encode(
+                    img,
+                    thumbnail_settings.get("FORMAT", "JPEG"),
+                    thumbnail_settings.get("QUALITY", 95),
+                )
+
+        return variants
+    except Exception as e:
+        print(f"Error creating thumbnail: {e}")
+        return None
+
+
+def save_thumbnail(variants, key):
+    """
+    Save rendered variants under `thumbnails/<key>/`, skipping the ones
+    already stored, returns the path of the primary thumbnail.
+    """
+    primary = primary_variant()
+
+    primary_path = None
+    for (width, extension), data in variants.items():
+        path = variant_path(key, width, extension)
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(data))
+        if (width, extension) == primary:
+            primary_path = path
+
+    return primary_path
+
 
-        # Resize
-        img.thumbnail(thumbnail_size)
+def release_thumbnail(path):
+    """
+    Delete a thumbnail and its variants once no Song or Album uses it
+    anymore. Call after the referencing row is deleted.
+    """
+    path = str(path or "")
+    if not path:
+        return
 
-        # Save to buffer
-        buffer = io.BytesIO()
+    with transaction.atomic():
+        # Held until commit: a concurrent claim_thumbnail either committed
+        # its reference before this check or finds the files deleted
+        lock_thumbnail(path)
 
-        # Prepare save arguments based on format
-        save_kwargs = {"format": thumbnail_format}
+        if (
+            Song.objects.filter(thumbnail=path).exists()
+            or Album.objects.filter(cover_image=path).exists()
+        ):
+            return
 
-        if thumbnail_format.upper() == "JPEG":
-            save_kwargs.update(
-                {"quality": thumbnail_quality, "optimize": thumbnail_optimize}
-            )
-        elif thumbnail_format.upper() == "PNG":
-            save_kwargs.update({"optimize": thumbnail_optimize})
-        elif thumbnail_format.upper() == "WEBP":
-            save_kwargs.update(
-                {"quality": thumbnail_quality, "optimize": thumbnail_optimize}
-            )
+        delete_thumbnail(path)
 
-        img.save(buffer, **save_kwargs)
-        buffer.seek(0)
 
-        # Generate unique filename with appropriate extension
-        extension = thumbnail_format.lower().replace("jpeg", "jpg")
-        filename = f"thumbnails/{uuid.uuid4()}.{extension}"
+def claim_thumbnail(path, image_bytes=None, variants=None):
+    """
+    Lock the thumbnail at `path` for a new reference. Call in the
+    transaction that saves the referencing row.
 
-        # Save to storage
-        path = default_storage.save(filename, ContentFile(buffer.read()))
+    The thumbnail may have been released since it was looked up, its
+    variants are then stored again (`variants`, or rendered from
+    `image_bytes`).
 
+    Returns:
+        `path` to reference, or None if the thumbnail is gone and cannot be
+        restored
+    """
+    path = str(path or "")
+    if not path:
+        return None
+
+    lock_thumbnail(path)
+    if default_storage.exists(path):
         return path
-    except Exception as e:
-        print(f"Error creating thumbnail: {e}")
+
+    if variants is None:
+        variants = render_thumbnail(image_bytes)
+    match = VARIANT_NAME_RE.match(path)
+    if not variants or not match:
         return None
+
+    return save_thumbnail(variants, match["key"])
+
+
+def lock_thumbnail(path):
+    """
+    Transaction-scoped lock serializing `release_thumbnail` with new
+    references to `path`. PostgreSQL only: SQLite (development and tests)
+    runs one writer at a time.
+    """
+    connection = transaction.get_connection()
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(hashtext(%s))", [f"thumbnail:{path}"]
+        )
+
+
+def delete_thumbnail(path):
+    """Delete a thumbnail together with all of its variants."""
+    for variant in variant_paths(path):
+        if variant != str(path):
+            delete_file(variant)
+
+    delete_file(path)
+
+
+def thumbnail_srcsets(path, build_url=None):
+    """
+    `srcset` strings of a thumbnail's variants per image format, e.g.
+    `{"webp": "<url> 64w, <url> 200w, <url> 600w"}`. Storage URLs are passed
+    through `build_url` (e.g. `request.build_absolute_uri`) when given.
+    Thumbnails stored before variants existed have none.
+    """
+    variants = {}
+    for variant in variant_paths(path):
+        match = VARIANT_NAME_RE.match(variant)
+        url = default_storage.url(variant)
+        if build_url:
+            url = build_url(url)
+        variants.setdefault(match["ext"], []).append(f"{url} {match['width']}w")
+
+    return {extension: ", ".join(urls) for extension, urls in variants.items()}
+
+
+def variant_paths(path):
+    """Storage paths of every configured variant of the thumbnail at `path`."""
+    match = VARIANT_NAME_RE.match(str(path or ""))
+    if not match:
+        return []
+
+    thumbnail_settings = getattr(settings, "THUMBNAIL_SETTINGS", {})
+
+    return [
+        variant_path(match["key"], width, extension_for(thumbnail_format))
+        for thumbnail_format in _variant_formats()
+        for width in sorted(thumbnail_settings.get("VARIANT_SIZES", ()))
+    ]
+
+
+def variant_path(key, width, extension):
+    return posixpath.join("thumbnails", key, f"{width}.{extension}")
+
+
+def primary_variant():
+    thumbnail_settings = getattr(settings, "THUMBNAIL_SETTINGS", {})
+    width = thumbnail_settings.get("SIZE", (200, 200))[0]
+
+    return width, extension_for(thumbnail_settings.get("FORMAT", "JPEG"))
+
+
+def extension_for(thumbnail_format):
+    thumbnail_format = thumbnail_format.upper()
+    return EXTENSIONS.get(thumbnail_format, thumbnail_format.lower())
+
+
+def is_format_supported(thumbnail_format):
+    """AVIF needs a Pillow build with libavif."""
+    if thumbnail_format.upper() == "AVIF":
+        return bool(features.check("avif"))
+    return True
+
+
+def _variant_formats():
+    thumbnail_settings = getattr(settings, "THUMBNAIL_SETTINGS", {})
+
+    return [
+        thumbnail_format
+        for thumbnail_format in thumbnail_settings.get("VARIANT_FORMATS", ())
+        if is_format_supported(thumbnail_format)
+    ]
+
+
+def _encode(img, thumbnail_format, quality):
+    thumbnail_settings = getattr(settings, "THUMBNAIL_SETTINGS", {})
+    thumbnail_optimize = thumbnail_settings.get("OPTIMIZE", True)
+
+    # Prepare save arguments based on format
+    save_kwargs = {"format": thumbnail_format}
+
+    if thumbnail_format.upper() == "JPEG":
+        save_kwargs.update({"quality": quality, "optimize": thumbnail_optimize})
+    elif thumbnail_format.upper() == "PNG":
+        save_kwargs.update({"optimize": thumbnail_optimize})
+    elif thumbnail_format.upper() == "WEBP":
+        save_kwargs.update({"quality": quality, "method": 4})
+    elif thumbnail_format.upper() == "AVIF":
+        save_kwargs.update({"quality": quality})
+
+    buffer = io.BytesIO()
+    img.save(buffer, **save_kwargs)
+
+    return buffer.getvalue()
@@ -1,127 +1,230 @@
 import os
+import shutil
 import tempfile
-import uuid
 
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.db import transaction
 
-from music.models import Album, Artist, Song
-from music.services.metadata_service import extract_metadata, strip_metadata
-from music.services.storage_service import move_to_final, save_temp_file
-from music.services.thumbnail_service import create_thumbnail
-
-
-def upload_song(file, user):
-    # 1. Save temp file
-    temp_path = save_temp_file(file)
+from music.models import Song
+from music.services.blob_service import acquire_blob, hash_local_file, release_blob
+from music.services.catalog_service import ArtistAlbumResolver
+from music.services.loudness_service import analyze_loudness, apply_loudness
+from music.services.metadata_service import process_audio
+from music.services.rendition_service import generate_renditions
+from music.services.storage_service import delete_file, move_to_final
+from music.services.thumbnail_service import (
+    claim_thumbnail,
+    create_thumbnail,
+    release_thumbnail,
+)
+from music.services.waveform_service import generate_waveform, save_waveform
+
+
+def process_uploaded_file(temp_path, original_name, user, delete_temp_on_error=True):
+    """
+    Turn a file already stored under `tmp/` into a Song: strip metadata,
+    resolve artist/album, store the audio under `songs/` (content-addressed,
+    identical audio is stored once) and create the record.
+
+    The Song is created last, flagged `is_upload_complete`, once every other
+    stage has run, so listings never see partial songs. The temp file is
+    removed on success, and on failure unless the caller keeps it for a
+    retry (`delete_temp_on_error=False`).
+    """
+    ext = os.path.splitext(original_name)[1]
 
     try:
         # 2. Extract metadata and strip metadata
         if settings.STORAGE_BACKEND == "s3":
             # For S3 storage:
-            # 1. Download from S3 to temporary local file
-            # 2. Extract and strip metadata from local file
-            # 3. Upload the stripped file back to S3 temp location
-            # 4. Move to final location
-
-            with tempfile.NamedTemporaryFile(
-                delete=False, suffix=os.path.splitext(file.name)[1]
-            ) as tmp_file:
+            # 1. Stream the object from S3 into a temporary local file
+            # 2. Probe and strip metadata on the local file
+            # 3. Upload the stripped file to its content-addressed location,
+            #    unless identical audio is already stored
+
+            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp_file:
                 local_temp_path = tmp_file.name
                 with default_storage.open(temp_path, "rb") as s3_file:
-                    tmp_file.write(s3_file.read())
+                    shutil.copyfileobj(s3_file, tmp_file, settings.CHUNK_SIZE * 128)
 
             try:
-                # Extract metadata from the local file
-                metadata = extract_metadata(local_temp_path)
-
-                # Strip metadata from the local file
-                strip_metadata(local_temp_path)
-
-                # Upload the stripped file back to S3 temp location (overwrite)
-                with open(local_temp_path, "rb") as stripped_file:
-                    default_storage.save(temp_path, stripped_file)
+                audio, content_hash = prepare_audio(local_temp_path)
+                song = store_song(
+                    user,
+                    original_name,
+                    audio,
+                    content_hash,
+                    local_temp_path,
+                    save_local_file(local_temp_path),
+                )
             finally:
                 # Clean up the local temp file
                 if os.path.exists(local_temp_path):
                     os.unlink(local_temp_path)
         else:
-            # For local storage, strip metadata directly on the temp file
-            temp_path_full = default_storage.path(temp_path)
-            metadata = extract_metadata(temp_path_full)
-            strip_metadata(temp_path_full)
-
-        title = metadata.get("title") or os.path.splitext(file.name)[0]
-        artist_name = metadata.get("artist") or "Unknown Artist"
-        album_title = metadata.get("album")
-        album_art = metadata.get("album_art")
-
-        # 3. Resolve artist
-        artist, _ = Artist.objects.get_or_create(
-            name__iexact=artist_name,
-            created_by=user,
-            defaults={"name": artist_name},
-        )
-
-        # 4. Resolve album
-        album = None
-        if album_title:
-            album, _ = Album.objects.get_or_create(
-                artist=artist,
-                title__iexact=album_title,
-                created_by=user,
-                defaults={
-                    "title": album_title,
-                    "artist": artist,
-                },
+            # For local storage, strip metadata directly on the temp file,
+            # then move it (now with metadata stripped) to permanent storage
+            audio, content_hash = prepare_audio(default_storage.path(temp_path))
+            song = store_song(
+                user,
+                original_name,
+                audio,
+                content_hash,
+                None,
+                lambda path: move_to_final(temp_path, path),
             )
 
-        # 5. Generate UUID
-        song_uuid = uuid.uuid4()
-
-        # 6. Final storage path
-        ext = os.path.splitext(file.name)[1]
-        final_path = f"songs/{song_uuid}{ext}"
-
-        # 7. Move file (now with metadata stripped) to permanent storage
-        move_to_final(temp_path, final_path)
-
-        # 7.5 Create thumbnail if art exists
-        thumbnail_path = None
-        if album_art:
-            thumbnail_path = create_thumbnail(album_art)
-
-        file_size = default_storage.size(final_path)
-
-        is_uploaded_to_cloud = settings.STORAGE_BACKEND == "s3"
-
-        # 8. Create DB record atomically
-        with transaction.atomic():
-            song = Song.objects.create(
-                song_uuid=song_uuid,
-                title=title,
-                file=final_path,
-                artist=artist,
-                album=album,
-                duration=metadata["duration"],
-                size=file_size,
-                mime_type=metadata["mime_type"],
-                uploaded_by=user,
-                is_uploaded_to_cloud=is_uploaded_to_cloud,
-                is_upload_complete=True,
-                thumbnail=thumbnail_path,
-            )
+    except Exception:
+        # cleanup temp file
+        if delete_temp_on_error:
+            delete_file(temp_path)
+        raise
 
-            # Optional: Update album cover if it doesn't have one
-            if album and not album.cover_image and thumbnail_path:
-                album.cover_image = thumbnail_path
-                album.save()
+    # Still there if identical audio was already stored
+    delete_file(temp_path)
+
+    return song
+
+
+def store_song(
+    user,
+    original_name,
+    audio,
+    content_hash,
+    local_path,
+    store,
+    resolver=None,
+    waveform=None,
+    thumbnail_path=None,
+    thumbnail_variants=None,
+):
+    """
+    Everything after `prepare_audio`, shared by uploads and `import_library`:
+    store the audio (`store(path)` writes it unless identical audio is
+    already stored), its waveform peaks and eager renditions, the thumbnail
+    of `audio.album_art`, then create the Song.
+
+    `local_path` is the prepared local copy, None if `store` moved it into
+    local storage. Work done ahead (by import workers) is passed in: the
+    `waveform` bytes, and the `thumbnail_path` with its rendered
+    `thumbnail_variants`. See `create_song` for `resolver`.
+
+    The audio and thumbnail references are released if the Song cannot be
+    created.
+    """
+    ext = os.path.splitext(original_name)[1]
+    blob = None
 
-        return song
+    try:
+        blob, _ = acquire_blob(content_hash, audio.size, ext, store)
+        if local_path is None:
+            local_path = default_storage.path(blob.file.name)
 
+        if waveform:
+            save_waveform(blob.file.name, waveform)
+        else:
+            generate_waveform(local_path, blob.file.name)
+        generate_renditions(local_path, content_hash, audio)
+
+        # 3. Create thumbnail if art exists
+        if thumbnail_path is None and audio.album_art:
+            thumbnail_path = create_thumbnail(audio.album_art)
+
+        return create_song(
+            user,
+            original_name,
+            audio,
+            blob,
+            thumbnail_path,
+            resolver=resolver,
+            thumbnail_variants=thumbnail_variants,
+        )
     except Exception:
-        # cleanup temp file
-        if default_storage.exists(temp_path):
-            default_storage.delete(temp_path)
+        # Stored audio and art without a Song record
+        if blob is not None:
+            release_blob(blob.content_hash)
+        release_thumbnail(thumbnail_path)
         raise
+
+
+def prepare_audio(local_path):
+    """
+    CPU-bound part of an upload: probe and strip `local_path` in place, hash
+    the result and measure its loudness. Touches neither the database nor
+    storage, so it can run in worker processes.
+
+    Returns:
+        (AudioInfo, content_hash)
+    """
+    audio = process_audio(local_path)
+    audio.loudness = analyze_loudness(local_path)
+    return audio, hash_local_file(local_path)
+
+
+def save_local_file(local_path):
+    """`acquire_blob` store callback uploading a local file to storage."""
+
+    def store(path):
+        with open(local_path, "rb") as file:
+            return default_storage.save(path, file)
+
+    return store
+
+
+def create_song(
+    user,
+    original_name,
+    audio,
+    blob,
+    thumbnail_path=None,
+    resolver=None,
+    thumbnail_variants=None,
+):
+    """
+    Create the (complete) Song record for stored audio, resolving
+    its artist and album from the tags. Pass the same `resolver` across a
+    batch to resolve each artist and album once.
+
+    The thumbnail is restored from `audio.album_art` or `thumbnail_variants`
+    if it was released since it was looked up.
+    """
+    title = audio.title or os.path.splitext(original_name)[0]
+    artist_name = audio.artist or "Unknown Artist"
+
+    # 4. Resolve artist and album
+    if resolver is None:
+        resolver = ArtistAlbumResolver(user)
+    artist, album = resolver.resolve(artist_name, audio.album)
+
+    is_uploaded_to_cloud = settings.STORAGE_BACKEND == "s3"
+
+    song = Song(
+        title=title,
+        file=blob.file.name,
+        artist=artist,
+        album=album,
+        duration=audio.duration,
+        size=audio.size,
+        mime_type=audio.mime_type,
+        uploaded_by=user,
+        is_uploaded_to_cloud=is_uploaded_to_cloud,
+        is_upload_complete=True,
+        content_hash=blob.content_hash,
+    )
+    apply_loudness(song, audio.loudness)
+
+    # 5. Create DB record atomically
+    with transaction.atomic():
+        thumbnail_path = claim_thumbnail(
+            thumbnail_path, audio.album_art, thumbnail_variants
+        )
+        song.thumbnail = thumbnail_path
+        song.save()
+
+        # Optional: Update album cover if it doesn't have one
+        if album and not album.cover_image and thumbnail_path:
+            album.cover_image = thumbnail_path
+            album.save()
+
+    return song
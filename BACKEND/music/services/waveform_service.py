@@ -0,0 +1,191 @@
+import posixpath
+import struct
+import subprocess
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from music.services.metadata_service import FFMPEG_TIMEOUT
+from music.services.storage_service import delete_file
+
+# Audio is decoded to mono 16-bit PCM at this rate, plenty for drawing
+SAMPLE_RATE = 11025
+# Samples per peak of the finest level (~43 peaks/s), each further level is
+# LEVEL_FACTOR times coarser
+SAMPLES_PER_PEAK = 256
+LEVEL_FACTOR = 4
+LEVELS = 4
+
+MAGIC = b"SNWF"
+VERSION = 1
+
+# Peaks of this many finest-level blocks are computed per pipe read
+READ_BLOCKS = 1024
+
+
+def waveform_path(audio_path):
+    """Sidecar path next to the stored audio: `songs/<name>.peaks`."""
+    return posixpath.splitext(str(audio_path))[0] + ".peaks"
+
+
+def waveform_exists(audio_path):
+    return default_storage.exists(waveform_path(audio_path))
+
+
+def generate_waveform(local_path, audio_path):
+    """
+    Compute and store the peaks sidecar of the audio stored at `audio_path`
+    from its local copy `local_path`. Audio is content-addressed, so a sidecar
+    that already exists is kept. Failures are reported, never raised: a song
+    without a waveform still plays.
+
+    Returns the sidecar path, or None.
+    """
+    if not settings.WAVEFORM_ENABLED:
+        return None
+
+    if waveform_exists(audio_path):
+        return waveform_path(audio_path)
+
+    data = render_waveform(local_path)
+    if data is None:
+        return None
+
+    return save_waveform(audio_path, data)
+
+
+def render_waveform(local_path):
+    """
+    Decode `local_path` once with ffmpeg and encode its peaks (CPU only, no
+    storage access). Returns the sidecar bytes, or None on failure.
+    """
+    try:
+        mins, maxs = compute_peaks(local_path)
+    except Exception as e:
+        print(f"Error computing waveform: {e}")
+        return None
+
+    return encode_peaks(mins, maxs)
+
+
+def save_waveform(audio_path, data):
+    path = waveform_path(audio_path)
+    if default_storage.exists(path):
+        return path
+
+    return default_storage.save(path, ContentFile(data))
+
+
+def delete_waveform(audio_path):
+    delete_file(waveform_path(audio_path))
+
+
+def compute_peaks(local_path):
+    """
+    Finest-level min/max (int16) per `SAMPLES_PER_PEAK` samples. PCM is read
+    from the ffmpeg pipe in bounded chunks, memory does not grow with the
+    song length beyond the peaks themselves.
+
+    Returns:
+        (mins, maxs) NumPy arrays
+    """
+    process = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-v",
+            "error",
+            "-i",
+            local_path,
+            "-vn",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "-f",
+            "s16le",
+            "-acodec",
+            "pcm_s16le",
+            "pipe:1",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+    block_bytes = SAMPLES_PER_PEAK * 2
+    mins, maxs = [], []
+    pending = b""
+
+    try:
+        while True:
+            chunk = process.stdout.read(block_bytes * READ_BLOCKS)
+            if not chunk:
+                break
+
+            pending += chunk
+            usable = len(pending) - len(pending) % block_bytes
+            if usable:
+                _reduce_blocks(pending[:usable], mins, maxs)
+                pending = pending[usable:]
+
+        # Last, partial block
+        pending = pending[: len(pending) - len(pending) % 2]
+        if pending:
+            samples = np.frombuffer(pending, dtype="<i2")
+            mins.append(samples.min(keepdims=True))
+            maxs.append(samples.max(keepdims=True))
+
+        if process.wait(timeout=FFMPEG_TIMEOUT) != 0:
+            raise subprocess.CalledProcessError(process.returncode, "ffmpeg")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+    if not mins:
+        raise ValueError("No audio decoded")
+
+    return np.concatenate(mins), np.concatenate(maxs)
+
+
+def _reduce_blocks(data, mins, maxs):
+    blocks = np.frombuffer(data, dtype="<i2").reshape(-1, SAMPLES_PER_PEAK)
+    mins.append(blocks.min(axis=1))
+    maxs.append(blocks.max(axis=1))
+
+
+def encode_peaks(mins, maxs):
+    """
+    Binary sidecar, little-endian:
+
+        header   "SNWF", version (u8), level count (u8), sample rate (u32)
+        levels   samples per peak (u32), peak count (u32), per level
+        data     per level in order, `peak count` pairs of (min, max) as int8
+
+    Level 0 is the finest, every next level is `LEVEL_FACTOR` times coarser.
+    """
+    # int16 -> int8, the drawing resolution needs no more
+    mins = (mins >> 8).astype(np.int8)
+    maxs = (maxs >> 8).astype(np.int8)
+
+    levels = []
+    samples_per_peak = SAMPLES_PER_PEAK
+    for _ in range(LEVELS):
+        levels.append((samples_per_peak, np.column_stack((mins, maxs))))
+        if len(mins) <= 1:
+            break
+
+        starts = np.arange(0, len(mins), LEVEL_FACTOR)
+        mins = np.minimum.reduceat(mins, starts)
+        maxs = np.maximum.reduceat(maxs, starts)
+        samples_per_peak *= LEVEL_FACTOR
+
+    header = struct.pack("<4sBBI", MAGIC, VERSION, len(levels), SAMPLE_RATE)
+    header += b"".join(
+        struct.pack("<II", samples_per_peak, len(peaks))
+        for samples_per_peak, peaks in levels
+    )
+
+    return header + b"".join(peaks.tobytes() for _, peaks in levels)
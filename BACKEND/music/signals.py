@@ -1,8 +1,19 @@
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from music.models import Album, Song
+from music.models import Album, Artist, Song
+from music.services.blob_service import release_blob
+from music.services.hls_service import delete_hls
+from music.services.rendition_service import delete_renditions
+from music.services.search_index_service import (
+    index_album,
+    index_artist,
+    index_song,
+    update_index,
+)
 from music.services.storage_service import delete_file
+from music.services.thumbnail_service import release_thumbnail
+from music.services.waveform_service import delete_waveform
 
 
 @receiver(post_delete, sender=Song)
@@ -10,10 +21,17 @@ def delete_song_files(sender, instance, **kwargs):
     """
     Automatically delete audio file and thumbnail when a Song is deleted.
     """
-    if instance.file:
+    if instance.content_hash:
+        # Audio is shared between identical uploads, drop this reference
+        release_blob(instance.content_hash)
+    elif instance.file:
         delete_file(instance.file)
+        delete_waveform(instance.file.name)
+        delete_renditions(instance.song_uuid.hex)
+        delete_hls(instance.song_uuid.hex)
     if instance.thumbnail:
-        delete_file(instance.thumbnail)
+        # Art is shared by songs of an album and the album cover
+        release_thumbnail(instance.thumbnail)
 
     # Cleanup orphaned Album
     if instance.album:
@@ -32,4 +50,34 @@ def delete_album_files(sender, instance, **kwargs):
     Automatically delete cover image when an Album is deleted.
     """
     if instance.cover_image:
-        delete_file(instance.cover_image)
+        release_thumbnail(instance.cover_image)
+
+
+@receiver(post_save, sender=Song)
+def index_saved_song(sender, instance, **kwargs):
+    index_song(instance)
+
+
+@receiver(post_save, sender=Artist)
+def index_saved_artist(sender, instance, **kwargs):
+    index_artist(instance)
+
+
+@receiver(post_save, sender=Album)
+def index_saved_album(sender, instance, **kwargs):
+    index_album(instance)
+
+
+@receiver(post_delete, sender=Song)
+def unindex_song(sender, instance, **kwargs):
+    update_index(instance.uploaded_by_id, ("song", instance.pk))
+
+
+@receiver(post_delete, sender=Artist)
+def unindex_artist(sender, instance, **kwargs):
+    update_index(instance.created_by_id, ("artist", instance.pk))
+
+
+@receiver(post_delete, sender=Album)
+def unindex_album(sender, instance, **kwargs):
+    update_index(instance.created_by_id, ("album", instance.pk))
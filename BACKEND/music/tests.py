@@ -1,3 +1,1276 @@
-# from django.test import TestCase
+import base64
+import hashlib
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from botocore.exceptions import ClientError
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage, default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIRequestFactory, force_authenticate
+from storages.utils import ReadBytesWrapper, is_seekable
+
+from music.management.commands import import_library
+from music.models import (
+    Album,
+    Artist,
+    AudioBlob,
+    Playlist,
+    PlaylistSong,
+    ProcessingJob,
+    SharedSong,
+    Song,
+    UploadSession,
+)
+from music.serializers import AlbumSongModelSerializer, ArtistSongModelSerializer
+from music.services import blob_service, s3_service, search_index_service
+from music.services.blob_service import acquire_blob, release_blob
+from music.services.catalog_service import ArtistAlbumResolver
+from music.services.metadata_service import AudioInfo
+from music.services.resumable_upload_service import (
+    ChecksumMismatch,
+    ChunkConflict,
+    assemble_upload,
+    claim_session,
+    delete_session_parts,
+    expire_sessions,
+    session_prefix,
+    write_chunk,
+)
+from music.services.s3_service import get_presigned_url
+from music.services.search_index_service import UserSearchIndex, get_index, trigrams
+from music.services.shuffle_service import shuffle_queue
+from music.services.storage_service import direct_upload_prefix, move_to_final
+from music.services.streaming_service import (
+    etag_matches,
+    multipart_segments,
+    parse_range_header,
+    stream_file,
+)
+from music.services.thumbnail_service import (
+    claim_thumbnail,
+    create_thumbnail,
+    release_thumbnail,
+)
+from music.views import (
+    PlaybackQueueView,
+    PlaylistSongView,
+    ResumableUploadView,
+    SearchView,
+    SharedSongsView,
+    SongDirectUploadCompleteView,
+    SongStreamView,
+    SongView,
+)
+
+User = get_user_model()
+
+
+class S3LikeStorage(InMemoryStorage):
+    """In-memory storage that takes content the way S3Storage._save does."""
+
+    def _save(self, name, content):
+        if is_seekable(content):
+            content.seek(0, os.SEEK_SET)
+
+        return super()._save(name, ContentFile(ReadBytesWrapper(content).read()))
+
+
+S3_LIKE_STORAGES = {
+    "default": {"BACKEND": "music.tests.S3LikeStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+class RangeParsingTests(TestCase):
+    def test_single_and_open_ranges(self):
+        self.assertEqual(parse_range_header("bytes=0-99", 1000), [(0, 99)])
+        self.assertEqual(parse_range_header("bytes=900-", 1000), [(900, 999)])
+        self.assertEqual(parse_range_header("bytes=900-5000", 1000), [(900, 999)])
+
+    def test_suffix_ranges(self):
+        self.assertEqual(parse_range_header("bytes=-100", 1000), [(900, 999)])
+        self.assertEqual(parse_range_header("bytes=-5000", 1000), [(0, 999)])
+        self.assertEqual(parse_range_header("bytes=-0", 1000), [])
+
+    def test_unsatisfiable_ranges(self):
+        self.assertEqual(parse_range_header("bytes=1000-", 1000), [])
+        self.assertEqual(parse_range_header("bytes=2000-3000", 1000), [])
+        # Satisfiable ranges of the set are kept
+        self.assertEqual(parse_range_header("bytes=2000-,0-9", 1000), [(0, 9)])
+
+    def test_overlapping_and_adjacent_ranges_are_coalesced(self):
+        self.assertEqual(
+            parse_range_header("bytes=50-99,0-9,10-19,60-70", 1000),
+            [(0, 19), (50, 99)],
+        )
+
+    def test_malformed_headers_are_ignored(self):
+        for header in ("items=0-9", "bytes=", "bytes=a-b", "bytes=-", "bytes=9-0"):
+            with self.subTest(header=header):
+                self.assertIsNone(parse_range_header(header, 1000))
+
+    def test_etag_comparison(self):
+        self.assertTrue(etag_matches('"a", "b"', '"b"'))
+        self.assertTrue(etag_matches("*", '"b"'))
+        self.assertTrue(etag_matches('W/"b"', '"b"'))
+        self.assertFalse(etag_matches('W/"b"', '"b"', weak=False))
+        self.assertFalse(etag_matches(None, '"b"'))
+
+    def test_multipart_content_length_matches_body(self):
+        data = bytes(range(256)) * 4
+        ranges = [(0, 9), (100, 199), (1000, 1023)]
+
+        boundary, segments, content_length = multipart_segments(
+            ranges, len(data), "audio/mpeg"
+        )
+
+        body = b"".join(
+            (
+                segment
+                if isinstance(segment, bytes)
+                else data[segment[0] : segment[0] + segment[1]]
+            )
+            for segment in segments
+        )
+        self.assertEqual(len(body), content_length)
+        self.assertTrue(body.endswith(f"--{boundary}--\r\n".encode()))
+        self.assertIn(
+            b"Content-Range: bytes 100-199/1024\r\n\r\n" + data[100:200], body
+        )
+
+
+@override_settings(
+    STORAGE_BACKEND="local",
+    STORAGES=S3_LIKE_STORAGES,
+    STREAMING_DELIVERY_MODE="python",
+)
+class StreamFileTests(TestCase):
+    etag = '"song-1024"'
+
+    def setUp(self):
+        self.data = os.urandom(1024)
+        self.path = default_storage.save("songs/range.mp3", ContentFile(self.data))
+
+    def tearDown(self):
+        default_storage.delete(self.path)
+
+    def stream(self, **headers):
+        request = RequestFactory().get("/", headers=headers)
+        response = stream_file(request, self.path, "audio/mpeg", self.etag)
+        body = b"".join(response) if response.streaming else response.content
+        return response, body
+
+    def test_full_file(self):
+        response, body = self.stream()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response["Content-Length"], "1024")
+        self.assertEqual(response["ETag"], self.etag)
+
+    def test_single_range(self):
+        response, body = self.stream(Range="bytes=-24")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[1000:])
+        self.assertEqual(response["Content-Range"], "bytes 1000-1023/1024")
+        self.assertEqual(response["Content-Length"], "24")
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.stream(Range="bytes=1024-")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */1024")
+
+    def test_malformed_range_sends_full_file(self):
+        response, body = self.stream(Range="bytes=oops")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+
+    def test_multiple_ranges(self):
+        response, body = self.stream(Range="bytes=0-9,20-29")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response["Content-Type"].startswith("multipart/byteranges"))
+        self.assertEqual(response["Content-Length"], str(len(body)))
+        self.assertIn(self.data[20:30], body)
+
+    def test_if_none_match(self):
+        response, body = self.stream(If_None_Match=self.etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b"")
+
+    def test_if_range_uses_strong_comparison(self):
+        response, _ = self.stream(Range="bytes=0-9", If_Range=self.etag)
+        self.assertEqual(response.status_code, 206)
+
+        response, body = self.stream(Range="bytes=0-9", If_Range=f"W/{self.etag}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+
+        response, _ = self.stream(Range="bytes=0-9", If_Range='"changed"')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(
+    AWS_S3_ENDPOINT_URL="http://minio:9000",
+    AWS_S3_PUBLIC_ENDPOINT_URL="http://localhost:9000",
+    S3_PRESIGNED_URL_EXPIRATION=3600,
+)
+class PresignedUrlCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        urls = (f"https://s3.example.com/song.mp3?v={i}" for i in range(10))
+        patcher = mock.patch.object(
+            s3_service, "generate_presigned_url", side_effect=lambda *_: next(urls)
+        )
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_url_at(self, now):
+        with mock.patch("time.time", return_value=now):
+            return get_presigned_url("songs/song.mp3")
+
+    @override_settings(S3_PRESIGNED_URL_REUSE_FRACTION=0.5)
+    def test_url_is_reused_within_the_window_only(self):
+        first = self.get_url_at(1000)
+
+        self.assertEqual(self.get_url_at(1000 + 1799), first)
+        self.assertNotEqual(self.get_url_at(1000 + 1800), first)
+        self.assertEqual(self.generate.call_count, 2)
+
+    @override_settings(S3_PRESIGNED_URL_REUSE_FRACTION=1.5)
+    def test_reuse_never_reaches_the_expiry(self):
+        first = self.get_url_at(1000)
+
+        self.assertEqual(self.get_url_at(1000 + 3239), first)
+        self.assertNotEqual(self.get_url_at(1000 + 3240), first)
+
+    @override_settings(S3_PRESIGNED_URL_REUSE_FRACTION=0)
+    def test_zero_fraction_disables_caching(self):
+        self.assertNotEqual(self.get_url_at(1000), self.get_url_at(1000))
+
+
+@override_settings(
+    STORAGE_BACKEND="s3",
+    STORAGES=S3_LIKE_STORAGES,
+    UPLOAD_PROCESSING_MODE="queue",
+    DIRECT_UPLOAD_MAX_SIZE=1024,
+)
+class DirectUploadCompleteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="direct", email="d@example.com")
+        self.key = f"{direct_upload_prefix(self.user)}{os.urandom(8).hex()}.mp3"
+
+        patcher = mock.patch.object(s3_service, "abort_multipart_upload")
+        self.abort = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def complete(self, error_code=None):
+        def complete_multipart_upload(key, upload_id, parts):
+            if error_code:
+                raise ClientError(
+                    {"Error": {"Code": error_code}}, "CompleteMultipartUpload"
+                )
+
+        request = APIRequestFactory().post(
+            "/api/song/upload/direct/complete/",
+            {
+                "key": self.key,
+                "upload_id": "upload",
+                "filename": "song.mp3",
+                "parts": [{"part_number": 1, "etag": '"etag"'}],
+            },
+            format="json",
+        )
+        force_authenticate(request, self.user)
+        with mock.patch.object(
+            s3_service,
+            "complete_multipart_upload",
+            side_effect=complete_multipart_upload,
+        ):
+            return SongDirectUploadCompleteView.as_view()(request)
+
+    def test_retryable_errors_keep_the_upload(self):
+        for error_code, status_code in (("SlowDown", 502), ("InvalidPart", 400)):
+            with self.subTest(error_code=error_code):
+                response = self.complete(error_code)
+
+                self.assertEqual(response.status_code, status_code)
+                self.abort.assert_not_called()
+
+    def test_unrecoverable_error_aborts_the_upload(self):
+        response = self.complete("EntityTooSmall")
+
+        self.assertEqual(response.status_code, 400)
+        self.abort.assert_called_once_with(self.key, "upload")
+
+    def test_object_over_the_size_limit_is_deleted(self):
+        default_storage.save(self.key, ContentFile(b"x" * 1025))
+
+        response = self.complete()
+
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(default_storage.exists(self.key))
+        self.assertFalse(ProcessingJob.objects.exists())
+
+    def test_completed_upload_is_handed_over(self):
+        default_storage.save(self.key, ContentFile(b"x" * 1024))
+
+        response = self.complete()
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ProcessingJob.objects.get().temp_path, self.key)
+        default_storage.delete(self.key)
+
+
+@override_settings(STORAGE_BACKEND="s3", STORAGES=S3_LIKE_STORAGES)
+class ResumableUploadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="uploader", email="u@example.com")
+        self.data = os.urandom(300 * 1024)
+
+    def create_session(self, data):
+        return UploadSession.objects.create(
+            created_by=self.user,
+            filename="song.mp3",
+            size=len(data),
+            checksum=hashlib.sha256(data).hexdigest(),
+        )
+
+    def upload(self, session, data, chunk_size=100 * 1024):
+        for offset in range(0, len(data), chunk_size):
+            write_chunk(session, offset, data[offset : offset + chunk_size])
+
+    def test_assembles_parts_through_non_local_storage(self):
+        session = self.create_session(self.data)
+        self.upload(session, self.data)
+
+        temp_path = assemble_upload(session)
+
+        with default_storage.open(temp_path, "rb") as file:
+            self.assertEqual(file.read(), self.data)
+
+        # Parts are kept until the file is handed over
+        _, parts = default_storage.listdir(f"tmp/resumable/{session.session_uuid}/")
+        self.assertEqual(len(parts), 3)
+        delete_session_parts(session)
+        _, parts = default_storage.listdir(f"tmp/resumable/{session.session_uuid}/")
+        self.assertEqual(parts, [])
+
+    def test_checksum_mismatch_discards_file_and_parts(self):
+        session = self.create_session(self.data)
+        session.checksum = "0" * 64
+        session.save()
+        self.upload(session, self.data)
+
+        with self.assertRaises(ChecksumMismatch):
+            assemble_upload(session)
+
+        self.assertFalse(default_storage.exists(f"tmp/{session.session_uuid}.mp3"))
+
+    def test_chunk_at_stale_offset_conflicts_without_touching_parts(self):
+        session = self.create_session(self.data)
+        write_chunk(session, 0, self.data[:1024])
+
+        stale = UploadSession.objects.get(pk=session.pk)
+        stale.offset = 0
+        with self.assertRaises(ChunkConflict):
+            write_chunk(stale, 0, self.data[:1024])
+
+        _, parts = default_storage.listdir(f"tmp/resumable/{session.session_uuid}/")
+        self.assertEqual(len(parts), 1)
+
+    def patch(self, session, offset, data):
+        request = APIRequestFactory().patch(
+            f"/api/song/upload/resumable/{session.session_uuid}/",
+            data,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+        force_authenticate(request, self.user)
+        return ResumableUploadView.as_view()(request, session_uuid=session.session_uuid)
+
+    @override_settings(UPLOAD_PROCESSING_MODE="queue")
+    def test_failed_hand_over_can_be_retried(self):
+        session = self.create_session(self.data)
+        last = len(self.data) - 1024
+        self.upload(session, self.data[:last])
+
+        with mock.patch("music.views.submit_upload", side_effect=RuntimeError):
+            response = self.patch(session, last, self.data[last:])
+        self.assertEqual(response.status_code, 500)
+
+        session.refresh_from_db()
+        self.assertFalse(session.is_complete)
+        self.assertFalse(default_storage.exists(f"tmp/{session.session_uuid}.mp3"))
+
+        response = self.patch(session, len(self.data), b"")
+        self.assertEqual(response.status_code, 202)
+
+        job = ProcessingJob.objects.get(created_by=self.user)
+        with default_storage.open(job.temp_path, "rb") as file:
+            self.assertEqual(file.read(), self.data)
+        _, parts = default_storage.listdir(f"tmp/resumable/{session.session_uuid}/")
+        self.assertEqual(parts, [])
+
+    def test_empty_chunk_stores_no_part(self):
+        session = self.create_session(self.data)
+        write_chunk(session, 0, b"")
+
+        self.assertEqual(session.offset, 0)
+        self.assertFalse(default_storage.exists(session_prefix(session)))
+
+    def test_session_is_claimed_once(self):
+        session = self.create_session(self.data)
+        concurrent = UploadSession.objects.get(pk=session.pk)
+
+        self.assertTrue(claim_session(session))
+        self.assertFalse(claim_session(concurrent))
+
+    @override_settings(UPLOAD_PROCESSING_MODE="queue")
+    def test_claimed_session_is_not_handed_over_again(self):
+        session = self.create_session(self.data)
+        self.upload(session, self.data[:-1024])
+
+        with mock.patch("music.views.claim_session", return_value=False):
+            response = self.patch(session, len(self.data) - 1024, self.data[-1024:])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ProcessingJob.objects.exists())
+
+    @override_settings(UPLOAD_SESSION_MAX_AGE=3600)
+    def test_expired_sessions_are_deleted_with_their_parts(self):
+        expired = self.create_session(self.data)
+        self.upload(expired, self.data[:1024])
+        UploadSession.objects.filter(pk=expired.pk).update(
+            updated_at=timezone.now() - timedelta(hours=2)
+        )
+        active = self.create_session(self.data)
+
+        self.assertEqual(expire_sessions(), 1)
+
+        self.assertEqual(list(UploadSession.objects.all()), [active])
+        _, parts = default_storage.listdir(session_prefix(expired))
+        self.assertEqual(parts, [])
+
+
+@override_settings(STORAGES=S3_LIKE_STORAGES)
+class StorageServiceTests(TestCase):
+    def test_move_to_final_returns_the_stored_name(self):
+        first = default_storage.save("tmp/a.mp3", ContentFile(b"a"))
+        second = default_storage.save("tmp/b.mp3", ContentFile(b"b"))
+
+        first_path = move_to_final(first, "songs/ab/abc.mp3")
+        second_path = move_to_final(second, "songs/ab/abc.mp3")
+
+        self.assertNotEqual(first_path, second_path)
+        with default_storage.open(second_path, "rb") as file:
+            self.assertEqual(file.read(), b"b")
+        self.assertFalse(default_storage.exists(second))
+
+
+@override_settings(STORAGES=S3_LIKE_STORAGES)
+class BlobServiceTests(TestCase):
+    content_hash = "ab" * 32
+
+    def acquire(self, data):
+        return acquire_blob(
+            self.content_hash,
+            len(data),
+            ".mp3",
+            lambda path: default_storage.save(path, ContentFile(data)),
+        )
+
+    def test_identical_audio_is_stored_once(self):
+        blob, created = self.acquire(b"audio")
+        store = mock.Mock()
+
+        shared, shared_created = acquire_blob(self.content_hash, 5, ".mp3", store)
+
+        self.assertTrue(created)
+        self.assertFalse(shared_created)
+        self.assertEqual(shared.pk, blob.pk)
+        self.assertEqual(shared.ref_count, 2)
+        store.assert_not_called()
+
+        release_blob(self.content_hash)
+        self.assertTrue(default_storage.exists(blob.file.name))
+        release_blob(self.content_hash)
+        self.assertFalse(default_storage.exists(blob.file.name))
+
+    def test_released_audio_can_be_acquired_again(self):
+        blob, _ = self.acquire(b"audio")
+        release_blob(self.content_hash)
+        self.assertFalse(AudioBlob.objects.exists())
+
+        blob, created = self.acquire(b"audio")
+
+        self.assertTrue(created)
+        self.assertEqual(blob.ref_count, 1)
+        with default_storage.open(blob.file.name, "rb") as file:
+            self.assertEqual(file.read(), b"audio")
+        default_storage.delete(blob.file.name)
+
+    def test_files_are_deleted_under_the_blob_lock(self):
+        blob, _ = self.acquire(b"audio")
+        deleted = []
+
+        def lock_blob(content_hash):
+            deleted.append(default_storage.exists(blob.file.name))
+
+        with mock.patch.object(blob_service, "lock_blob", side_effect=lock_blob):
+            release_blob(self.content_hash)
+            self.acquire(b"audio")
+
+        # The release held the lock while the file still existed, the new
+        # store waited for it and found the file deleted
+        self.assertEqual(deleted, [True, False])
+        default_storage.delete(blob.file.name)
+
+
+def fake_prepare_audio(local_path):
+    """`prepare_audio` without ffprobe/ffmpeg: the file holds its title."""
+    with open(local_path, "rb") as file:
+        data = file.read()
+
+    audio = AudioInfo(
+        duration=1,
+        mime_type="audio/mpeg",
+        size=len(data),
+        title=data.decode(),
+        artist="Artist",
+        album="Album",
+    )
+    return audio, hashlib.sha256(data).hexdigest()
+
+
+@override_settings(
+    STORAGE_BACKEND="s3",
+    STORAGES=S3_LIKE_STORAGES,
+    RENDITION_MODE="eager",
+    WAVEFORM_ENABLED=False,
+)
+class ImportLibraryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="importer", email="i@example.com")
+
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        self.library = os.path.join(work_dir.name, "library")
+        self.manifest = os.path.join(work_dir.name, "manifest.json")
+        os.makedirs(os.path.join(self.library, "album"))
+        self.write("one.mp3", "One")
+        self.write("album/two.flac", "Two")
+        self.write("album/cover.txt", "not audio")
+
+        # Threads instead of processes: the in-memory storage and the mocks
+        # are shared with the workers
+        for patcher in (
+            mock.patch.object(
+                import_library, "ProcessPoolExecutor", ThreadPoolExecutor
+            ),
+            mock.patch.object(import_library.connections, "close_all"),
+            mock.patch.object(
+                import_library, "prepare_audio", side_effect=fake_prepare_audio
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write(self, rel_path, content):
+        with open(os.path.join(self.library, rel_path), "w") as file:
+            file.write(content)
+
+    def run_import(self):
+        with mock.patch(
+            "music.services.upload_service.generate_renditions"
+        ) as generate_renditions:
+            call_command(
+                "import_library",
+                self.library,
+                user=self.user.email,
+                workers=2,
+                manifest=self.manifest,
+                stdout=io.StringIO(),
+                stderr=io.StringIO(),
+            )
+        return generate_renditions
+
+    def test_imports_audio_files_through_the_upload_pipeline(self):
+        generate_renditions = self.run_import()
+
+        songs = Song.objects.filter(uploaded_by=self.user)
+        self.assertCountEqual([song.title for song in songs], ["One", "Two"])
+        for song in songs:
+            self.assertTrue(song.is_upload_complete)
+            self.assertTrue(default_storage.exists(song.file.name))
+        self.assertEqual(Artist.objects.filter(created_by=self.user).count(), 1)
+        self.assertEqual(Album.objects.filter(created_by=self.user).count(), 1)
+        self.assertEqual(generate_renditions.call_count, 2)
+
+        with open(self.manifest) as file:
+            files = json.load(file)["files"]
+        self.assertEqual(sorted(files), ["album/two.flac", "one.mp3"])
+        self.assertEqual({entry["status"] for entry in files.values()}, {"done"})
+
+    def test_resumes_from_the_manifest(self):
+        self.run_import()
+        self.write("one.mp3", "One (remastered)")
+
+        self.run_import()
+
+        self.assertEqual(import_library.prepare_audio.call_count, 3)
+        self.assertCountEqual(
+            Song.objects.values_list("title", flat=True),
+            ["One", "One (remastered)", "Two"],
+        )
+
+
+class ArtistAlbumResolverTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="resolver", email="r@example.com")
+
+    def test_resolves_case_insensitively(self):
+        artist, album = ArtistAlbumResolver(self.user).resolve("Queen", "A Night")
+
+        for name, title in (("QUEEN", "a night"), ("queen", "A NIGHT")):
+            with self.subTest(name=name):
+                # A new resolver, nothing cached
+                self.assertEqual(
+                    ArtistAlbumResolver(self.user).resolve(name, title),
+                    (artist, album),
+                )
+
+        self.assertEqual(Artist.objects.count(), 1)
+        self.assertEqual(Album.objects.count(), 1)
+        self.assertEqual(artist.name, "Queen")
+
+    def test_batch_takes_a_fixed_number_of_queries(self):
+        resolver = ArtistAlbumResolver(self.user)
+        pairs = [(f"Artist {i}", f"Album {i}") for i in range(20)]
+
+        # Artists: SELECT, INSERT, SELECT, albums: the same
+        with self.assertNumQueries(6):
+            resolver.prefetch(pairs + [(name.upper(), None) for name, _ in pairs])
+        with self.assertNumQueries(0):
+            resolver.resolve("artist 3", "ALBUM 3")
+
+    def test_row_created_concurrently_is_refetched(self):
+        cache_artists = ArtistAlbumResolver._cache_artists
+        calls = []
+
+        def racing_cache_artists(resolver, names):
+            # A concurrent upload commits the artist right after the lookup
+            calls.append(names)
+            if len(calls) == 1:
+                Artist.objects.create(name="the beatles", created_by=self.user)
+                return
+            cache_artists(resolver, names)
+
+        with mock.patch.object(
+            ArtistAlbumResolver, "_cache_artists", racing_cache_artists
+        ):
+            artist, _ = ArtistAlbumResolver(self.user).resolve("The Beatles")
+
+        self.assertEqual(artist.name, "the beatles")
+        self.assertEqual(Artist.objects.count(), 1)
+
+    def test_name_lowercased_differently_by_the_database(self):
+        artist, _ = ArtistAlbumResolver(self.user).resolve("Émilie Simon")
+
+        again, _ = ArtistAlbumResolver(self.user).resolve("Émilie Simon")
+
+        self.assertEqual(again, artist)
+        self.assertEqual(Artist.objects.count(), 1)
+
+
+class MergeDuplicatesMigrationTests(TransactionTestCase):
+    """Migration 0011 folds case-insensitive duplicates before constraining."""
+
+    def setUp(self):
+        # Duplicates can only exist without the constraints the migration adds
+        self.constraints = [
+            (model, constraint)
+            for model in (Artist, Album)
+            for constraint in model._meta.constraints
+        ]
+        with connection.schema_editor() as editor:
+            for model, constraint in self.constraints:
+                editor.remove_constraint(model, constraint)
+
+    def tearDown(self):
+        with connection.schema_editor() as editor:
+            for model, constraint in self.constraints:
+                editor.add_constraint(model, constraint)
+
+    def test_merges_duplicate_artists_and_albums(self):
+        user = User.objects.create(username="dupes", email="dupes@example.com")
+        other = User.objects.create(username="other", email="other@example.com")
+        artist = Artist.objects.create(name="Queen", created_by=user)
+        duplicate = Artist.objects.create(name="QUEEN", created_by=user)
+        others = Artist.objects.create(name="queen", created_by=other)
+        album = Album.objects.create(title="Jazz", artist=artist, created_by=user)
+        duplicate_album = Album.objects.create(
+            title="jazz",
+            artist=duplicate,
+            created_by=user,
+            cover_image="thumbnails/jazz.jpg",
+        )
+        song = Song.objects.create(
+            title="Mustapha",
+            file="songs/mustapha.mp3",
+            artist=duplicate,
+            album=duplicate_album,
+            duration=1,
+            size=1,
+            mime_type="audio/mpeg",
+            uploaded_by=user,
+        )
+
+        migration = importlib.import_module(
+            "music.migrations.0011_artist_unique_artist_name_per_user_and_more"
+        )
+        migration.merge_duplicates(django_apps, None)
+
+        self.assertCountEqual(
+            Artist.objects.values_list("id", flat=True), [artist.id, others.id]
+        )
+        album = Album.objects.get()
+        self.assertEqual(album.artist_id, artist.id)
+        self.assertEqual(album.cover_image, "thumbnails/jazz.jpg")
+        song.refresh_from_db()
+        self.assertEqual((song.artist_id, song.album_id), (artist.id, album.id))
+
+
+def image_bytes(color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (300, 300), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@override_settings(STORAGES=S3_LIKE_STORAGES)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="owner", email="o@example.com")
+        self.artist = Artist.objects.create(name="Artist", created_by=self.user)
+
+    def create_song(self, thumbnail):
+        return Song.objects.create(
+            title="Song",
+            file="songs/song.mp3",
+            artist=self.artist,
+            duration=1,
+            size=1,
+            mime_type="audio/mpeg",
+            uploaded_by=self.user,
+            thumbnail=thumbnail,
+        )
+
+    def test_release_keeps_referenced_thumbnail(self):
+        path = create_thumbnail(image_bytes())
+        first = self.create_song(path)
+        second = self.create_song(path)
+
+        first.delete()
+        self.assertTrue(default_storage.exists(path))
+
+        second.delete()
+        self.assertFalse(default_storage.exists(path))
+
+    def test_claim_restores_released_thumbnail(self):
+        art = image_bytes("blue")
+        path = create_thumbnail(art)
+        release_thumbnail(path)
+        self.assertFalse(default_storage.exists(path))
+
+        with transaction.atomic():
+            self.assertEqual(claim_thumbnail(path, art), path)
+        self.assertTrue(default_storage.exists(path))
+
+        release_thumbnail(path)
+        with transaction.atomic():
+            self.assertIsNone(claim_thumbnail(path))
+
+
+@override_settings(
+    STORAGES=S3_LIKE_STORAGES,
+    RENDITION_MODE="lazy",
+    UPLOAD_PROCESSING_MODE="queue",
+)
+class SongStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="listener", email="l@example.com")
+        artist = Artist.objects.create(name="Artist", created_by=self.user)
+        # 320 kbps original
+        self.song = Song.objects.create(
+            title="Song",
+            file="songs/song.mp3",
+            artist=artist,
+            duration=100,
+            size=4_000_000,
+            mime_type="audio/mpeg",
+            uploaded_by=self.user,
+            is_upload_complete=True,
+        )
+
+    def stream(self, **params):
+        request = APIRequestFactory().get(
+            f"/api/song/stream/{self.song.song_uuid}/", params
+        )
+        force_authenticate(request, self.user)
+        return SongStreamView.as_view()(request, song_uuid=self.song.song_uuid)
+
+    def test_missing_rendition_is_queued_and_original_served(self):
+        response = self.stream(bitrate=128)
+
+        data = json.loads(response.content)
+        self.assertIsNone(data["rendition"])
+        self.assertEqual(data["type"], "audio/mpeg")
+        self.assertIn("Save-Data", response["Vary"])
+
+        job = ProcessingJob.objects.get(kind=ProcessingJob.Kind.RENDITION)
+        self.assertEqual((job.song, job.variant), (self.song, "aac-128k"))
+
+        # Requested again before the worker ran: no second job
+        self.stream(bitrate=128)
+        self.assertEqual(ProcessingJob.objects.count(), 1)
+
+    def test_missing_hls_package_is_queued_and_file_served(self):
+        data = json.loads(self.stream(mode="hls").content)
+
+        self.assertNotEqual(data.get("mode"), "hls")
+        job = ProcessingJob.objects.get(kind=ProcessingJob.Kind.HLS)
+        self.assertEqual(job.variant, "original")
+
+    def test_stored_rendition_is_served(self):
+        default_storage.save(
+            f"renditions/{self.song.song_uuid.hex}/128k.m4a", ContentFile(b"aac")
+        )
+
+        data = json.loads(self.stream(bitrate=128).content)
+
+        self.assertEqual(data["rendition"], "aac-128k")
+        self.assertEqual(data["type"], "audio/mp4")
+        self.assertFalse(ProcessingJob.objects.exists())
+
+    @override_settings(
+        STREAMING_DELIVERY_MODE="x-accel", X_ACCEL_REDIRECT_PREFIX="/protected-media/"
+    )
+    def test_rendition_is_handed_to_nginx(self):
+        path = f"renditions/{self.song.song_uuid.hex}/128k.m4a"
+        if not default_storage.exists(path):
+            default_storage.save(path, ContentFile(b"aac"))
+
+        response = self.stream(direct=1, bitrate=128)
+
+        # nginx/nginx.conf has an `internal` location for this prefix
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{path}")
+        self.assertEqual(response["Content-Type"], "audio/mp4")
+
+
+@override_settings(STORAGES=S3_LIKE_STORAGES, STORAGE_BACKEND="local")
+class ListQueryCountTests(TestCase):
+    """Song lists take a fixed number of queries, whatever the page size."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="collector", email="c@example.com")
+        cls.artist = Artist.objects.create(name="Artist", created_by=cls.user)
+        cls.album = Album.objects.create(
+            title="Album", artist=cls.artist, created_by=cls.user
+        )
+        cls.playlist = Playlist.objects.create(name="Playlist", owner=cls.user)
+
+        for i in range(60):
+            song = Song.objects.create(
+                title=f"Song {i:02d}",
+                file=f"songs/{i}.mp3",
+                artist=cls.artist,
+                album=cls.album,
+                duration=100,
+                size=1000,
+                mime_type="audio/mpeg",
+                uploaded_by=cls.user,
+                is_uploaded_to_cloud=False,
+                is_upload_complete=True,
+                thumbnail=f"thumbnails/{i % 3}/200.jpg",
+            )
+            PlaylistSong.objects.create(playlist=cls.playlist, song=song, order=i)
+            SharedSong.objects.create(song=song, shared_by=cls.user)
+
+    def get(self, view, page_size, **kwargs):
+        request = APIRequestFactory().get("/", {"page_size": page_size})
+        force_authenticate(request, self.user)
+        response = view.as_view()(request, **kwargs)
+        response.render()
+        return response
+
+    def assert_fixed_queries(self, queries, view, **kwargs):
+        for page_size in (5, 50):
+            with self.subTest(page_size=page_size):
+                with self.assertNumQueries(queries):
+                    response = self.get(view, page_size, **kwargs)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["results"]), page_size)
+
+    def test_song_list(self):
+        self.assert_fixed_queries(2, SongView)
+
+    def test_playlist_songs(self):
+        self.assert_fixed_queries(
+            3, PlaylistSongView, playlist_uuid=self.playlist.playlist_uuid
+        )
+
+    def test_shared_songs(self):
+        self.assert_fixed_queries(2, SharedSongsView)
+
+    def test_artist_songs(self):
+        with self.assertNumQueries(1):
+            data = ArtistSongModelSerializer(self.artist, context={}).data
+        self.assertEqual(len(data["songs"]), 60)
+
+    def test_album_songs(self):
+        with self.assertNumQueries(1):
+            data = AlbumSongModelSerializer(self.album, context={}).data
+        self.assertEqual(len(data["songs"]), 60)
+
+
+@override_settings(STORAGES=S3_LIKE_STORAGES, STORAGE_BACKEND="local")
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="scroller", email="k@example.com")
+        artist = Artist.objects.create(name="Artist", created_by=cls.user)
+
+        # Five songs share every title, the id breaks the ties
+        for i in range(23):
+            Song.objects.create(
+                title=f"Song {i % 5}",
+                file=f"songs/{i}.mp3",
+                artist=artist,
+                duration=100,
+                size=1000,
+                mime_type="audio/mpeg",
+                uploaded_by=cls.user,
+                is_uploaded_to_cloud=False,
+                is_upload_complete=True,
+            )
+
+    def get(self, **params):
+        request = APIRequestFactory().get(
+            "/api/song/", {"pagination": "cursor", "page_size": 4, **params}
+        )
+        force_authenticate(request, self.user)
+        return SongView.as_view()(request)
+
+    def test_pages_follow_the_ordering_across_ties(self):
+        expected = list(
+            Song.objects.order_by("title", "id").values_list("song_uuid", flat=True)
+        )
+
+        seen = []
+        params = {}
+        while True:
+            response = self.get(**params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["results"]), 4)
+            seen += [song["song_uuid"] for song in response.data["results"]]
+
+            if response.data["next"] is None:
+                break
+            query = parse_qs(urlparse(response.data["next"]).query)
+            self.assertEqual(query["pagination"], ["cursor"])
+            params = {"cursor": query["cursor"][0]}
+
+        self.assertEqual(seen, [str(song_uuid) for song_uuid in expected])
+
+    def test_invalid_cursor_is_a_client_error(self):
+        for cursor in (
+            "not-base64!",
+            base64.urlsafe_b64encode(b"not json").decode(),
+            base64.urlsafe_b64encode(b'["Song 1"]').decode(),
+            base64.urlsafe_b64encode(b'["Song 1", "x"]').decode(),
+            base64.urlsafe_b64encode(b"[null, null]").decode(),
+            base64.urlsafe_b64encode(b"42").decode(),
+        ):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(cursor=cursor).status_code, 400)
+
+    def test_page_numbers_stay_the_default(self):
+        request = APIRequestFactory().get("/api/song/", {"page_size": 4, "page": 2})
+        force_authenticate(request, self.user)
+        response = SongView.as_view()(request)
+
+        self.assertEqual(response.data["count"], 23)
+        self.assertEqual(len(response.data["results"]), 4)
+
+
+@override_settings(STORAGES=S3_LIKE_STORAGES, STORAGE_BACKEND="local")
+class SearchViewTests(TestCase):
+    """Substring fallback used on SQLite (trigram search needs PostgreSQL)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="searcher", email="s@example.com")
+        cls.other = User.objects.create(username="other", email="x@example.com")
+
+        for user in (cls.user, cls.other):
+            artist = Artist.objects.create(name="Love Band", created_by=user)
+            for title in ("Endless Love", "Love", "Lovesong", "Glove Box", "Rain"):
+                Song.objects.create(
+                    title=title,
+                    file="songs/song.mp3",
+                    artist=artist,
+                    duration=100,
+                    size=1000,
+                    mime_type="audio/mpeg",
+                    uploaded_by=user,
+                    is_uploaded_to_cloud=False,
+                    is_upload_complete=True,
+                )
+            Playlist.objects.create(name="Love Mix", owner=user)
+
+    def search(self, user=None, **params):
+        request = APIRequestFactory().get("/api/search/", params)
+        force_authenticate(request, user or self.user)
+        response = SearchView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"]
+
+    def test_ranks_exact_then_prefix_then_substring(self):
+        data = self.search(q="love")
+
+        titles = [song["title"] for song in data["songs"]]
+        self.assertEqual(titles[:2], ["Love", "Lovesong"])
+        self.assertCountEqual(titles[2:], ["Endless Love", "Glove Box"])
+        self.assertEqual([a["name"] for a in data["artists"]], ["Love Band"])
+        self.assertEqual([p["name"] for p in data["playlists"]], ["Love Mix"])
+
+    def test_only_searches_the_users_library(self):
+        other_songs = Song.objects.filter(uploaded_by=self.other)
+        other_uuids = {
+            str(uuid) for uuid in other_songs.values_list("song_uuid", flat=True)
+        }
+
+        data = self.search(q="love")
+
+        self.assertEqual(len(data["songs"]), 4)
+        self.assertFalse(other_uuids & {song["song_uuid"] for song in data["songs"]})
+        self.assertEqual(len(data["artists"]), 1)
+
+    def test_limit(self):
+        data = self.search(q="love", limit=2)
+
+        self.assertEqual(
+            [song["title"] for song in data["songs"]], ["Love", "Lovesong"]
+        )
+
+
+class UserSearchIndexTests(TestCase):
+    def assert_consistent(self, index):
+        """Lookup structures hold exactly what a fresh build would."""
+        texts = {doc: text for doc, (text, _) in index.docs.items()}
+        self.assertEqual(set(index.ids.values()), set(texts))
+        self.assertEqual(index.names, sorted((t, doc) for doc, t in texts.items()))
+
+        words, postings = {}, {}
+        for doc, text in texts.items():
+            for word in text.split():
+                words.setdefault(word, set()).add(doc)
+            for gram in trigrams(text):
+                postings.setdefault(gram, set()).add(doc)
+        self.assertEqual(dict(index.words), words)
+        self.assertEqual(index.vocabulary, sorted(words))
+        self.assertEqual(dict(index.postings), postings)
+
+    def names(self, index, query):
+        return [result["name"] for result in index.search(query, 10)]
+
+    def test_add_and_remove_keep_structures_in_sync(self):
+        index = UserSearchIndex(
+            [
+                (("song", 1), "Endless Love", {"name": "Endless Love"}),
+                (("artist", 1), "Love Band", {"name": "Love Band"}),
+            ]
+        )
+        self.assert_consistent(index)
+
+        index.add(("song", 2), "Lovesong", {"name": "Lovesong"})
+        self.assert_consistent(index)
+        self.assertEqual(
+            self.names(index, "love"), ["Lovesong", "Love Band", "Endless Love"]
+        )
+
+        # Renaming replaces the old name, its words and trigrams
+        index.add(("song", 2), "Rain", {"name": "Rain"})
+        self.assert_consistent(index)
+        self.assertNotIn("lovesong", index.vocabulary)
+        self.assertEqual(self.names(index, "rain"), ["Rain"])
+
+        # "love" stays in the vocabulary while another name has it
+        index.remove(("artist", 1))
+        self.assert_consistent(index)
+        self.assertIn("love", index.vocabulary)
+        self.assertEqual(self.names(index, "love"), ["Endless Love"])
+
+        index.remove(("song", 1))
+        index.remove(("song", 1))
+        self.assert_consistent(index)
+        self.assertEqual(index.vocabulary, ["rain"])
+        self.assertEqual(self.names(index, "love"), [])
+
+    def test_expired_index_is_served_while_rebuilt_in_background(self):
+        stale = UserSearchIndex([(("song", 1), "Old", {"name": "Old"})])
+        stale.built_at -= settings.SEARCH_INDEX_MAX_AGE
+        fresh = UserSearchIndex([(("song", 1), "New", {"name": "New"})])
+        release = threading.Event()
+        running = set(threading.enumerate())
+
+        def build_index(user_id):
+            release.wait(5)
+            return fresh
+
+        with (
+            mock.patch.dict(search_index_service._indexes, {1: stale}, clear=True),
+            mock.patch.object(
+                search_index_service, "build_index", side_effect=build_index
+            ) as build,
+        ):
+            self.assertIs(get_index(1), stale)
+            # One rebuild per user, however many searches arrive meanwhile
+            self.assertIs(get_index(1), stale)
+
+            release.set()
+            for thread in set(threading.enumerate()) - running:
+                thread.join(5)
+
+            self.assertEqual(build.call_count, 1)
+            self.assertIs(get_index(1), fresh)
+
+
+def adjacent_same_artist(queue, songs):
+    artists = dict(songs)
+    return sum(artists[a] == artists[b] for a, b in zip(queue, queue[1:]))
+
+
+class ShuffleQueueTests(TestCase):
+    songs = [(f"{artist}{i}", artist) for artist in "ABC" for i in range(10)]
+
+    def test_same_seed_gives_the_same_queue(self):
+        for smart in (False, True):
+            with self.subTest(smart=smart):
+                queue = shuffle_queue(self.songs, 42, smart=smart)
+
+                self.assertEqual(shuffle_queue(self.songs, 42, smart=smart), queue)
+                self.assertNotEqual(shuffle_queue(self.songs, 43, smart=smart), queue)
+                self.assertCountEqual(queue, [song for song, _ in self.songs])
+
+    def test_first_song_leads_the_queue(self):
+        queue = shuffle_queue(self.songs, 7, first="B5")
+
+        self.assertEqual(queue[0], "B5")
+        self.assertCountEqual(queue, [song for song, _ in self.songs])
+
+    def test_smart_shuffle_spreads_artists(self):
+        plain = smart = 0
+        for seed in range(50):
+            queue = shuffle_queue(self.songs, seed, smart=True)
+            self.assertLessEqual(adjacent_same_artist(queue, self.songs), 1)
+            smart += adjacent_same_artist(queue, self.songs)
+            plain += adjacent_same_artist(shuffle_queue(self.songs, seed), self.songs)
+
+        self.assertLess(smart * 20, plain)
+
+    def test_smart_shuffle_of_a_dominant_artist(self):
+        # 20 songs of A around 10 others: at least 9 pairs are unavoidable
+        songs = [(f"A{i}", "A") for i in range(20)]
+        songs += [(f"{artist}{i}", artist) for artist in "BC" for i in range(5)]
+
+        for seed in range(20):
+            queue = shuffle_queue(songs, seed, smart=True)
+            self.assertLessEqual(adjacent_same_artist(queue, songs), 12)
+
+
+@override_settings(STORAGES=S3_LIKE_STORAGES, STORAGE_BACKEND="local")
+class PlaybackQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="shuffler", email="q@example.com")
+        artists = [
+            Artist.objects.create(name=f"Artist {i}", created_by=cls.user)
+            for i in range(3)
+        ]
+        cls.songs = [
+            Song.objects.create(
+                title=f"Song {i:02d}",
+                file=f"songs/{i}.mp3",
+                artist=artists[i % 3],
+                duration=100,
+                size=1000,
+                mime_type="audio/mpeg",
+                uploaded_by=cls.user,
+                is_uploaded_to_cloud=False,
+                is_upload_complete=True,
+            )
+            for i in range(30)
+        ]
+
+    def get(self, **params):
+        request = APIRequestFactory().get("/api/playback-queue/", params)
+        force_authenticate(request, self.user)
+        response = PlaybackQueueView.as_view()(request)
+        self.assertEqual(response.status_code, 200)
+        return response.data["data"]
+
+    def test_pages_walk_one_permutation(self):
+        first = self.get(shuffle=True, smart=True, limit=8)
+        seed = first["seed"]
+        full = self.get(shuffle=True, smart=True, seed=seed)["queue"]
+
+        queue = first["queue"]
+        offset = first["next_offset"]
+        while offset is not None:
+            page = self.get(shuffle=True, smart=True, seed=seed, offset=offset, limit=8)
+            self.assertEqual(page["seed"], seed)
+            self.assertEqual(page["total"], 30)
+            queue += page["queue"]
+            offset = page["next_offset"]
+
+        self.assertEqual(queue, full)
+        self.assertCountEqual(queue, [song.song_uuid for song in self.songs])
+
+    def test_start_song_and_unshuffled_order(self):
+        start = self.songs[17].song_uuid
+
+        data = self.get(shuffle=True, seed=3, start_song_uuid=start)
+        self.assertEqual(data["queue"][0], start)
+
+        data = self.get(limit=5)
+        self.assertIsNone(data["seed"])
+        self.assertEqual(data["queue"], [song.song_uuid for song in self.songs[:5]])
+        self.assertEqual(data["next_offset"], 5)
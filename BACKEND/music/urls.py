@@ -7,18 +7,33 @@ from music.views import (
     PlaylistForSongView,
     PlaylistSongView,
     PlaylistView,
+    ProcessingJobView,
+    ResumableUploadView,
+    SearchSuggestView,
+    SearchView,
     SharedSongStreamView,
     SharedSongsView,
+    SongDirectUploadCompleteView,
+    SongDirectUploadView,
+    SongStreamBatchView,
     SongStreamView,
     SongView,
+    SongWaveformView,
 )
 
 urlpatterns = [
     path("songs/", SongView.as_view()),
     path("song/upload/", SongView.as_view()),
+    path("song/upload/direct/", SongDirectUploadView.as_view()),
+    path("song/upload/direct/complete/", SongDirectUploadCompleteView.as_view()),
+    path("song/upload/job/<uuid:job_uuid>/", ProcessingJobView.as_view()),
+    path("song/upload/resumable/", ResumableUploadView.as_view()),
+    path("song/upload/resumable/<uuid:session_uuid>/", ResumableUploadView.as_view()),
     path("song/<uuid:song_uuid>/", SongView.as_view()),
     path("song/delete/<uuid:song_uuid>/", SongView.as_view()),
-    path("song/stream/<uuid:song_uuid>/", SongStreamView.as_view()),
+    path("song/stream/batch/", SongStreamBatchView.as_view()),
+    path("song/stream/<uuid:song_uuid>/", SongStreamView.as_view(), name="song-stream"),
+    path("song/waveform/<uuid:song_uuid>/", SongWaveformView.as_view()),
     path("song/share/", SharedSongsView.as_view()),
     path("song/share/<uuid:shared_uuid>/", SharedSongsView.as_view()),
     path("song/share/stream/<uuid:shared_uuid>/", SharedSongStreamView.as_view()),
@@ -33,4 +48,6 @@ urlpatterns = [
     path("albums/", AlbumView.as_view()),
     path("album/<uuid:album_uuid>/", AlbumView.as_view()),
     path("playback-queue/", PlaybackQueueView.as_view()),
+    path("search/", SearchView.as_view()),
+    path("search/suggest/", SearchSuggestView.as_view()),
 ]
@@ -1,25 +1,82 @@
+import math
+import os
+import uuid
+
+from botocore.exceptions import ClientError
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.db.models import Exists, Max, OuterRef
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import patch_vary_headers
+from django.utils.text import get_valid_filename
 from rest_framework import serializers, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 
 from account.jwt_utils import CookieJWTAuthentication
-from music.models import Album, Artist, Playlist, PlaylistSong, SharedSong, Song
+from music.models import (
+    Album,
+    Artist,
+    Playlist,
+    PlaylistSong,
+    ProcessingJob,
+    SharedSong,
+    Song,
+    UploadSession,
+)
 from music.serializers import (
     AlbumModelSerializer,
     ArtistModelSerializer,
     PlaylistForSongSerializer,
     PlaylistModelSerializer,
     PlaylistSongModelSerializer,
+    ProcessingJobModelSerializer,
     SharedSongModelSerializer,
     SongModelSerializer,
 )
-from music.services.streaming_service import stream_file
-from music.services.upload_service import upload_song
+from music.services.hls_service import HLS_MIME_TYPE, stored_hls_playlist
+from music.services.loudness_service import replaygain
+from music.services.processing_service import (
+    submit_hls,
+    submit_rendition,
+    submit_upload,
+)
+from music.services.rendition_service import (
+    CODECS,
+    select_rendition,
+    stored_rendition,
+)
+from music.services.resumable_upload_service import (
+    ChecksumMismatch,
+    ChunkConflict,
+    assemble_upload,
+    claim_session,
+    delete_session_parts,
+    read_chunk,
+    write_chunk,
+)
+from music.services.search_index_service import suggest
+from music.services.search_service import search_library
+from music.services.shuffle_service import (
+    MAX_SEED,
+    QUEUE_PAGE_MAX_SIZE,
+    new_seed,
+    shuffle_queue,
+)
+from music.services.storage_service import (
+    delete_file,
+    direct_upload_prefix,
+    save_temp_file,
+)
+from music.services.streaming_service import (
+    etag_matches,
+    get_stream_url,
+    song_etag,
+    stream_file,
+)
+from music.services.waveform_service import waveform_path
 from utils.response_wrapper import formatted_response, paginated_response
 
 # Create your views here.
@@ -79,10 +136,11 @@ class SongView(APIView):
             song_objs = song_objs.filter(album__album_uuid=album_uuid)
 
         return paginated_response(
-            queryset=song_objs,
+            queryset=SongModelSerializer.prepare_queryset(song_objs),
             request=self.request,
             serializer_class=SongModelSerializer,
             context={"request": self.request},
+            ordering=["title", "id"],
         )
 
     def post(self, *args, **kwargs):
@@ -97,13 +155,10 @@ class SongView(APIView):
         user_obj = self.request.user
 
         try:
-            song = upload_song(file=file, user=user_obj)
+            temp_path = save_temp_file(file)
+            song, job = submit_upload(temp_path, file.name, user_obj)
 
-            return formatted_response(
-                data=SongModelSerializer(song, context={"request": self.request}).data,
-                message="Song uploaded successfully",
-                status=status.HTTP_201_CREATED,
-            )
+            return upload_response(self.request, song, job)
         except Exception as e:
             return formatted_response(
                 message={"error": f"Upload failed: {str(e)}"},
@@ -126,12 +181,395 @@ class SongView(APIView):
         )
 
 
+def hls_playlist_url(request, song, bitrate, direct):
+    """
+    Absolute URL of the song's HLS playlist. The rendition comes from
+    `bitrate` or, for JSON responses, the client hints. A missing playlist
+    is packaged in the background, never in the request.
+
+    Returns:
+        (url, rendition or None), url is None until the song is packaged
+    """
+    headers = None if direct else request.headers
+    rendition = select_rendition(song, bitrate, "aac", headers)
+    playlist = stored_hls_playlist(song, rendition)
+    if not playlist:
+        submit_hls(song, rendition)
+        return None, None
+
+    return request.build_absolute_uri(default_storage.url(playlist)), rendition
+
+
+def upload_response(request, song, job):
+    """201 with the song when processed inline, 202 with the job when queued."""
+    if job is not None:
+        return formatted_response(
+            data=ProcessingJobModelSerializer(job, context={"request": request}).data,
+            message="Song queued for processing",
+            status=status.HTTP_202_ACCEPTED,
+        )
+
+    return formatted_response(
+        data=SongModelSerializer(song, context={"request": request}).data,
+        message="Song uploaded successfully",
+        status=status.HTTP_201_CREATED,
+    )
+
+
+class ProcessingJobView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class ProcessingJobKwargsSerializer(serializers.Serializer):
+        job_uuid = serializers.UUIDField(required=True, allow_null=False)
+
+    def get(self, *args, **kwargs):
+        kwargs_serializer = self.ProcessingJobKwargsSerializer(data=self.kwargs)
+        kwargs_serializer.is_valid(raise_exception=True)
+
+        job_uuid = kwargs_serializer.validated_data.get("job_uuid")
+
+        job = get_object_or_404(
+            ProcessingJob.objects.select_related("song__artist"),
+            created_by=self.request.user,
+            job_uuid=job_uuid,
+        )
+
+        return formatted_response(
+            data=ProcessingJobModelSerializer(
+                job, context={"request": self.request}
+            ).data,
+            status=status.HTTP_200_OK,
+        )
+
+
+class ResumableUploadView(APIView):
+    """
+    tus-style resumable uploads: POST creates a session, PATCH appends a chunk
+    at `Upload-Offset`, HEAD reports the current offset, DELETE cancels.
+    """
+
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class ResumableUploadKwargsSerializer(serializers.Serializer):
+        session_uuid = serializers.UUIDField(required=True, allow_null=False)
+
+    class ResumableUploadPostSerializer(serializers.Serializer):
+        filename = serializers.CharField(
+            required=True, allow_blank=False, max_length=255
+        )
+        size = serializers.IntegerField(
+            required=True, min_value=1, max_value=settings.RESUMABLE_UPLOAD_MAX_SIZE
+        )
+        checksum = serializers.RegexField(
+            r"^[0-9a-fA-F]{64}$", required=True, help_text="SHA-256 of the file"
+        )
+
+    def get_session(self):
+        kwargs_serializer = self.ResumableUploadKwargsSerializer(data=self.kwargs)
+        kwargs_serializer.is_valid(raise_exception=True)
+
+        return get_object_or_404(
+            UploadSession,
+            created_by=self.request.user,
+            session_uuid=kwargs_serializer.validated_data.get("session_uuid"),
+            is_complete=False,
+        )
+
+    def offset_response(self, session, status_code):
+        response = formatted_response(
+            data={
+                "session_uuid": session.session_uuid,
+                "offset": session.offset,
+                "size": session.size,
+                "max_chunk_size": settings.RESUMABLE_UPLOAD_MAX_CHUNK_SIZE,
+            },
+            status=status_code,
+        )
+        response["Upload-Offset"] = str(session.offset)
+        response["Upload-Length"] = str(session.size)
+        response["Cache-Control"] = "no-store"
+        return response
+
+    def post(self, *args, **kwargs):
+        post_serializer = self.ResumableUploadPostSerializer(data=self.request.data)
+        post_serializer.is_valid(raise_exception=True)
+
+        session = UploadSession.objects.create(
+            created_by=self.request.user,
+            filename=os.path.basename(post_serializer.validated_data.get("filename")),
+            size=post_serializer.validated_data.get("size"),
+            checksum=post_serializer.validated_data.get("checksum").lower(),
+        )
+
+        return self.offset_response(session, status.HTTP_201_CREATED)
+
+    def head(self, *args, **kwargs):
+        return self.offset_response(self.get_session(), status.HTTP_200_OK)
+
+    def patch(self, *args, **kwargs):
+        session = self.get_session()
+
+        try:
+            offset = int(self.request.headers.get("Upload-Offset", ""))
+        except ValueError:
+            return formatted_response(
+                message={"error": "Upload-Offset header is required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        data = read_chunk(self.request.stream, settings.RESUMABLE_UPLOAD_MAX_CHUNK_SIZE)
+        if data is None:
+            return formatted_response(
+                message={"error": "Chunk is larger than the allowed chunk size"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        try:
+            write_chunk(session, offset, data)
+        except ChunkConflict:
+            session.refresh_from_db()
+            return self.offset_response(session, status.HTTP_409_CONFLICT)
+        except ValueError as e:
+            return formatted_response(
+                message={"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if session.offset < session.size:
+            return self.offset_response(session, status.HTTP_200_OK)
+
+        # Last chunk: assemble, verify and hand over to the upload pipeline,
+        # a concurrent or retried final PATCH must not hand it over twice
+        if not claim_session(session):
+            return formatted_response(
+                message={"error": "Upload is already being completed"},
+                status=status.HTTP_409_CONFLICT,
+            )
+
+        try:
+            temp_path = assemble_upload(session)
+        except ChecksumMismatch:
+            session.delete()
+            return formatted_response(
+                message={"error": "Checksum mismatch, upload discarded"},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        except Exception as e:
+            # Parts are kept, an empty PATCH at the final offset retries
+            session.is_complete = False
+            session.save(update_fields=["is_complete", "updated_at"])
+            return formatted_response(
+                message={"error": f"Upload failed: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        try:
+            song, job = submit_upload(temp_path, session.filename, self.request.user)
+        except Exception as e:
+            # Parts are kept, an empty PATCH at the final offset retries
+            delete_file(temp_path)
+            session.is_complete = False
+            session.save(update_fields=["is_complete", "updated_at"])
+            return formatted_response(
+                message={"error": f"Upload failed: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        delete_session_parts(session)
+
+        return upload_response(self.request, song, job)
+
+    def delete(self, *args, **kwargs):
+        session = self.get_session()
+
+        delete_session_parts(session)
+        session.delete()
+
+        return formatted_response(
+            message="Upload cancelled",
+            status=status.HTTP_200_OK,
+        )
+
+
+class SongDirectUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class DirectUploadPostSerializer(serializers.Serializer):
+        filename = serializers.CharField(required=True, allow_blank=False)
+        size = serializers.IntegerField(
+            required=True, min_value=1, max_value=settings.DIRECT_UPLOAD_MAX_SIZE
+        )
+        content_type = serializers.CharField(required=False, allow_blank=True)
+
+    class DirectUploadDeleteSerializer(serializers.Serializer):
+        key = serializers.CharField(required=True, allow_blank=False)
+        upload_id = serializers.CharField(required=True, allow_blank=False)
+
+    def post(self, *args, **kwargs):
+        if settings.STORAGE_BACKEND != "s3":
+            return formatted_response(
+                message={"error": "Direct uploads require S3 storage"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        post_serializer = self.DirectUploadPostSerializer(data=self.request.data)
+        post_serializer.is_valid(raise_exception=True)
+
+        filename = get_valid_filename(post_serializer.validated_data.get("filename"))
+        size = post_serializer.validated_data.get("size")
+        content_type = post_serializer.validated_data.get("content_type")
+
+        from music.services.s3_service import (
+            create_multipart_upload,
+            generate_presigned_part_urls,
+        )
+
+        # Keys live under a per-user prefix so completion can check ownership
+        ext = os.path.splitext(filename)[1]
+        key = f"{direct_upload_prefix(self.request.user)}{uuid.uuid4().hex}{ext}"
+
+        part_size = settings.DIRECT_UPLOAD_PART_SIZE
+        part_count = max(math.ceil(size / part_size), 1)
+
+        upload_id = create_multipart_upload(key, content_type)
+
+        return formatted_response(
+            data={
+                "key": key,
+                "upload_id": upload_id,
+                "filename": filename,
+                "part_size": part_size,
+                "part_urls": generate_presigned_part_urls(key, upload_id, part_count),
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+    def delete(self, *args, **kwargs):
+        delete_serializer = self.DirectUploadDeleteSerializer(data=self.request.data)
+        delete_serializer.is_valid(raise_exception=True)
+
+        key = delete_serializer.validated_data.get("key")
+        upload_id = delete_serializer.validated_data.get("upload_id")
+
+        if not key.startswith(direct_upload_prefix(self.request.user)):
+            return formatted_response(
+                message={"error": "Upload not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        from music.services.s3_service import abort_multipart_upload
+
+        abort_multipart_upload(key, upload_id)
+
+        return formatted_response(
+            message="Upload aborted",
+            status=status.HTTP_200_OK,
+        )
+
+
+class SongDirectUploadCompleteView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class UploadedPartSerializer(serializers.Serializer):
+        part_number = serializers.IntegerField(required=True, min_value=1)
+        etag = serializers.CharField(required=True, allow_blank=False)
+
+    class DirectUploadCompleteSerializer(serializers.Serializer):
+        key = serializers.CharField(required=True, allow_blank=False)
+        upload_id = serializers.CharField(required=True, allow_blank=False)
+        filename = serializers.CharField(required=True, allow_blank=False)
+
+    def post(self, *args, **kwargs):
+        if settings.STORAGE_BACKEND != "s3":
+            return formatted_response(
+                message={"error": "Direct uploads require S3 storage"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        complete_serializer = self.DirectUploadCompleteSerializer(
+            data=self.request.data
+        )
+        complete_serializer.is_valid(raise_exception=True)
+
+        parts_serializer = self.UploadedPartSerializer(
+            data=self.request.data.get("parts"), many=True, allow_empty=False
+        )
+        parts_serializer.is_valid(raise_exception=True)
+
+        key = complete_serializer.validated_data.get("key")
+        upload_id = complete_serializer.validated_data.get("upload_id")
+        filename = complete_serializer.validated_data.get("filename")
+
+        if not key.startswith(direct_upload_prefix(self.request.user)):
+            return formatted_response(
+                message={"error": "Upload not found"},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        from music.services.s3_service import (
+            INVALID_MULTIPART_ERRORS,
+            UNRECOVERABLE_MULTIPART_ERRORS,
+            abort_multipart_upload,
+            complete_multipart_upload,
+        )
+
+        try:
+            complete_multipart_upload(key, upload_id, parts_serializer.validated_data)
+        except ClientError as e:
+            error_code = e.response.get("Error", {}).get("Code")
+
+            # Uploaded parts stay (billed) in the bucket until aborted. Other
+            # failures can be retried, the client aborts with DELETE (or a
+            # bucket lifecycle rule does) when it gives up
+            if error_code in UNRECOVERABLE_MULTIPART_ERRORS:
+                try:
+                    abort_multipart_upload(key, upload_id)
+                except ClientError:
+                    pass
+
+            return formatted_response(
+                message={"error": f"Upload could not be completed: {error_code}"},
+                status=(
+                    status.HTTP_400_BAD_REQUEST
+                    if error_code in INVALID_MULTIPART_ERRORS
+                    else status.HTTP_502_BAD_GATEWAY
+                ),
+            )
+
+        # The size declared at initiation is the client's word, the parts
+        # it uploaded may add up to more (HEAD on the stored object)
+        if default_storage.size(key) > settings.DIRECT_UPLOAD_MAX_SIZE:
+            default_storage.delete(key)
+            return formatted_response(
+                message={"error": "File is larger than the allowed upload size"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        try:
+            song, job = submit_upload(key, filename, self.request.user)
+
+            return upload_response(self.request, song, job)
+        except Exception as e:
+            return formatted_response(
+                message={"error": f"Upload failed: {str(e)}"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+
 class SongStreamView(APIView):
     permission_classes = [IsAuthenticated]
     authentication_classes = [CookieJWTAuthentication]
 
     class StreamQuerySerializer(serializers.Serializer):
         direct = serializers.BooleanField(required=False, allow_null=True)
+        # Highest acceptable bitrate in kbps, picks a transcoded rendition
+        bitrate = serializers.IntegerField(required=False, min_value=1)
+        codec = serializers.ChoiceField(choices=list(CODECS), required=False)
+        mode = serializers.ChoiceField(choices=["file", "hls"], required=False)
 
     class StreamKwargsSerializer(serializers.Serializer):
         song_uuid = serializers.UUIDField(required=True, allow_null=False)
@@ -140,6 +578,9 @@ class SongStreamView(APIView):
         query_serializer = self.StreamQuerySerializer(data=self.request.query_params)
         query_serializer.is_valid(raise_exception=True)
         direct = query_serializer.validated_data.get("direct")
+        bitrate = query_serializer.validated_data.get("bitrate")
+        codec = query_serializer.validated_data.get("codec")
+        mode = query_serializer.validated_data.get("mode")
 
         kwargs_serializer = self.StreamKwargsSerializer(data=self.kwargs)
         kwargs_serializer.is_valid(raise_exception=True)
@@ -153,30 +594,170 @@ class SongStreamView(APIView):
             is_upload_complete=True,
         )
 
+        if mode == "hls":
+            playlist_url, rendition = hls_playlist_url(
+                self.request, song, bitrate, direct
+            )
+            # Not packaged yet (or packaging failed): plain file meanwhile
+            if playlist_url and direct:
+                return HttpResponseRedirect(playlist_url)
+            if playlist_url:
+                song_data = SongModelSerializer(
+                    song, context={"request": self.request}
+                ).data
+                return JsonResponse(
+                    {
+                        "url": playlist_url,
+                        "type": HLS_MIME_TYPE,
+                        "mode": "hls",
+                        "rendition": rendition.name if rendition else None,
+                        "replaygain": replaygain(song),
+                        "song": song_data,
+                    }
+                )
+
         # If 'direct' is present, stream the file content directly
         if direct:
+            # Only explicit parameters here, the JSON response already
+            # resolved client hints into the URL
+            rendition = select_rendition(song, bitrate, codec)
+            path = stored_rendition(song, rendition) if rendition else None
+            if rendition and not path:
+                # Original this time, the rendition is transcoded meanwhile
+                submit_rendition(song, rendition)
+            if path:
+                return stream_file(
+                    request=self.request,
+                    file_path=path,
+                    content_type=rendition.mime_type,
+                    etag=f'"{song.song_uuid.hex}-{rendition.name}"',
+                )
+
             return stream_file(
                 request=self.request,
                 file_path=song.file.name,
                 content_type=song.mime_type,
+                etag=song_etag(song),
             )
 
         # Default to JSON response with metadata to reduce frontend API calls
         song_data = SongModelSerializer(song, context={"request": self.request}).data
 
-        if settings.STORAGE_BACKEND == "s3":
-            from music.services.s3_service import generate_presigned_url
+        # Explicit bitrate, else Save-Data / ECT / Downlink client hints
+        rendition = select_rendition(song, bitrate, codec, self.request.headers)
+        if rendition and not stored_rendition(song, rendition):
+            # Never transcode in the request: serve the original until the
+            # rendition is stored
+            submit_rendition(song, rendition)
+            rendition = None
+
+        # Presigned URL for S3, direct stream URL for local storage
+        stream_url = get_stream_url(self.request, song, rendition)
+        response = JsonResponse(
+            {
+                "url": stream_url,
+                "type": rendition.mime_type if rendition else song.mime_type,
+                "rendition": rendition.name if rendition else None,
+                "replaygain": replaygain(song),
+                "song": song_data,
+            }
+        )
+        response["Accept-CH"] = "Save-Data, ECT, Downlink"
+        patch_vary_headers(response, ("Save-Data", "ECT", "Downlink"))
+        return response
 
-            presigned_url = generate_presigned_url(song.file.name)
-            return JsonResponse(
-                {"url": presigned_url, "type": song.mime_type, "song": song_data}
+
+class SongStreamBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class StreamBatchPostSerializer(serializers.Serializer):
+        song_uuids = serializers.ListField(
+            child=serializers.UUIDField(),
+            allow_empty=False,
+            max_length=settings.STREAM_BATCH_MAX_SONGS,
+        )
+
+    def post(self, *args, **kwargs):
+        post_serializer = self.StreamBatchPostSerializer(data=self.request.data)
+        post_serializer.is_valid(raise_exception=True)
+
+        # Keep the queue order, drop duplicates
+        song_uuids = list(
+            dict.fromkeys(post_serializer.validated_data.get("song_uuids"))
+        )
+
+        # Single query for every requested track
+        song_objs = Song.objects.filter(
+            uploaded_by=self.request.user,
+            song_uuid__in=song_uuids,
+            is_upload_complete=True,
+        ).select_related("artist", "album")
+
+        songs_by_uuid = {song.song_uuid: song for song in song_objs}
+        songs = [songs_by_uuid[uuid] for uuid in song_uuids if uuid in songs_by_uuid]
+
+        songs_data = SongModelSerializer(
+            songs, many=True, context={"request": self.request}
+        ).data
+
+        streams = [
+            {
+                "url": get_stream_url(self.request, song),
+                "type": song.mime_type,
+                "replaygain": replaygain(song),
+                "song": song_data,
+            }
+            for song, song_data in zip(songs, songs_data)
+        ]
+
+        return formatted_response(
+            data={
+                "streams": streams,
+                "missing": [uuid for uuid in song_uuids if uuid not in songs_by_uuid],
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class SongWaveformView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class WaveformKwargsSerializer(serializers.Serializer):
+        song_uuid = serializers.UUIDField(required=True, allow_null=False)
+
+    def get(self, *args, **kwargs):
+        kwargs_serializer = self.WaveformKwargsSerializer(data=self.kwargs)
+        kwargs_serializer.is_valid(raise_exception=True)
+
+        song = get_object_or_404(
+            Song,
+            uploaded_by=self.request.user,
+            song_uuid=kwargs_serializer.validated_data.get("song_uuid"),
+            is_upload_complete=True,
+        )
+
+        path = waveform_path(song.file.name)
+        if not default_storage.exists(path):
+            return formatted_response(
+                message={"error": "Waveform not available"},
+                status=status.HTTP_404_NOT_FOUND,
             )
+
+        # Peaks never change for stored audio, the client may keep them forever
+        etag = f'"{song.song_uuid.hex}-peaks"'
+        if etag_matches(self.request.headers.get("If-None-Match"), etag):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
         else:
-            # For local storage, provide the direct stream URL
-            direct_url = self.request.build_absolute_uri() + "?direct=1"
-            return JsonResponse(
-                {"url": direct_url, "type": song.mime_type, "song": song_data}
-            )
+            with default_storage.open(path, "rb") as file:
+                response = HttpResponse(
+                    file.read(), content_type="application/octet-stream"
+                )
+
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, max-age=31536000, immutable"
+        return response
 
 
 class PlaylistView(APIView):
@@ -361,7 +942,6 @@ class PlaylistSongView(APIView):
             Playlist, owner=user_obj, playlist_uuid=playlist_uuid
         )
 
-        # Order by creation date to ensure consistent pagination
         playlistsong_objs = PlaylistSong.objects.filter(playlist=playlist)
 
         if search_query:
@@ -369,13 +949,13 @@ class PlaylistSongView(APIView):
                 song__title__icontains=search_query
             )
 
-        playlistsong_objs = playlistsong_objs.order_by("added_at")
-
         return paginated_response(
-            queryset=playlistsong_objs,
+            queryset=PlaylistSongModelSerializer.prepare_queryset(playlistsong_objs),
             request=self.request,
             serializer_class=PlaylistSongModelSerializer,
             context={"request": self.request},
+            # Order by creation date to ensure consistent pagination
+            ordering=["added_at", "id"],
         )
 
     def post(self, *args, **kwargs):
@@ -483,7 +1063,7 @@ class ArtistView(APIView):
                 status=status.HTTP_200_OK,
             )
 
-        artist_objs = Artist.objects.filter(created_by=user_obj).order_by("name")
+        artist_objs = Artist.objects.filter(created_by=user_obj)
 
         if search_query:
             artist_objs = artist_objs.filter(name__icontains=search_query)
@@ -493,6 +1073,7 @@ class ArtistView(APIView):
             request=self.request,
             serializer_class=ArtistModelSerializer,
             context={"request": self.request},
+            ordering=["name", "id"],
         )
 
 
@@ -531,7 +1112,7 @@ class AlbumView(APIView):
                 status=status.HTTP_200_OK,
             )
 
-        album_objs = Album.objects.filter(created_by=user_obj).order_by("-created_at")
+        album_objs = Album.objects.filter(created_by=user_obj)
 
         if search_query:
             album_objs = album_objs.filter(title__icontains=search_query)
@@ -541,6 +1122,7 @@ class AlbumView(APIView):
             request=self.request,
             serializer_class=AlbumModelSerializer,
             context={"request": self.request},
+            ordering=["-created_at", "-id"],
         )
 
     def delete(self, *args, **kwargs):
@@ -569,7 +1151,13 @@ class PlaybackQueueView(APIView):
         playlist_uuid = serializers.UUIDField(required=False, allow_null=False)
         q = serializers.CharField(required=False, allow_blank=False)
         shuffle = serializers.BooleanField(required=False, default=False)
+        smart = serializers.BooleanField(required=False, default=False)
+        seed = serializers.IntegerField(required=False, min_value=0, max_value=MAX_SEED)
         start_song_uuid = serializers.UUIDField(required=False, allow_null=False)
+        offset = serializers.IntegerField(required=False, default=0, min_value=0)
+        limit = serializers.IntegerField(
+            required=False, min_value=1, max_value=QUEUE_PAGE_MAX_SIZE
+        )
 
     def get(self, *args, **kwargs):
         user_obj = self.request.user
@@ -582,6 +1170,10 @@ class PlaybackQueueView(APIView):
         search_query = query_serializer.validated_data.get("q")
         shuffle = query_serializer.validated_data.get("shuffle")
         start_song_uuid = query_serializer.validated_data.get("start_song_uuid")
+        smart = query_serializer.validated_data.get("smart")
+        seed = query_serializer.validated_data.get("seed")
+        offset = query_serializer.validated_data.get("offset")
+        limit = query_serializer.validated_data.get("limit")
 
         # Base queryset for songs uploaded by the user
         song_objs = Song.objects.filter(
@@ -611,23 +1203,122 @@ class PlaybackQueueView(APIView):
             song_objs = song_objs.filter(title__icontains=search_query)
 
         if shuffle:
-            if start_song_uuid:
-                # Get the specific song first
-                first_song = song_objs.filter(song_uuid=start_song_uuid)
-                # Get other songs shuffled
-                other_songs = song_objs.exclude(song_uuid=start_song_uuid).order_by("?")
-
-                queue_uuids = list(
-                    first_song.values_list("song_uuid", flat=True)
-                ) + list(other_songs.values_list("song_uuid", flat=True))
-            else:
-                song_objs = song_objs.order_by("?")
-                queue_uuids = list(song_objs.values_list("song_uuid", flat=True))
+            # One query for the ids in a stable order, shuffled here with the
+            # seed: the same seed gives the same queue, so it can be paged
+            if seed is None:
+                seed = new_seed()
+            songs = song_objs.order_by("id").values_list("song_uuid", "artist_id")
+            queue_uuids = shuffle_queue(songs, seed, smart=smart, first=start_song_uuid)
         else:
+            seed = None
             queue_uuids = list(song_objs.values_list("song_uuid", flat=True))
 
+        total = len(queue_uuids)
+        if limit is not None:
+            queue_uuids = queue_uuids[offset : offset + limit]
+            next_offset = offset + limit if offset + limit < total else None
+        else:
+            queue_uuids = queue_uuids[offset:]
+            next_offset = None
+
+        return formatted_response(
+            data={
+                "queue": queue_uuids,
+                "seed": seed,
+                "total": total,
+                "next_offset": next_offset,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class SearchView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class SearchQuerySerializer(serializers.Serializer):
+        q = serializers.CharField(required=True, allow_blank=False, max_length=255)
+        limit = serializers.IntegerField(
+            required=False, default=10, min_value=1, max_value=50
+        )
+
+    def get(self, *args, **kwargs):
+        query_serializer = self.SearchQuerySerializer(data=self.request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+
+        results = search_library(
+            self.request.user,
+            query_serializer.validated_data.get("q").strip(),
+            query_serializer.validated_data.get("limit"),
+        )
+        context = {"request": self.request}
+
         return formatted_response(
-            data={"queue": queue_uuids},
+            data={
+                "songs": SongModelSerializer(
+                    results["songs"], many=True, context=context
+                ).data,
+                "artists": ArtistModelSerializer(
+                    results["artists"], many=True, context=context
+                ).data,
+                "albums": AlbumModelSerializer(
+                    results["albums"], many=True, context=context
+                ).data,
+                "playlists": PlaylistModelSerializer(
+                    results["playlists"], many=True, context=context
+                ).data,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class SearchSuggestView(APIView):
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CookieJWTAuthentication]
+
+    class SuggestQuerySerializer(serializers.Serializer):
+        q = serializers.CharField(required=True, allow_blank=False, max_length=255)
+        limit = serializers.IntegerField(
+            required=False, default=10, min_value=1, max_value=50
+        )
+
+    def get(self, *args, **kwargs):
+        query_serializer = self.SuggestQuerySerializer(data=self.request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+
+        query = query_serializer.validated_data.get("q").strip()
+        limit = query_serializer.validated_data.get("limit")
+
+        if settings.SEARCH_INDEX_ENABLED:
+            suggestions = suggest(self.request.user.id, query, limit)
+        else:
+            # Same shape from the database search
+            results = search_library(self.request.user, query, limit)
+            suggestions = [
+                {
+                    "type": "song",
+                    "uuid": str(song.song_uuid),
+                    "name": song.title,
+                    "artist_name": song.artist.name,
+                }
+                for song in results["songs"]
+            ]
+            suggestions += [
+                {"type": "artist", "uuid": str(artist.artist_uuid), "name": artist.name}
+                for artist in results["artists"]
+            ]
+            suggestions += [
+                {
+                    "type": "album",
+                    "uuid": str(album.album_uuid),
+                    "name": album.title,
+                    "artist_name": album.artist.name,
+                }
+                for album in results["albums"]
+            ]
+
+        return formatted_response(
+            data={"suggestions": suggestions[:limit]},
             status=status.HTTP_200_OK,
         )
 
@@ -687,10 +1378,11 @@ class SharedSongsView(APIView):
             )
 
         return paginated_response(
-            queryset=shared_song_objs,
+            queryset=SharedSongModelSerializer.prepare_queryset(shared_song_objs),
             request=self.request,
             serializer_class=SharedSongModelSerializer,
             context={"request": self.request},
+            ordering=["-shared_at", "-id"],
         )
 
     def post(self, *args, **kwargs):
@@ -797,6 +1489,8 @@ class SharedSongStreamView(APIView):
 
     class SharedSongStreamQuerySerializer(serializers.Serializer):
         direct = serializers.BooleanField(required=False, allow_null=True)
+        bitrate = serializers.IntegerField(required=False, min_value=1)
+        mode = serializers.ChoiceField(choices=["file", "hls"], required=False)
 
     class SharedSongStreamKwargsSerializer(serializers.Serializer):
         shared_uuid = serializers.UUIDField(required=True, allow_null=False)
@@ -807,6 +1501,8 @@ class SharedSongStreamView(APIView):
         )
         query_serializer.is_valid(raise_exception=True)
         direct = query_serializer.validated_data.get("direct")
+        bitrate = query_serializer.validated_data.get("bitrate")
+        mode = query_serializer.validated_data.get("mode")
 
         serializer = self.SharedSongStreamKwargsSerializer(data=self.kwargs)
         serializer.is_valid(raise_exception=True)
@@ -823,12 +1519,35 @@ class SharedSongStreamView(APIView):
 
         song_obj = shared_song.song
 
+        if mode == "hls":
+            playlist_url, rendition = hls_playlist_url(
+                self.request, song_obj, bitrate, direct
+            )
+            # Not packaged yet (or packaging failed): plain file meanwhile
+            if playlist_url and direct:
+                return HttpResponseRedirect(playlist_url)
+            if playlist_url:
+                shared_song_data = SharedSongModelSerializer(
+                    shared_song, context={"request": self.request}
+                ).data
+                return JsonResponse(
+                    {
+                        "url": playlist_url,
+                        "type": HLS_MIME_TYPE,
+                        "mode": "hls",
+                        "rendition": rendition.name if rendition else None,
+                        "replaygain": replaygain(song_obj),
+                        "shared_song": shared_song_data,
+                    }
+                )
+
         # If 'direct' is present, stream the file content directly
         if direct:
             return stream_file(
                 request=self.request,
                 file_path=song_obj.file.name,
                 content_type=song_obj.mime_type,
+                etag=song_etag(song_obj),
             )
 
         # Default to JSON response with metadata to reduce frontend API calls
@@ -837,13 +1556,14 @@ class SharedSongStreamView(APIView):
         ).data
 
         if settings.STORAGE_BACKEND == "s3":
-            from music.services.s3_service import generate_presigned_url
+            from music.services.s3_service import get_presigned_url
 
-            presigned_url = generate_presigned_url(song_obj.file.name)
+            presigned_url = get_presigned_url(song_obj.file.name)
             return JsonResponse(
                 {
                     "url": presigned_url,
                     "type": song_obj.mime_type,
+                    "replaygain": replaygain(song_obj),
                     "shared_song": shared_song_data,
                 }
             )
@@ -854,6 +1574,7 @@ class SharedSongStreamView(APIView):
                 {
                     "url": direct_url,
                     "type": song_obj.mime_type,
+                    "replaygain": replaygain(song_obj),
                     "shared_song": shared_song_data,
                 }
             )
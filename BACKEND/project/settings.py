@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import tempfile
 from datetime import timedelta
 from pathlib import Path
 
@@ -61,6 +62,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "rest_framework_simplejwt",
     "corsheaders",
@@ -116,6 +118,11 @@ TEMPLATES = [
 WSGI_APPLICATION = "project.wsgi.application"
 ASGI_APPLICATION = "project.asgi.application"
 
+# Server interface used by `entrypoint.sh`
+# "wsgi": gunicorn sync workers (each stream holds a worker)
+# "asgi": uvicorn workers, local streams are served by async iterators
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi").lower()
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -123,7 +130,9 @@ ASGI_APPLICATION = "project.asgi.application"
 DATABASES = {
     "default": dj_database_url.config(
         default=os.getenv("DATABASE_URL"),
-        conn_max_age=600,
+        # Persistent connections are per thread, ASGI runs sync code in
+        # per-request threads so they would never be reused there
+        conn_max_age=0 if SERVER_MODE == "asgi" else 600,
         conn_health_checks=True,
     )
 }
@@ -248,6 +257,11 @@ elif STORAGE_BACKEND == "s3":
     # For MinIO, we need to use path-style addressing
     AWS_S3_ADDRESSING_STYLE = "path"
 
+    # Shared boto3 clients (see `utils.storage.get_s3_client`)
+    # Pool size should cover the number of threads presigning / uploading at once
+    AWS_S3_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_S3_MAX_POOL_CONNECTIONS", 50))
+    AWS_S3_MAX_ATTEMPTS = int(os.getenv("AWS_S3_MAX_ATTEMPTS", 3))
+
     STORAGES = {
         "default": {
             "BACKEND": "utils.storage.PublicS3Boto3Storage",
@@ -261,14 +275,109 @@ elif STORAGE_BACKEND == "s3":
 # Streaming chunk size
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 8192))
 
+# Max number of songs resolved by one `song/stream/batch/` request
+STREAM_BATCH_MAX_SONGS = int(os.getenv("STREAM_BATCH_MAX_SONGS", 20))
+
+# Local streaming delivery mode (only used when STORAGE_BACKEND is "local")
+# "python": Django streams the file itself in CHUNK_SIZE reads
+# "sendfile": FileResponse, lets the WSGI server transfer bytes with os.sendfile
+# "x-accel": Django only authorizes, nginx serves the bytes via X-Accel-Redirect
+STREAMING_DELIVERY_MODE = os.getenv("STREAMING_DELIVERY_MODE", "python").lower()
+
+# nginx `internal` location that maps to MEDIA_ROOT (used by "x-accel" mode)
+X_ACCEL_REDIRECT_PREFIX = os.getenv("X_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+
 
 # S3 Presigned URL expiration time in seconds
 S3_PRESIGNED_URL_EXPIRATION = int(os.getenv("S3_PRESIGNED_URL_EXPIRATION", 3600))
 
+# Fraction of the expiration during which a cached presigned URL is reused
+# (0 disables caching, capped at 0.9). 0.5 → a returned URL is always valid for
+# >= 30 minutes
+S3_PRESIGNED_URL_REUSE_FRACTION = float(
+    os.getenv("S3_PRESIGNED_URL_REUSE_FRACTION", 0.5)
+)
+
+# Adaptive bitrate renditions (transcoded copies served instead of the original)
+# "lazy": transcoded on first request, then reused
+# "eager": the whole ladder is transcoded during upload processing
+# "off": the original upload is always served
+RENDITION_MODE = os.getenv("RENDITION_MODE", "lazy").lower()
+RENDITION_BITRATES = tuple(
+    map(int, os.getenv("RENDITION_BITRATES", "64,128,192").split(","))
+)
+# "aac" (plays everywhere) or "opus" (smaller at the same quality)
+RENDITION_DEFAULT_CODEC = os.getenv("RENDITION_DEFAULT_CODEC", "aac").lower()
+# Lock files single-flighting the transcoding of a rendition across workers
+RENDITION_LOCK_DIR = os.getenv(
+    "RENDITION_LOCK_DIR",
+    os.path.join(tempfile.gettempdir(), "sound_node_renditions"),
+)
+
+# HLS delivery (`?mode=hls` on the stream views): target segment length in
+# seconds of the fMP4 segments packaged on first request
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", 6))
+
+# Upload processing
+# "sync": uploads are processed inside the request (201 with the song)
+# "queue": uploads are stored and queued as a ProcessingJob (202 with the job),
+#          processed by `python manage.py process_jobs`
+UPLOAD_PROCESSING_MODE = os.getenv("UPLOAD_PROCESSING_MODE", "sync").lower()
+PROCESSING_JOB_MAX_ATTEMPTS = int(os.getenv("PROCESSING_JOB_MAX_ATTEMPTS", 3))
+# Base retry delay in seconds, doubled after every failed attempt
+PROCESSING_JOB_RETRY_DELAY = int(os.getenv("PROCESSING_JOB_RETRY_DELAY", 30))
+# A running job not finished after this many seconds is considered abandoned
+PROCESSING_JOB_LOCK_TIMEOUT = int(os.getenv("PROCESSING_JOB_LOCK_TIMEOUT", 900))
+
+# Resumable (chunked) uploads
+RESUMABLE_UPLOAD_MAX_SIZE = int(os.getenv("RESUMABLE_UPLOAD_MAX_SIZE", 2 * 1024**3))
+# Largest accepted PATCH body, must stay below nginx `client_max_body_size`
+RESUMABLE_UPLOAD_MAX_CHUNK_SIZE = int(
+    os.getenv("RESUMABLE_UPLOAD_MAX_CHUNK_SIZE", 8 * 1024 * 1024)
+)
+# Seconds without a chunk after which an upload session and its parts are
+# deleted (by `process_jobs`)
+UPLOAD_SESSION_MAX_AGE = int(os.getenv("UPLOAD_SESSION_MAX_AGE", 24 * 3600))
+
+# Direct-to-S3 uploads (browser uploads parts with presigned URLs)
+# S3 requires parts of at least 5 MB (except the last one) and at most 10,000 parts
+DIRECT_UPLOAD_PART_SIZE = max(
+    int(os.getenv("DIRECT_UPLOAD_PART_SIZE", 16 * 1024 * 1024)), 5 * 1024 * 1024
+)
+DIRECT_UPLOAD_MAX_SIZE = int(os.getenv("DIRECT_UPLOAD_MAX_SIZE", 2 * 1024**3))
+
+# Waveform peaks: decode every newly stored song once after upload and
+# store a small min/max peaks sidecar next to it (`songs/<name>.peaks`)
+WAVEFORM_ENABLED = os.getenv("WAVEFORM_ENABLED", "True").lower() == "true"
+
+# Loudness: measure EBU R128 loudness (ffmpeg ebur128) during upload and
+# store it with ReplayGain values on the Song, `analyze_loudness` backfills
+LOUDNESS_ANALYSIS_ENABLED = (
+    os.getenv("LOUDNESS_ANALYSIS_ENABLED", "True").lower() == "true"
+)
+
+# In-memory search index (`/api/search/suggest/`): per-process, per-user
+# trigram index of song, artist and album names kept current by model signals
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "False").lower() == "true"
+# Memory cap of all loaded indexes of a process, cold users are evicted first
+SEARCH_INDEX_MAX_MEMORY_MB = int(os.getenv("SEARCH_INDEX_MAX_MEMORY_MB", 64))
+# Seconds before an index is rebuilt in the background, picks up changes saved
+# by other processes (the old index is served meanwhile)
+SEARCH_INDEX_MAX_AGE = int(os.getenv("SEARCH_INDEX_MAX_AGE", 60))
+
 # Thumbnail settings
 THUMBNAIL_SETTINGS = {
     "FORMAT": os.getenv("THUMBNAIL_FORMAT", "JPEG"),
     "QUALITY": int(os.getenv("THUMBNAIL_QUALITY", "95")),
     "SIZE": tuple(map(int, os.getenv("THUMBNAIL_SIZE", "200,200").split(","))),
     "OPTIMIZE": os.getenv("THUMBNAIL_OPTIMIZE", "True").lower() == "true",
+    # Extra widths and formats rendered next to the primary thumbnail and
+    # exposed as `srcset` maps, AVIF is skipped when Pillow lacks libavif
+    "VARIANT_SIZES": tuple(
+        map(int, os.getenv("THUMBNAIL_VARIANT_SIZES", "64,200,600").split(","))
+    ),
+    "VARIANT_FORMATS": tuple(
+        os.getenv("THUMBNAIL_VARIANT_FORMATS", "WEBP,AVIF,JPEG").upper().split(",")
+    ),
+    "VARIANT_QUALITY": int(os.getenv("THUMBNAIL_VARIANT_QUALITY", "80")),
 }
@@ -1,9 +1,66 @@
 import json
+import threading
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from django.conf import settings
+from django.utils.encoding import filepath_to_uri
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
+# Key prefixes readable without signature (see `ensure_bucket_exists`)
+PUBLIC_PREFIXES = ("thumbnails/", "hls/")
+
+
+def get_s3_client_config():
+    """
+    Shared botocore config: bigger connection pool, TCP keep-alive and
+    standard retries, so clients can be reused across requests and threads.
+    """
+    return Config(
+        max_pool_connections=settings.AWS_S3_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        retries={
+            "max_attempts": settings.AWS_S3_MAX_ATTEMPTS,
+            "mode": "standard",
+        },
+        s3={"addressing_style": settings.AWS_S3_ADDRESSING_STYLE},
+    )
+
+
+def get_s3_client(public=False):
+    """
+    Return the process-wide S3 client for the internal (default) or public
+    endpoint. Clients are created lazily once and are thread-safe.
+    """
+    key = "public" if public else "internal"
+    client = _s3_clients.get(key)
+
+    if client is None:
+        with _s3_clients_lock:
+            client = _s3_clients.get(key)
+
+            if client is None:
+                endpoint_url = settings.AWS_S3_ENDPOINT_URL
+                if public:
+                    # Fall back to internal endpoint if no public one is set
+                    endpoint_url = settings.AWS_S3_PUBLIC_ENDPOINT_URL or endpoint_url
+
+                client = boto3.session.Session().client(
+                    "s3",
+                    endpoint_url=endpoint_url,
+                    aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                    aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                    region_name=settings.AWS_S3_REGION_NAME,
+                    config=get_s3_client_config(),
+                )
+                _s3_clients[key] = client
+
+    return client
 
 
 class PublicS3Boto3Storage(S3Boto3Storage):
@@ -11,14 +68,52 @@ class PublicS3Boto3Storage(S3Boto3Storage):
     S3 storage backend that rewrites internal MinIO URLs to public ones.
     """
 
-    def url(self, name, parameters=None, expire=None, http_method=None):
-        url = super().url(name, parameters, expire, http_method)
+    _public_base_url = None
+
+    def get_default_settings(self):
+        # Per-thread connections of the storage use the same tuned config
+        default_settings = super().get_default_settings()
+        default_settings["client_config"] = get_s3_client_config()
+        return default_settings
+
+    def get_object_parameters(self, name):
+        params = super().get_object_parameters(name)
 
-        # Remove signed query parameters for thumbnails as they are public
-        if name.startswith("thumbnails/"):
-            if "?" in url:
-                url = url.split("?")[0]
+        # HLS packages are content-addressed and never change
+        if name.startswith("hls/"):
+            params.setdefault("CacheControl", "public, max-age=31536000, immutable")
 
+        return params
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        # Thumbnails and HLS packages are public, stable URLs keep them
+        # cacheable by CDNs
+        if name.startswith(PUBLIC_PREFIXES) and not parameters:
+            return self.public_url(name)
+
+        return self._public_endpoint(super().url(name, parameters, expire, http_method))
+
+    def public_url(self, name):
+        """
+        Unsigned URL of a public object. The bucket's base URL is resolved
+        through botocore once, every further URL is a string join: no
+        signing or endpoint resolution per URL, which list pages of songs
+        and albums would otherwise pay for each thumbnail variant.
+        """
+        if self.custom_domain:
+            return super().url(name)
+
+        if self._public_base_url is None:
+            url = self.unsigned_connection.meta.client.generate_presigned_url(
+                "get_object", Params={"Bucket": self.bucket_name, "Key": "_"}
+            )
+            self._public_base_url = self._public_endpoint(url.split("?")[0])[:-1]
+
+        return self._public_base_url + filepath_to_uri(
+            self._normalize_name(clean_name(name))
+        )
+
+    def _public_endpoint(self, url):
         public_endpoint = getattr(settings, "AWS_S3_PUBLIC_ENDPOINT_URL", None)
         internal_endpoint = getattr(settings, "AWS_S3_ENDPOINT_URL", None)
 
@@ -32,13 +127,7 @@ def ensure_bucket_exists(
     bucket_name: str,
     region: str | None = None,
 ):
-    s3 = boto3.client(
-        "s3",
-        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        region_name=settings.AWS_S3_REGION_NAME,
-    )
+    s3 = get_s3_client()
 
     try:
         s3.head_bucket(Bucket=bucket_name)
@@ -73,7 +162,14 @@ def ensure_bucket_exists(
                 "Principal": "*",
                 "Action": ["s3:GetObject"],
                 "Resource": f"arn:aws:s3:::{bucket_name}/thumbnails/*",
-            }
+            },
+            {
+                "Sid": "PublicHlsPackages",
+                "Effect": "Allow",
+                "Principal": "*",
+                "Action": ["s3:GetObject"],
+                "Resource": f"arn:aws:s3:::{bucket_name}/hls/*",
+            },
         ],
     }
 
@@ -82,4 +178,25 @@ def ensure_bucket_exists(
         Policy=json.dumps(policy),
     )
 
-    print("Public policy applied for thumbnails/")
+    print("Public policy applied for thumbnails/ and hls/")
+
+    # Browsers upload parts directly (direct uploads) and must read the ETag
+    try:
+        s3.put_bucket_cors(
+            Bucket=bucket_name,
+            CORSConfiguration={
+                "CORSRules": [
+                    {
+                        "AllowedOrigins": settings.CORS_ALLOWED_ORIGINS or ["*"],
+                        "AllowedMethods": ["GET", "PUT", "HEAD"],
+                        "AllowedHeaders": ["*"],
+                        "ExposeHeaders": ["ETag"],
+                        "MaxAgeSeconds": 3600,
+                    }
+                ]
+            },
+        )
+        print("CORS rules applied for direct uploads")
+    except ClientError as e:
+        # MinIO configures CORS globally (MINIO_API_CORS_ALLOW_ORIGIN)
+        print(f"Bucket CORS not applied: {e.response['Error']['Code']}")